@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+画像デコードのメモリ・時間のベンチマーク
+
+score_image の従来の読み込み（Image.open().convert("RGB") を元解像度で配列化）と、
+image_io.decode_image（draft/reduce による縮小デコード）を比較します。
+tests/assets と src_images/idol_images の画像に加えて、スマートフォン写真を想定して
+それらを 12MP / 48MP に拡大した JPEG も生成して計測します。
+
+ピーク RSS はモードごとに別プロセスで計測します。
+
+使い方:
+    python benchmarks/bench_decode.py [--max_side 1280] [--repeat 5]
+"""
+
+import argparse
+import io
+import multiprocessing as mp
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+
+from image_io import decode_image  # noqa: E402
+
+DEFAULT_DIRS = [ROOT / "tests" / "assets", ROOT / "src_images" / "idol_images"]
+
+
+def load_corpus(dirs, synthetic_mp):
+    """(名前, JPEG バイト列) のリスト"""
+    corpus = []
+    for d in dirs:
+        for p in sorted(d.glob("*")):
+            if p.suffix.lower() in (".jpg", ".jpeg", ".png"):
+                corpus.append((p.name, p.read_bytes()))
+
+    if corpus and synthetic_mp:
+        base = Image.open(io.BytesIO(corpus[0][1])).convert("RGB")
+        for mp_size in synthetic_mp:
+            ratio = (mp_size * 1e6 / (base.width * base.height)) ** 0.5
+            size = (int(base.width * ratio), int(base.height * ratio))
+            buf = io.BytesIO()
+            base.resize(size).save(buf, "JPEG", quality=90)
+            corpus.append((f"synthetic_{mp_size}MP.jpg", buf.getvalue()))
+    return corpus
+
+
+def decode_baseline(data, max_side):
+    return np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+
+
+def decode_scaled(data, max_side):
+    return decode_image(data, max_side=max_side).array
+
+
+MODES = {"baseline": decode_baseline, "draft": decode_scaled}
+
+
+def _measure(mode, data, max_side, repeat, queue):
+    """別プロセスで実行: (中央値[秒], 配列サイズ, 形状, ピーク RSS[MB])"""
+    fn = MODES[mode]
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        arr = fn(data, max_side)
+        times.append(time.perf_counter() - t0)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((statistics.median(times), arr.nbytes, arr.shape, peak_mb))
+
+
+def measure(mode, data, max_side, repeat):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(mode, data, max_side, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='画像デコードのメモリ・時間のベンチマーク')
+    parser.add_argument('--max_side', type=int, default=1280,
+                        help='縮小デコードの長辺の目安 (デフォルト: 1280)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='1画像あたりの繰り返し回数 (デフォルト: 5)')
+    parser.add_argument('--synthetic_mp', type=int, nargs='*', default=[12, 48],
+                        help='生成する拡大画像の画素数[MP] (デフォルト: 12 48)')
+    parser.add_argument('--dirs', type=Path, nargs='*', default=DEFAULT_DIRS,
+                        help='計測する画像のディレクトリ')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.dirs, args.synthetic_mp)
+    if not corpus:
+        print("エラー: 画像が見つかりません")
+        sys.exit(1)
+
+    header = f"{'image':<36} {'mode':<9} {'shape':>16} {'array MB':>9} {'peak RSS MB':>12} {'ms':>8}"
+    print(header)
+    print("-" * len(header))
+    totals = {mode: [] for mode in MODES}
+    for name, data in corpus:
+        for mode in MODES:
+            sec, nbytes, shape, peak_mb = measure(mode, data, args.max_side, args.repeat)
+            totals[mode].append(sec)
+            print(f"{name[:36]:<36} {mode:<9} {str(shape):>16} "
+                  f"{nbytes / 2**20:>9.1f} {peak_mb:>12.1f} {sec * 1000:>8.1f}")
+
+    print()
+    for mode, secs in totals.items():
+        print(f"{mode:<9} 合計 {sum(secs) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+検出サイズのポリシーごとの検出時間と顔の再現率の比較
+
+tests/assets と src_images の画像を score_image と同じ縮小デコード（長辺 1280 目安）で読み、
+fixed:320 / fixed:480 / fixed:640 / adaptive / tiled などのポリシーで検出して、
+
+    - 1 枚あたりの検出時間（中央値）と、検出を実行した回数（タイルの数を含む）の内訳
+    - 再現率: --ref_size（既定 1280）で検出した顔のうち、IoU 0.4 以上で見つかった割合
+
+を画像ごとと合計で表示します。--ref_tiles を付けると、正解も --ref_size のタイルに分けて
+検出します（大人数の集合写真では 1 回の検出だと正解自体が後ろの列を取りこぼすため）。
+buffalo_l のモデル（tools/vendor_models.py で配置、または ~/.insightface/models）が必要です。
+
+使い方:
+    python benchmarks/bench_detection_policy.py [--policies fixed:640 adaptive] [--repeat 3]
+    python benchmarks/bench_detection_policy.py tests/assets/test_image_3.jpg \
+        --policies fixed:640 fixed:960 tiled:640,640 --ref_tiles --max_side 0
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+
+from detection_policy import DetectionPolicy  # noqa: E402
+from face_pipeline import detect_faces  # noqa: E402
+from image_io import decode_image  # noqa: E402
+from model_bundle import local_root  # noqa: E402
+from model_manager import FaceModel  # noqa: E402
+
+DEFAULT_POLICIES = ["fixed:320", "fixed:480", "fixed:640", "adaptive:320,640,960",
+                    "adaptive:320,480,960", "tiled:640,640"]
+IMAGE_DIRS = [ROOT / "tests" / "assets", ROOT / "src_images"]
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+def _iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda b: (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])  # noqa: E731
+    return inter / (area(box) + area(boxes) - inter)
+
+
+def matched(ref_faces, faces, threshold=0.4):
+    """ref_faces のうち faces に IoU threshold 以上の顔がある数"""
+    if not ref_faces or not faces:
+        return 0
+    boxes = np.stack([f.bbox for f in faces])
+    return sum(_iou(f.bbox, boxes).max() >= threshold for f in ref_faces)
+
+
+def describe(tried):
+    """検出したサイズのリストを短く表示する（tiled のタイルは "640x12" のようにまとめる）"""
+    if len(tried) <= 3:
+        return str(tried)
+    return f"[{tried[0]}, {tried[1]}x{len(tried) - 1}]"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='検出サイズのポリシーの検出時間と再現率')
+    parser.add_argument('images', nargs='*', type=Path,
+                        help='画像またはディレクトリ（既定は tests/assets と src_images）')
+    parser.add_argument('--policies', nargs='+', default=DEFAULT_POLICIES,
+                        help='比較するポリシー（fixed:640 / adaptive:320,640,960 など）')
+    parser.add_argument('--ref_size', type=int, default=1280, help='正解とみなす検出サイズ')
+    parser.add_argument('--ref_tiles', action='store_true',
+                        help='正解も --ref_size のタイルに分けて検出する（大きな集合写真用）')
+    parser.add_argument('--max_side', type=int, default=1280,
+                        help='縮小デコードの長辺の目安（0 なら元解像度）')
+    parser.add_argument('--repeat', type=int, default=3, help='画像ごとの計測回数')
+    args = parser.parse_args()
+
+    paths = []
+    for item in args.images or IMAGE_DIRS:
+        if item.is_dir():
+            paths.extend(p for p in sorted(item.rglob("*")) if p.suffix.lower() in IMAGE_EXTS)
+        elif item.exists():
+            paths.append(item)
+    if not paths:
+        print("エラー: 画像が見つかりません")
+        sys.exit(1)
+
+    policies = [DetectionPolicy.parse(spec) for spec in args.policies]
+    sizes = sorted({s for p in policies for s in p.sizes} | {args.ref_size})
+    app = FaceModel(det_size=(640, 640), root=local_root(), warmup_det_sizes=sizes).get()
+
+    def detect_fn(img, size):
+        return detect_faces(app, img, det_size=size)
+
+    images = [(path, decode_image(str(path), max_side=args.max_side or None).array)
+              for path in paths]
+    if args.ref_tiles:
+        # 顔の数や大きさに関係なく、常にタイルにも分けて検出する
+        ref_policy = DetectionPolicy("tiled", (args.ref_size, args.ref_size), tile_min_faces=1,
+                                     tile_face_px=float("inf"), tile_min_gain=0)
+        refs = [ref_policy.detect(detect_fn, img)[0] for _, img in images]
+    else:
+        refs = [detect_fn(img, args.ref_size) for _, img in images]
+    print(f"画像 {len(images)} 枚 / 正解（det_size={args.ref_size}"
+          f"{'、タイル' if args.ref_tiles else ''}）の顔 {sum(map(len, refs))} 個\n")
+
+    header = f"{'policy':<22} {'ms/image':>9} {'passes':>7} {'faces':>6} {'recall':>7}"
+    print(header)
+    print("-" * len(header))
+    per_image = {}
+    for policy in policies:
+        total_ms, total_passes, total_found, total_hit = 0.0, 0, 0, 0
+        for (path, img), ref_faces in zip(images, refs):
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                faces, tried = policy.detect(detect_fn, img)
+                times.append((time.perf_counter() - t0) * 1000)
+            ms = statistics.median(times)
+            hit = matched(ref_faces, faces)
+            total_ms += ms
+            total_passes += len(tried)
+            total_found += len(faces)
+            total_hit += hit
+            per_image.setdefault(path.name, []).append((policy.spec, ms, tried, len(faces), hit))
+        n_ref = sum(map(len, refs))
+        print(f"{policy.spec:<22} {total_ms / len(images):>9.1f} "
+              f"{total_passes / len(images):>7.2f} {total_found:>6} "
+              f"{(total_hit / n_ref if n_ref else 1.0):>7.3f}")
+
+    print("\n画像ごと（ms / 検出サイズ / 顔の数 / 正解と一致した数）")
+    for (path, img), ref_faces in zip(images, refs):
+        print(f"  {path.name} {img.shape[1]}x{img.shape[0]} 正解 {len(ref_faces)} 個")
+        for spec, ms, tried, n_faces, hit in per_image[path.name]:
+            print(f"    {spec:<22} {ms:>8.1f} ms  {describe(tried):<16} {n_faces:>3} / {hit:>3}")
+
+
+if __name__ == "__main__":
+    main()
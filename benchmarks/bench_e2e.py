@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+score_image のエンドツーエンドのベンチマーク（ローカル、GCP はフェイク）
+
+load_test.py と同じく test_event.json 形式のイベントを score_object に流し込み、
+tracing.Tracer のスパンから 1 枚あたりの
+
+    - レイテンシ（p50 / p95 / p99）
+    - 段ごとの時間（download / decode / queue / detect / embed / score / write ...の p50 / p95）
+    - faces/sec、photos/sec、ピーク RSS
+
+を集計します。コーパスは tests/assets と src_images に、それらを並べて作った
+多人数のコラージュ（--collages 枚）を加えたものです。
+
+結果は --history の JSON（リスト）に追記し、--baseline があれば比較して、どこかの指標が
+--tolerance を超えて悪化していれば終了コード 1 で終わります（披露宴の前の確認用）。
+--save_baseline で今回の結果をベースラインとして保存します。
+
+既定では内容キャッシュを使わずに毎回推論します（--use_cache で score_image と同じく
+md5Hash でキャッシュを引く）。--fake_inference_ms を指定するとモデルもフェイクにします。
+
+使い方:
+    python benchmarks/bench_e2e.py --events 60 --concurrency 4 --save_baseline
+    python benchmarks/bench_e2e.py --events 60 --concurrency 4     # ベースラインと比較
+"""
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from fakes import (FakeFaceApp, FakeFaceModel, FakeFirestoreClient,  # noqa: E402
+                   FakeStorageClient, transactional)
+from load_test import DEFAULT_CORPUS, DEFAULT_TEMPLATE, build_events, load_corpus, percentile  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+# 比較する指標と、大きいほど悪いか（True）小さいほど悪いか（False）
+HIGHER_IS_WORSE = {"latency_ms": True, "stages_ms": True, "peak_rss_mb": True,
+                   "faces_per_sec": False, "photos_per_sec": False}
+MIN_DELTA = {"latency_ms": 2.0, "stages_ms": 1.0, "peak_rss_mb": 20.0,
+             "faces_per_sec": 0.0, "photos_per_sec": 0.0}   # これ未満の差はノイズとみなす
+
+
+def make_collages(corpus, out_dir, count, grid=3, tile=480, seed=0):
+    """コーパスの画像を grid x grid に並べた多人数のコラージュを count 枚作る"""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        canvas = Image.new("RGB", (tile * grid, tile * grid), (255, 255, 255))
+        for j, k in enumerate(rng.choice(len(corpus), size=grid * grid)):
+            with Image.open(corpus[k]) as im:
+                im = ImageOps.exif_transpose(im).convert("RGB")
+                im.thumbnail((tile, tile))
+                canvas.paste(im, ((j % grid) * tile, (j // grid) * tile))
+        path = Path(out_dir) / f"collage_{i:02d}.jpg"
+        canvas.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def summarize(traces, latencies_ms, elapsed, rejected):
+    """Trace のリストと 1 件ごとのレイテンシから結果の辞書を作る"""
+    stages = {}
+    for trace in traces:
+        for stage, ms in trace.durations.items():
+            stages.setdefault(stage, []).append(ms)
+    faces = sum(t.counters.get("faceCount", 0) for t in traces)
+    result = {
+        "events": len(latencies_ms),
+        "rejected": rejected,
+        "elapsed_s": round(elapsed, 3),
+        "photos_per_sec": round(len(latencies_ms) / elapsed, 3) if elapsed else 0.0,
+        "faces_per_sec": round(faces / elapsed, 3) if elapsed else 0.0,
+        "faces": faces,
+        "download_mb": round(sum(t.counters.get("downloadBytes", 0) for t in traces) / 2**20, 1),
+        "cold_starts": sum(t.invocation == "cold" for t in traces),
+        "latency_ms": {},
+        "stages_ms": {},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if latencies_ms:
+        result["latency_ms"] = {f"p{p}": round(percentile(latencies_ms, p), 1)
+                                for p in (50, 95, 99)}
+        result["latency_ms"]["mean"] = round(statistics.mean(latencies_ms), 1)
+    for stage, values in sorted(stages.items()):
+        result["stages_ms"][stage] = {"p50": round(percentile(values, 50), 2),
+                                      "p95": round(percentile(values, 95), 2)}
+    return result
+
+
+def _flatten(result):
+    """{(指標, キー): 値}（latency_ms.p95 / stages_ms.detect.p50 / peak_rss_mb など）"""
+    flat = {}
+    for metric in HIGHER_IS_WORSE:
+        value = result.get(metric)
+        if isinstance(value, dict):
+            for key, v in value.items():
+                if isinstance(v, dict):
+                    flat.update({(metric, f"{key}.{k}"): x for k, x in v.items()})
+                else:
+                    flat[(metric, key)] = v
+        elif value is not None:
+            flat[(metric, "")] = value
+    return flat
+
+
+def compare(result, baseline, tolerance):
+    """ベースラインより tolerance（割合）を超えて悪化した指標のリストを返す
+
+    Returns:
+        [(名前, ベースライン, 今回, 変化率)]。両方にある指標だけを比べる
+    """
+    current, base = _flatten(result), _flatten(baseline)
+    regressions = []
+    for (metric, key), value in current.items():
+        ref = base.get((metric, key))
+        if ref is None:
+            continue
+        delta = value - ref if HIGHER_IS_WORSE[metric] else ref - value
+        if delta > MIN_DELTA[metric] and delta > tolerance * abs(ref):
+            name = f"{metric}.{key}" if key else metric
+            regressions.append((name, ref, value, delta / ref if ref else float("inf")))
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                              capture_output=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(path, result):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    history = json.loads(path.read_text(encoding="utf-8")) if path.exists() else []
+    history.append(result)
+    path.write_text(json.dumps(history, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='score_image のエンドツーエンドのベンチマーク')
+    parser.add_argument('--events', type=int, default=60, help='送るイベント数')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時に処理するイベント数')
+    parser.add_argument('--corpus', type=Path, nargs='*', default=DEFAULT_CORPUS,
+                        help='画像のディレクトリ')
+    parser.add_argument('--collages', type=int, default=4,
+                        help='コーパスに加える多人数のコラージュの枚数')
+    parser.add_argument('--template', type=Path, default=DEFAULT_TEMPLATE,
+                        help='イベントのテンプレート (デフォルト: test_event.json)')
+    parser.add_argument('--download_latency_ms', type=float, default=0,
+                        help='Storage ダウンロードの模擬遅延')
+    parser.add_argument('--write_latency_ms', type=float, default=0,
+                        help='Firestore 書き込みの模擬遅延')
+    parser.add_argument('--fake_inference_ms', type=float, default=None,
+                        help='指定するとモデルをフェイクにし、検出にこの時間をかける')
+    parser.add_argument('--use_cache', action='store_true',
+                        help='md5Hash で内容キャッシュを引く（既定は毎回推論する）')
+    parser.add_argument('--label', default='', help='履歴に残すラベル')
+    parser.add_argument('--history', type=Path, default=RESULTS_DIR / "e2e_history.json",
+                        help='結果を追記する JSON')
+    parser.add_argument('--baseline', type=Path, default=RESULTS_DIR / "e2e_baseline.json",
+                        help='比較するベースライン')
+    parser.add_argument('--save_baseline', action='store_true',
+                        help='今回の結果をベースラインとして保存する')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='悪化とみなす変化の割合')
+    parser.add_argument('--metrics_out', type=Path, default=None,
+                        help='Prometheus 形式のメトリクスを書き出すファイル（.om なら OpenMetrics）')
+    args = parser.parse_args()
+
+    import main as fn_main
+    from clients import registry
+    from content_cache import cache_key
+    from inference_pool import InferenceBusyError
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = load_corpus(args.corpus)
+        if not corpus:
+            print("エラー: 画像が見つかりません")
+            sys.exit(1)
+        corpus += make_collages(corpus, tmp, args.collages)
+
+        storage = FakeStorageClient(download_latency_ms=args.download_latency_ms)
+        firestore = FakeFirestoreClient(write_latency_ms=args.write_latency_ms)
+        registry.register("storage", lambda: storage)
+        registry.register("firestore", lambda: firestore)
+        registry.register("transactional", lambda: transactional)
+        if args.fake_inference_ms is not None:
+            fn_main._face_model = FakeFaceModel(FakeFaceApp(detect_ms=args.fake_inference_ms))
+
+        events = build_events(args.template, corpus, args.events, fn_main.BUCKET_NAME)
+        for ev in events:
+            storage.add_blob(ev["data"]["bucket"], ev["data"]["name"],
+                             ev["_source"].read_bytes(), ev["data"]["metadata"])
+            ev["data"]["md5Hash"] = storage.bucket(ev["data"]["bucket"]).get_blob(
+                ev["data"]["name"]).md5_hash
+
+    # モデルのロードとウォームアップは計測から除く（cold のスパンは 1 件目に残る）
+    fn_main._face_model.get()
+    traces = []
+    fn_main.TRACER.enabled = True
+    fn_main.TRACER.add_sink(traces.append)
+
+    def replay(ev):
+        data = ev["data"]
+        key = cache_key(data.get("md5Hash")) if args.use_cache else None
+        t0 = time.perf_counter()
+        try:
+            fn_main.score_object(data["bucket"], data["name"], data["metadata"]["userName"],
+                                 content_key=key)
+            return (time.perf_counter() - t0) * 1000, None
+        except InferenceBusyError as e:
+            return (time.perf_counter() - t0) * 1000, e
+
+    print(f"イベント {len(events)} 件（コーパス {len(corpus)} 枚、うちコラージュ {args.collages} 枚）"
+          f" / 同時 {args.concurrency} / 推論ワーカー {fn_main.INFERENCE_WORKERS} x "
+          f"ORT スレッド {fn_main.ORT_SESSION.intra_op_threads}")
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(replay, events))
+    elapsed = time.perf_counter() - t_start
+
+    latencies = [ms for ms, err in results if err is None]
+    result = summarize(traces, latencies, elapsed, sum(err is not None for _, err in results))
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "label": args.label,
+        "git": _git_revision(),
+        "host": platform.node(),
+        "config": {"events": args.events, "concurrency": args.concurrency,
+                   "collages": args.collages, "fake_inference_ms": args.fake_inference_ms,
+                   "download_latency_ms": args.download_latency_ms,
+                   "write_latency_ms": args.write_latency_ms, "use_cache": args.use_cache,
+                   "det_policy": fn_main.DET_POLICY.spec, "face_filter": fn_main.FACE_FILTER.spec},
+        **result,
+    }
+
+    print(f"完了 {result['events']} 件 / 拒否 {result['rejected']} 件 / {elapsed:.2f} 秒 / "
+          f"{result['photos_per_sec']:.2f} photos/sec / {result['faces_per_sec']:.2f} faces/sec / "
+          f"ピーク RSS {result['peak_rss_mb']:.0f} MB")
+    if result["latency_ms"]:
+        lat = result["latency_ms"]
+        print(f"レイテンシ[ms]: p50={lat['p50']:.0f} p95={lat['p95']:.0f} p99={lat['p99']:.0f}")
+    print(f"\n{'stage':<12} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage, values in result["stages_ms"].items():
+        print(f"{stage:<12} {values['p50']:>9.2f} {values['p95']:>9.2f}")
+
+    append_history(args.history, result)
+    print(f"\n履歴に追記しました: {args.history}")
+    if args.metrics_out:
+        fn_main.TRACER.dump(args.metrics_out)
+        print(f"メトリクスを書き出しました: {args.metrics_out}")
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, ensure_ascii=False, indent=1) + "\n",
+                                 encoding="utf-8")
+        print(f"ベースラインを保存しました: {args.baseline}")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("config") != result["config"]:
+            print("注意: ベースラインと設定が異なります")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\nベースライン（{baseline.get('git')} {baseline.get('timestamp')}）より悪化:")
+            for name, ref, value, ratio in regressions:
+                print(f"  {name:<24} {ref:>10.2f} → {value:>10.2f} ({ratio:+.0%})")
+            sys.exit(1)
+        print(f"\nベースライン（{baseline.get('git')}）との差は許容範囲内です"
+              f"（tolerance {args.tolerance:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
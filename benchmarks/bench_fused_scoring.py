@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+コンテストごとのループと、全コンテストをまとめた 1 回の行列積の比較
+
+score_image の従来の計算（コンテストごとに face_embs @ cvecs.T をループ）と、
+target_index.FusedTargets（1 回の GEMM + np.maximum.reduceat / 重心との積）を、
+コンテスト数 1〜200 で比較します。
+
+使い方:
+    python benchmarks/bench_fused_scoring.py [--faces 20] [--targets_per_contest 10]
+"""
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+
+from target_index import FusedTargets, build_indexes  # noqa: E402
+
+
+def _unit(rng, shape):
+    x = rng.standard_normal(shape).astype(np.float32)
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def loop_mean(target_sets, face_embs):
+    return {name: float((face_embs @ v.T).mean()) for name, v in target_sets.items()}
+
+
+def loop_max(target_sets, face_embs, alpha):
+    n = face_embs.shape[0]
+    return {name: float((v @ face_embs.T).max(0).sum() / (n ** alpha))
+            for name, v in target_sets.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='コンテストごとのループとまとめた行列積の比較')
+    parser.add_argument('--faces', type=int, default=20, help='1枚あたりの顔の数')
+    parser.add_argument('--targets_per_contest', type=int, default=10,
+                        help='コンテストあたりのターゲット数')
+    parser.add_argument('--contests', type=int, nargs='*', default=[1, 5, 20, 50, 100, 200],
+                        help='計測するコンテスト数')
+    parser.add_argument('--alpha', type=float, default=0.8, help='最大値スコアの α')
+    parser.add_argument('--number', type=int, default=200, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    face_embs = _unit(rng, (args.faces, 512))
+
+    header = f"{'contests':>8} {'loop mean':>10} {'fused mean':>11} {'loop max':>9} {'fused max':>10}  (µs/photo)"
+    print(header)
+    print("-" * len(header))
+    for n_contests in args.contests:
+        target_sets = {f"contest_{i}": _unit(rng, (args.targets_per_contest, 512))
+                       for i in range(n_contests)}
+        fused = FusedTargets(build_indexes(target_sets))
+
+        # 結果が一致することを確認してから計測する
+        ref = loop_max(target_sets, face_embs, args.alpha)
+        got = fused.max_scores(face_embs, args.alpha)
+        assert all(abs(ref[k] - got[k]) < 1e-4 for k in ref)
+
+        cases = [
+            lambda: loop_mean(target_sets, face_embs),
+            lambda: fused.mean_scores(face_embs),
+            lambda: loop_max(target_sets, face_embs, args.alpha),
+            lambda: fused.max_scores(face_embs, args.alpha),
+        ]
+        us = [timeit.timeit(fn, number=args.number) / args.number * 1e6 for fn in cases]
+        print(f"{n_contests:>8} {us[0]:>10.1f} {us[1]:>11.1f} {us[2]:>9.1f} {us[3]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime のセッション設定ごとのコールドスタートと 1 枚あたりの推論時間の比較
+
+設定ごとに新しいプロセス（spawn）でモデルをロードし、
+
+    - ロード時間（セッション作成 = グラフ最適化を含む）
+    - 最初の 1 枚の時間（ウォームアップ前）
+    - 2 枚目以降の 1 枚あたりの時間（中央値）
+
+を計測します。設定は次のとおりです（--threads でスレッド数を指定）。
+
+    default : FaceAnalysis の既定（SessionOptions を渡さない）
+    tuned   : スレッド数を指定し、スピン待ちなし・最適化レベル all
+    cached  : tuned + 最適化済みモデル（--cache_dir、無ければ一時ディレクトリに作る）
+
+buffalo_l のモデル（tools/vendor_models.py で配置、または ~/.insightface/models）が必要です。
+
+使い方:
+    python benchmarks/bench_ort_session.py [--threads 2] [--repeat 5]
+"""
+
+import argparse
+import multiprocessing as mp
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FUNCTIONS_DIR = ROOT / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+sys.path.append(str(ROOT / "tools"))
+
+IMAGES = sorted((ROOT / "tests" / "assets").glob("*.jpg"))
+
+
+def _measure(name, config_kwargs, repeat, queue):
+    """別プロセスで実行: (ロード秒, 最初の 1 枚の秒, 以降の中央値秒, 使ったモデルの root)"""
+    sys.path.append(str(FUNCTIONS_DIR))
+    from face_pipeline import embed_image
+    from image_io import decode_image
+    from model_bundle import local_root
+    from model_manager import FaceModel
+    from ort_session import SessionConfig
+
+    images = [decode_image(str(p), max_side=1280).array for p in IMAGES]
+    if config_kwargs is None:
+        from insightface.app import FaceAnalysis
+
+        t0 = time.perf_counter()
+        app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"],
+                           allowed_modules=["detection", "recognition"],
+                           root=str(local_root() or "~/.insightface"))
+        app.prepare(ctx_id=0, det_size=(640, 640))
+        root = None
+    else:
+        model = FaceModel(warmup=False, root=local_root(),
+                          session_config=SessionConfig(**config_kwargs))
+        t0 = time.perf_counter()
+        app = model.get()
+        root = model.model_root
+    load = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    embed_image(app, images[0])
+    first = time.perf_counter() - t0
+
+    times = []
+    for _ in range(repeat):
+        for img in images:
+            t0 = time.perf_counter()
+            embed_image(app, img)
+            times.append(time.perf_counter() - t0)
+    queue.put((load, first, statistics.median(times), root))
+
+
+def measure(name, config_kwargs, repeat):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(name, config_kwargs, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ORT のセッション設定ごとのコールドスタートと推論時間')
+    parser.add_argument('--threads', type=int, default=2, help='tuned / cached のスレッド数')
+    parser.add_argument('--repeat', type=int, default=5, help='画像ごとの計測回数')
+    parser.add_argument('--cache_dir', type=Path, default=None,
+                        help='最適化済みモデルのキャッシュ（無ければ一時ディレクトリに作る）')
+    parser.add_argument('--level', default='extended', help='キャッシュを作る最適化レベル')
+    args = parser.parse_args()
+    if not IMAGES:
+        print("エラー: tests/assets に画像がありません")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = args.cache_dir
+        if cache_dir is None:
+            from build_ort_cache import model_files
+            from model_bundle import local_root
+            from ort_session import build_cache
+
+            cache_dir = Path(tmp)
+            t0 = time.perf_counter()
+            build_cache(model_files("buffalo_l", local_root()), cache_dir, "buffalo_l",
+                        level=args.level)
+            print(f"キャッシュを作成しました（level={args.level}, "
+                  f"{time.perf_counter() - t0:.1f} 秒）: {cache_dir}")
+
+        tuned = {"intra_op_threads": args.threads, "allow_spinning": False}
+        cases = [("default", None), ("tuned", tuned),
+                 ("cached", {**tuned, "cache_dir": str(cache_dir)})]
+        header = f"{'config':<8} {'load s':>7} {'first ms':>9} {'ms/image':>9}  model root"
+        print(header)
+        print("-" * len(header))
+        for name, config_kwargs in cases:
+            load, first, per_image, root = measure(name, config_kwargs, args.repeat)
+            print(f"{name:<8} {load:>7.2f} {first * 1000:>9.1f} {per_image * 1000:>9.1f}  "
+                  f"{root or '~/.insightface'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ターゲットベクトルの量子化（float16 / int8）の効果と誤差の計測
+
+contest_vectors_1.json / contest_vectors_2.json を float64（JSON をそのまま読んだ場合）/
+float32 / float16 / int8 の .vec にして、
+
+    - ファイルサイズとメモリ上のサイズ
+    - 1 枚あたりのスコア計算時間（mean / max）
+    - float64 に対するスコアの最大絶対誤差
+    - 合成した写真のランキングの一致度（上位 k 枚の重なりと Spearman の順位相関）
+
+を比べます。リポジトリのターゲットは数個しかないので、--targets_per_contest を
+指定すると実際のベクトルに小さなノイズを加えて増やします（1 コンテスト数千件の想定）。
+量子化の誤差だけを見るため、IVF は使わずに総当たりで計算します。
+
+使い方:
+    python benchmarks/bench_quantized.py [--photos 500] [--targets_per_contest 2000]
+"""
+
+import argparse
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+FUNCTIONS_DIR = ROOT / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from target_index import FusedTargets, build_indexes  # noqa: E402
+from vector_store import (load_vector_store, normalize_rows, read_json_vectors,  # noqa: E402
+                          write_vector_store)
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def _unit(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def load_targets(vec_dir, targets_per_contest, rng):
+    """{contest_name: (m, 512) float64}（m が指定より少なければノイズを加えて増やす）"""
+    target_sets = {}
+    for json_path in sorted(Path(vec_dir).glob("contest_vectors_*.json")):
+        vectors, _ = read_json_vectors(json_path)
+        vectors = _unit(np.asarray(vectors, dtype=np.float64))
+        if targets_per_contest and len(vectors) < targets_per_contest:
+            base = vectors[rng.integers(0, len(vectors), targets_per_contest - len(vectors))]
+            extra = _unit(base + rng.standard_normal(base.shape) * 0.03)
+            vectors = np.concatenate([vectors, extra])
+        target_sets[json_path.stem] = vectors
+    return target_sets
+
+
+def make_photos(target_sets, n_photos, max_faces, rng):
+    """ターゲットに似た顔と無関係な顔を混ぜた写真（顔の埋め込みのリスト）"""
+    pool = np.concatenate(list(target_sets.values()))
+    photos = []
+    for _ in range(n_photos):
+        n = int(rng.integers(1, max_faces + 1))
+        similar = pool[rng.integers(0, len(pool), n)] + rng.standard_normal((n, 512)) * 0.05
+        random = rng.standard_normal((n, 512)) * 0.05
+        mix = rng.random(n)[:, None]
+        photos.append(_unit(mix * similar + (1 - mix) * random))
+    return photos
+
+
+def float64_scores(target_sets, photos, formula, alpha):
+    """score_image の従来の計算（float64 でコンテストごとにループ）"""
+    rows = []
+    for embs in photos:
+        row = []
+        for vectors in target_sets.values():
+            sims = embs @ vectors.T
+            row.append(sims.mean() if formula == "mean"
+                       else sims.max(axis=1).sum() / len(embs) ** alpha)
+        rows.append(row)
+    return np.array(rows)
+
+
+def fused_scores(fused, photos, formula, alpha):
+    score = fused.mean_scores if formula == "mean" else (lambda e: fused.max_scores(e, alpha))
+    return np.array([[s[name] for name in fused.names]
+                     for s in (score(e.astype(np.float32)) for e in photos)])
+
+
+def ranking_agreement(ref, got, k):
+    """コンテストごとの上位 k 枚の重なり（平均）と Spearman の順位相関（最小値）"""
+    overlaps, rhos = [], []
+    for j in range(ref.shape[1]):
+        top_ref = set(np.argsort(-ref[:, j], kind="stable")[:k])
+        top_got = set(np.argsort(-got[:, j], kind="stable")[:k])
+        overlaps.append(len(top_ref & top_got) / k)
+        rank_ref = np.argsort(np.argsort(ref[:, j]))
+        rank_got = np.argsort(np.argsort(got[:, j]))
+        rhos.append(np.corrcoef(rank_ref, rank_got)[0, 1])
+    return float(np.mean(overlaps)), float(np.min(rhos))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ターゲットベクトルの量子化の効果と誤差')
+    parser.add_argument('--vec_dir', type=Path, default=FUNCTIONS_DIR / "target_vectors",
+                        help='contest_vectors_*.json のディレクトリ')
+    parser.add_argument('--targets_per_contest', type=int, default=0,
+                        help='コンテストあたりのターゲット数（0 ならリポジトリのまま）')
+    parser.add_argument('--photos', type=int, default=500, help='ランキングに使う写真の数')
+    parser.add_argument('--max_faces', type=int, default=10, help='1 枚あたりの最大の顔の数')
+    parser.add_argument('--top_k', type=int, default=20, help='ランキングの一致度を見る上位枚数')
+    parser.add_argument('--alpha', type=float, default=0.8, help='max 式の α')
+    parser.add_argument('--number', type=int, default=3, help='計測の繰り返し回数')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    target_sets = load_targets(args.vec_dir, args.targets_per_contest, rng)
+    if not target_sets:
+        print(f"エラー: contest_vectors_*.json が見つかりません: {args.vec_dir}")
+        sys.exit(1)
+    photos = make_photos(target_sets, args.photos, args.max_faces, rng)
+    n_targets = sum(len(v) for v in target_sets.values())
+    json_bytes = sum(p.stat().st_size for p in Path(args.vec_dir).glob("contest_vectors_*.json"))
+    print(f"コンテスト {len(target_sets)} 件 / ターゲット {n_targets} 件 / 写真 {len(photos)} 枚"
+          f"（JSON {json_bytes / 1024:.1f} KiB）")
+
+    refs = {f: float64_scores(target_sets, photos, f, args.alpha) for f in ("mean", "max")}
+    results = [("float64", n_targets * 512 * 8, n_targets * 512 * 8,
+                {f: (lambda f=f: float64_scores(target_sets, photos, f, args.alpha))
+                 for f in refs}, refs)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in DTYPES:
+            loaded, file_bytes = {}, 0
+            for name, vectors in target_sets.items():
+                vec_path = Path(tmp) / f"{name}.{dtype}.vec"
+                write_vector_store(vec_path, name, normalize_rows(vectors), dtype=dtype)
+                file_bytes += vec_path.stat().st_size
+                loaded[name] = load_vector_store(vec_path)[1]
+            fused = FusedTargets(build_indexes(loaded, brute_force_max=n_targets))
+            mem_bytes = fused.matrix.nbytes
+            scores = {f: fused_scores(fused, photos, f, args.alpha) for f in refs}
+            runs = {f: (lambda f=f: fused_scores(fused, photos, f, args.alpha)) for f in refs}
+            results.append((dtype, file_bytes, mem_bytes, runs, scores))
+
+        header = (f"{'dtype':>8} {'file KiB':>9} {'mem KiB':>8} {'mean µs':>8} {'max µs':>7} "
+                  f"{'max|err|':>9} {f'top{args.top_k}':>6} {'spearman':>8}")
+        print(header)
+        print("-" * len(header))
+        for dtype, file_bytes, mem_bytes, runs, scores in results:
+            us = {f: min(timeit.repeat(fn, number=1, repeat=args.number)) / len(photos) * 1e6
+                  for f, fn in runs.items()}
+            err = max(float(np.abs(scores[f] - refs[f]).max()) for f in refs)
+            overlap, rho = ranking_agreement(refs["max"], scores["max"], min(args.top_k, len(photos)))
+            print(f"{dtype:>8} {file_bytes / 1024:>9.1f} {mem_bytes / 1024:>8.1f} "
+                  f"{us['mean']:>8.1f} {us['max']:>7.1f} {err:>9.2e} {overlap:>6.2f} {rho:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+ローカルのベンチマーク・負荷試験用のフェイク
+
+google.cloud.storage.Client / firestore.Client のうち、関数が使う部分だけを
+メモリ上で再現する。clients.registry.register() で差し替えて使う。
+
+    storage = FakeStorageClient(download_latency_ms=30)
+    storage.add_blob("bucket", "wedding-photos/a.jpg", data, {"userName": "guest"})
+    registry.register("storage", lambda: storage)
+    registry.register("firestore", lambda: firestore)
+    registry.register("transactional", lambda: transactional)   # firestore.transactional の代わり
+"""
+
+import base64
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+def _sleep_ms(ms):
+    if ms:
+        time.sleep(ms / 1000)
+
+
+# ---------- Cloud Storage ----------
+class FakeBlob:
+    def __init__(self, bucket, name, data=None, metadata=None):
+        self.bucket = bucket
+        self.name = name
+        self.data = data
+        self.metadata = metadata
+
+    @property
+    def size(self):
+        return None if self.data is None else len(self.data)
+
+    @property
+    def md5_hash(self):
+        """実際の Blob と同じく base64 の MD5"""
+        if self.data is None:
+            return None
+        return base64.b64encode(hashlib.md5(self.data).digest()).decode()
+
+    def _check(self):
+        if self.data is None:
+            raise FileNotFoundError(f"{self.bucket.name}/{self.name}")
+        _sleep_ms(self.bucket.client.download_latency_ms)
+
+    def download_to_file(self, f):
+        self._check()
+        for i in range(0, len(self.data), 1 << 20):
+            f.write(self.data[i:i + (1 << 20)])
+
+    def download_as_bytes(self):
+        self._check()
+        return self.data
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.client.add_blob(self.bucket.name, self.name,
+                                    data if isinstance(data, bytes) else data.encode())
+
+    def exists(self):
+        return self.name in self.bucket.client.blobs.get(self.bucket.name, {})
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def blob(self, name):
+        stored = self.client.blobs.get(self.name, {}).get(name)
+        return stored or FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return self.client.blobs.get(self.name, {}).get(name)
+
+    def list_blobs(self, prefix=""):
+        blobs = self.client.blobs.get(self.name, {})
+        return [b for n, b in sorted(blobs.items()) if n.startswith(prefix)]
+
+
+class FakeStorageClient:
+    def __init__(self, download_latency_ms=0):
+        self.download_latency_ms = download_latency_ms
+        self.blobs = {}   # {bucket: {name: FakeBlob}}
+        self._lock = threading.Lock()
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+    def add_blob(self, bucket_name, name, data, metadata=None):
+        with self._lock:
+            bucket = FakeBucket(self, bucket_name)
+            self.blobs.setdefault(bucket_name, {})[name] = FakeBlob(bucket, name, data, metadata)
+
+
+# ---------- Firestore ----------
+DELETE_FIELD = object()   # firestore.DELETE_FIELD の代わり
+
+
+def _merge(dst, src):
+    """set(merge=True) と同じく入れ子の map もフィールド単位でマージする"""
+    for key, value in src.items():
+        if value is DELETE_FIELD:
+            dst.pop(key, None)
+        elif isinstance(value, dict) and isinstance(dst.get(key), dict):
+            dst[key] = _merge(dict(dst[key]), value)
+        else:
+            dst[key] = value
+    return dst
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field):
+        return self._data.get(field) if self._data else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self.client = client
+        self.collection_name = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self.collection_name}/{self.id}"
+
+    def get(self):
+        return FakeSnapshot(self, self.client.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        self.client._write([("set", self, data, merge)])
+
+    def update(self, data):
+        self.client._write([("update", self, data, True)])
+
+    def delete(self):
+        self.client._write([("delete", self, None, False)])
+
+
+class FakeQuery:
+    """ドキュメント ID 順の order_by / start_after / limit と、== の where だけに対応したクエリ"""
+
+    def __init__(self, collection, start_after=None, limit=None, filters=()):
+        self.collection = collection
+        self._start_after = start_after
+        self._limit = limit
+        self._filters = filters
+
+    def where(self, field, op, value):
+        if op != "==":
+            raise NotImplementedError(op)
+        return FakeQuery(self.collection, self._start_after, self._limit,
+                         self._filters + ((field, value),))
+
+    def order_by(self, field):
+        if field != "__name__":
+            raise NotImplementedError(field)
+        return self
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.collection, snapshot.id, self._limit, self._filters)
+
+    def limit(self, count):
+        return FakeQuery(self.collection, self._start_after, count, self._filters)
+
+    def stream(self):
+        client, prefix = self.collection.client, self.collection.name + "/"
+        with client._lock:
+            items = sorted(client.docs.items())
+        n = 0
+        for path, data in items:
+            doc_id = path[len(prefix):]
+            if not path.startswith(prefix) or "/" in doc_id:
+                continue
+            if self._start_after is not None and doc_id <= self._start_after:
+                continue
+            if any(data.get(field) != value for field, value in self._filters):
+                continue
+            if self._limit is not None and n >= self._limit:
+                return
+            n += 1
+            yield FakeSnapshot(self.collection.document(doc_id), data)
+
+
+class FakeCollection:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self.client, self.name, doc_id)
+
+    def order_by(self, field):
+        return FakeQuery(self).order_by(field)
+
+    def limit(self, count):
+        return FakeQuery(self, limit=count)
+
+    def where(self, field, op, value):
+        return FakeQuery(self).where(field, op, value)
+
+    def stream(self):
+        return FakeQuery(self).stream()
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(("set", ref, data, merge))
+
+    def update(self, ref, data):
+        self.ops.append(("update", ref, data, True))
+
+    def delete(self, ref):
+        self.ops.append(("delete", ref, None, False))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def commit(self):
+        if len(self.ops) > 500:
+            raise ValueError("a batch can contain at most 500 operations")
+        self.client._write(self.ops)
+        self.ops = []
+
+
+class FakeFirestoreClient:
+    def __init__(self, write_latency_ms=0):
+        self.write_latency_ms = write_latency_ms
+        self.docs = {}          # {"collection/doc_id": dict}
+        self.commits = 0        # 書き込み RPC の回数
+        self.writes = 0         # 書き込んだドキュメント数
+        self._lock = threading.Lock()
+        self._tx_lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, refs, transaction=None):
+        for ref in refs:
+            yield ref.get()
+
+    def transaction(self):
+        return FakeWriteBatch(self)
+
+    def _write(self, ops):
+        _sleep_ms(self.write_latency_ms)
+        with self._lock:
+            self.commits += 1
+            for kind, ref, data, merge in ops:
+                self.writes += 1
+                if kind == "delete":
+                    self.docs.pop(ref.path, None)
+                elif kind == "update" or merge:
+                    if kind == "update" and ref.path not in self.docs:
+                        raise KeyError(f"No document to update: {ref.path}")
+                    merged = dict(self.docs.get(ref.path) or {})
+                    if kind == "update":
+                        merged.update(data)
+                    else:
+                        _merge(merged, data)
+                    self.docs[ref.path] = merged
+                else:
+                    self.docs[ref.path] = dict(data)
+
+
+def transactional(fn):
+    """google.cloud.firestore.transactional のフェイク
+
+    transactional(fn)(client.transaction()) で fn(transaction) をほかのトランザクションと
+    排他的に実行し、transaction.set() した書き込みをまとめて反映する。
+    """
+    def run(transaction, *args, **kwargs):
+        with transaction.client._tx_lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+            return result
+
+    return run
+
+
+# ---------- 推論モデル ----------
+class FakeFaceApp:
+    """検出・認識に一定時間かかるふりをするモデル（ONNX Runtime と同じく GIL を離す）"""
+
+    def __init__(self, faces_per_image=3, detect_ms=80, embed_ms_per_face=10, seed=0):
+        self.faces_per_image = faces_per_image
+        self.det_model = _FakeDetector(self)
+        self.models = {"detection": self.det_model, "recognition": _FakeRecognizer(self)}
+        self.detect_ms = detect_ms
+        self.embed_ms_per_face = embed_ms_per_face
+        self._rng = np.random.default_rng(seed)
+
+
+class _FakeDetector:
+    _KPS = np.array([[38.3, 51.7], [73.5, 51.5], [56.0, 71.7],
+                     [41.5, 92.4], [70.7, 92.2]], dtype=np.float32)
+
+    def __init__(self, app):
+        self.app = app
+
+    def detect(self, img, max_num=0, metric="default", input_size=None):
+        _sleep_ms(self.app.detect_ms)
+        n = self.app.faces_per_image
+        h, w = img.shape[:2]
+        size = min(h, w) / 4
+        bboxes = np.array([[i * size, 0, (i + 1) * size, size, 0.9] for i in range(n)],
+                          dtype=np.float32).reshape(n, 5)
+        kpss = np.stack([self._KPS * size / 112 + [i * size, 0] for i in range(n)]) \
+            if n else np.zeros((0, 5, 2), dtype=np.float32)
+        return bboxes, kpss
+
+
+class _FakeRecognizer:
+    input_size = (112, 112)
+
+    def __init__(self, app):
+        self.app = app
+
+    def get_feat(self, imgs):
+        if not isinstance(imgs, list):
+            imgs = [imgs]
+        _sleep_ms(self.app.embed_ms_per_face * len(imgs))
+        return self.app._rng.standard_normal((len(imgs), 512)).astype(np.float32)
+
+
+class FakeFaceModel:
+    """model_manager.FaceModel の代わり"""
+
+    def __init__(self, app):
+        self.app = app
+        self.timings = {}
+        self.loaded = True
+
+    def get(self):
+        return self.app
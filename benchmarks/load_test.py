@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+score_image の負荷試験（ローカル）
+
+test_event.json と同じ形式の Storage finalize イベントを、画像コーパスから N 件生成して
+同時に C 件ずつ score_object に流し込みます。Storage / Firestore はメモリ上の
+フェイク（benchmarks/fakes.py）に差し替え、ダウンロード・書き込みの遅延を
+オプションで模擬できます。
+
+同じ画像はイベントの md5Hash で内容キャッシュにヒットするので、コーパスより多い
+イベント数を送るとキャッシュのヒット率も確認できます。
+
+実行には関数の依存パッケージ（web-ui/functions/requirements.txt）が必要です。
+--fake_inference_ms を指定するとモデルもフェイクに差し替え、推論プールと
+I/O の並行性だけを計測できます。
+
+使い方:
+    python benchmarks/load_test.py --events 150 --concurrency 8 \\
+        --download_latency_ms 40 --write_latency_ms 20
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from fakes import (FakeFaceApp, FakeFaceModel, FakeFirestoreClient,  # noqa: E402
+                   FakeStorageClient, transactional)
+
+DEFAULT_CORPUS = [ROOT / "tests" / "assets", ROOT / "src_images"]
+DEFAULT_TEMPLATE = ROOT / "test_event.json"
+
+
+def load_corpus(dirs):
+    files = []
+    for d in dirs:
+        files.extend(p for p in sorted(Path(d).rglob("*"))
+                     if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    return files
+
+
+def build_events(template_path, corpus, n_events, bucket):
+    """テンプレートのイベントを元に、コーパスの画像を順番に割り当てたイベントを作る"""
+    with open(template_path, encoding="utf-8") as f:
+        template = json.load(f)
+
+    events = []
+    for i in range(n_events):
+        src = corpus[i % len(corpus)]
+        data = dict(template["data"])
+        data.update({
+            "bucket": bucket,
+            "name": f"wedding-photos/{i:05d}_{src.name}",
+            "metadata": {"userName": f"guest{i % 20:02d}"},
+        })
+        events.append({**template, "id": str(i), "data": data, "_source": src})
+    return events
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='score_image のローカル負荷試験')
+    parser.add_argument('--events', type=int, default=50, help='送るイベント数')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='同時に処理するイベント数（関数の concurrency に相当）')
+    parser.add_argument('--corpus', type=Path, nargs='*', default=DEFAULT_CORPUS,
+                        help='画像のディレクトリ')
+    parser.add_argument('--template', type=Path, default=DEFAULT_TEMPLATE,
+                        help='イベントのテンプレート (デフォルト: test_event.json)')
+    parser.add_argument('--download_latency_ms', type=float, default=0,
+                        help='Storage ダウンロードの模擬遅延')
+    parser.add_argument('--write_latency_ms', type=float, default=0,
+                        help='Firestore 書き込みの模擬遅延')
+    parser.add_argument('--fake_inference_ms', type=float, default=None,
+                        help='指定するとモデルをフェイクにし、検出にこの時間をかける')
+    args = parser.parse_args()
+
+    import main as fn_main
+    from clients import registry
+    from content_cache import cache_key
+    from inference_pool import InferenceBusyError
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print("エラー: 画像が見つかりません")
+        sys.exit(1)
+
+    storage = FakeStorageClient(download_latency_ms=args.download_latency_ms)
+    firestore = FakeFirestoreClient(write_latency_ms=args.write_latency_ms)
+    registry.register("storage", lambda: storage)
+    registry.register("firestore", lambda: firestore)
+    registry.register("transactional", lambda: transactional)
+    if args.fake_inference_ms is not None:
+        fn_main._face_model = FakeFaceModel(FakeFaceApp(detect_ms=args.fake_inference_ms))
+
+    events = build_events(args.template, corpus, args.events, fn_main.BUCKET_NAME)
+    for ev in events:
+        storage.add_blob(ev["data"]["bucket"], ev["data"]["name"],
+                         ev["_source"].read_bytes(), ev["data"]["metadata"])
+        ev["data"]["md5Hash"] = storage.bucket(ev["data"]["bucket"]).get_blob(
+            ev["data"]["name"]).md5_hash
+
+    # モデルのロードとウォームアップは計測から除く
+    fn_main._face_model.get()
+
+    def replay(ev):
+        data = ev["data"]
+        t0 = time.perf_counter()
+        try:
+            fn_main.score_object(data["bucket"], data["name"], data["metadata"]["userName"],
+                                 content_key=cache_key(data.get("md5Hash")))
+            return time.perf_counter() - t0, None
+        except InferenceBusyError as e:
+            return time.perf_counter() - t0, e
+
+    print(f"イベント {len(events)} 件 / 同時 {args.concurrency} / "
+          f"推論ワーカー {fn_main.INFERENCE_WORKERS} x ORT スレッド {fn_main.ORT_SESSION.intra_op_threads}")
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(replay, events))
+    elapsed = time.perf_counter() - t_start
+
+    latencies = [sec * 1000 for sec, err in results if err is None]
+    rejected = sum(1 for _, err in results if err is not None)
+    print(f"完了 {len(latencies)} 件 / 拒否（バックプレッシャー） {rejected} 件 / {elapsed:.2f} 秒")
+    print(f"スループット: {len(latencies) / elapsed:.2f} photos/sec")
+    if latencies:
+        print(f"レイテンシ[ms]: p50={percentile(latencies, 50):.0f} "
+              f"p95={percentile(latencies, 95):.0f} p99={percentile(latencies, 99):.0f} "
+              f"mean={statistics.mean(latencies):.0f}")
+    print(f"Firestore: {firestore.writes} 件書き込み / {firestore.commits} 回コミット")
+    print(f"グループコミット: {fn_main._writer.stats()}")
+    print(f"キャッシュ: {fn_main._score_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,14 @@ import os
 import io
 import json
 import glob
+from urllib.parse import quote
 import numpy as np
 from PIL import Image
 import insightface
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+from google.api_core.exceptions import NotFound
 from google.cloud import storage
 from google.cloud import firestore
 
@@ -25,13 +29,28 @@ TARGET_VECTORS_DIR = os.environ.get('TARGET_VECTORS_DIR', 'target_vectors')
 app = None
 target_vectors = {}
 
+# Storage / Firestore クライアント（インスタンス内で使い回す）
+storage_client = None
+firestore_client = None
+
+def init_clients():
+    """Storage / Firestore クライアントの初期化（初回のみ生成）"""
+    global storage_client, firestore_client
+    
+    if storage_client is None:
+        storage_client = storage.Client()
+    if firestore_client is None:
+        firestore_client = firestore.Client()
+
 def init_model():
     """InsightFaceモデルとターゲットベクトルの初期化"""
     global app, target_vectors
     
     if app is None:
         print(f"InsightFaceモデルを初期化しています...")
-        app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
+        # 使うのは検出と認識だけ（年齢・性別やランドマークのモデルはロードしない）
+        app = FaceAnalysis(name='buffalo_l', allowed_modules=['detection', 'recognition'],
+                           providers=['CPUExecutionProvider'])
         app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
     
     if not target_vectors:
@@ -54,6 +73,38 @@ def init_model():
             print(f"エラー: ターゲットベクトルの読み込みに失敗しました: {e}")
             raise
 
+def embed_faces(img):
+    """
+    検出を 1 回行い、全顔をまとめて 1 回の認識バッチで処理する
+    
+    app.get() は顔ごとに認識モデルを実行するため、集合写真では認識が処理時間の大半を占める。
+    返す埋め込みは app.get() の各 face.embedding を L2 正規化して np.stack したものと同じ。
+    
+    Args:
+        img: RGB 画像（app.get() に渡すものと同じ配列）
+        
+    Returns:
+        tuple: (検出した顔のリスト, 正規化済みの埋め込み (n_faces, 512))
+    """
+    bboxes, kpss = app.det_model.detect(img, max_num=0, metric='default')
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    
+    if not faces:
+        return faces, np.zeros((0, 512), dtype=np.float32)
+    
+    # 各顔を 112x112 に切り出し、(n_faces, 3, 112, 112) の 1 バッチで認識
+    rec_model = app.models['recognition']
+    size = rec_model.input_size[0]
+    crops = [face_align.norm_crop(img, landmark=f.kps, image_size=size) for f in faces]
+    embs = rec_model.get_feat(crops).astype(np.float32, copy=False)
+    embs = embs / np.linalg.norm(embs, axis=1, keepdims=True)
+    for face, emb in zip(faces, embs):
+        face.embedding = emb
+    return faces, embs
+
 def calculate_scores(embs, n_faces):
     """
     複数のターゲットベクトルに対してスコアを計算
@@ -78,6 +129,14 @@ def calculate_scores(embs, n_faces):
         
     return scores
 
+def photo_doc_id(file_name):
+    """Storage のパスから photos のドキュメント ID を決める
+
+    Web UI（web-ui/src/photoId.js の encodeURIComponent）・web-ui/functions/photo_ids.py と同じ規則
+    （例: wedding-photos/xxx.jpg → wedding-photos%2Fxxx.jpg）
+    """
+    return quote(file_name, safe="!'()*")
+
 def photo_uploaded(cloudevent):
     """
     Cloud Storageにアップロードされた写真をトリガーに実行される関数
@@ -86,8 +145,9 @@ def photo_uploaded(cloudevent):
     Args:
         event: Cloud Functions v2のCloudEvent
     """
-    # モデルの初期化（必要な場合）
+    # モデルとクライアントの初期化（必要な場合）
     init_model()
+    init_clients()
     
     # バケット名とファイル名の取得
     bucket_name = cloudevent.data["bucket"]
@@ -105,8 +165,6 @@ def photo_uploaded(cloudevent):
         print(f"非対応のファイル形式: {file_name}")
         return
     
-    # Storage Clientの初期化
-    storage_client = storage.Client()
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(file_name)
     
@@ -116,16 +174,13 @@ def photo_uploaded(cloudevent):
         image_bytes = blob.download_as_bytes()
         img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
         
-        # 顔検出
-        faces = app.get(np.asarray(img))
+        # 顔検出と埋め込みの抽出（認識は全顔まとめて 1 回）
+        faces, embs = embed_faces(np.asarray(img))
         n_faces = len(faces)
         
         print(f"画像から {n_faces} 個の顔を検出しました")
         
         if faces:
-            # 各顔の埋め込みベクトルを抽出して正規化
-            embs = np.stack([f.embedding/np.linalg.norm(f.embedding) for f in faces])
-            
             # 全ターゲットに対するスコアを計算
             all_scores = calculate_scores(embs, n_faces)
             
@@ -141,32 +196,25 @@ def photo_uploaded(cloudevent):
             print("顔が検出されませんでした。スコア: 0.0")
         
         # Firestoreに結果を保存
-        firestore_client = firestore.Client()
-        
-        # 写真のメタデータを検索（Web UIからアップロードされた場合に対応）
-        photos_query = firestore_client.collection("photos").where("fileName", "==", os.path.basename(file_name)).limit(1)
-        query_results = list(photos_query.stream())
+        # ドキュメント ID はパスから決まるので、Web UI が作成したドキュメントを検索せずに直接更新する
+        doc_ref = firestore_client.collection("photos").document(photo_doc_id(file_name))
         
         # すべてのスコアをFirestoreに格納するデータを準備
         target_scores = {}
         for target_name, score in all_scores.items():
             target_scores[f"score_{target_name}"] = score
         
-        if query_results:
-            # 既存のドキュメントがある場合は更新
-            photo_doc = query_results[0]
-            print(f"既存のドキュメント {photo_doc.id} を更新します")
-            
-            # 既存のドキュメントを更新
-            update_data = {
-                "score": overall_score,
-                "faceCount": n_faces,
-                "processed": True,
-                "processingTimestamp": firestore.SERVER_TIMESTAMP,
-                **target_scores  # 各ターゲットのスコアを追加
-            }
-            
-            photo_doc.reference.update(update_data)
+        update_data = {
+            "score": overall_score,
+            "faceCount": n_faces,
+            "processed": True,
+            "processingTimestamp": firestore.SERVER_TIMESTAMP,
+            **target_scores  # 各ターゲットのスコアを追加
+        }
+        try:
+            # 既存のドキュメント（Web UIからアップロードされた場合）を更新
+            doc_ref.update(update_data)
+            print(f"既存のドキュメント {doc_ref.id} を更新しました")
             
             return {
                 "success": True, 
@@ -175,12 +223,13 @@ def photo_uploaded(cloudevent):
                 "faces": n_faces,
                 "targetScores": all_scores
             }
-        else:
+        except NotFound:
             # 既存のドキュメントがない場合は新規作成
             print(f"新しいドキュメントを作成します")
             photo_data = {
                 "photoUrl": f"https://storage.googleapis.com/{bucket_name}/{file_name}",
                 "fileName": os.path.basename(file_name),
+                "storagePath": file_name,
                 "score": overall_score,  # 総合スコア
                 "faceCount": n_faces,
                 "processed": True,
@@ -190,8 +239,8 @@ def photo_uploaded(cloudevent):
             }
             
             # Firestoreに保存
-            doc_ref = firestore_client.collection("photos").add(photo_data)
-            print(f"新規ドキュメントを作成しました: {doc_ref}")
+            doc_ref.set(photo_data)
+            print(f"新規ドキュメントを作成しました: {doc_ref.id}")
             
             return {
                 "success": True, 
@@ -6,6 +6,7 @@
 """
 
 import os
+import sys
 import json
 import numpy as np
 from PIL import Image
@@ -42,9 +43,11 @@ def load_idol_data():
         print(f"エラー: アイドルデータの読み込みに失敗しました: {e}")
         return None, None
 
-def process_test_image(app, image_path, output_dir, add_margin=0.2):
+def process_test_image(app, image_path, output_dir, add_margin=0.2, face_filter=None):
     """
     テスト画像から顔を検出して特徴ベクトルを抽出し、顔画像を保存します
+    face_filter（web-ui/functions/face_filter.py の FaceFilter）を渡すと、score_image と同じ条件で
+    小さい顔や確信度の低い顔を除きます
     """
     if not os.path.exists(image_path):
         print(f"エラー: テスト画像 {image_path} が見つかりません")
@@ -70,6 +73,15 @@ def process_test_image(app, image_path, output_dir, add_margin=0.2):
         
         print(f"画像から {len(faces)} 個の顔を検出しました")
         
+        # score_image と同じ条件で顔を絞り込む
+        if face_filter is not None:
+            stats = {}
+            faces = face_filter.apply(img_array, faces, stats)
+            reasons = {k: v for k, v in stats.items() if k.startswith("filtered_")}
+            print(f"絞り込みで {stats['facesFiltered']} 個の顔を除きました {reasons}")
+            if not faces:
+                return None, []
+        
         # 各顔の埋め込みベクトルを抽出して正規化
         face_vectors = []
         test_faces_info = []
@@ -110,6 +122,7 @@ def process_test_image(app, image_path, output_dir, add_margin=0.2):
                 'face_index': i + 1,
                 'face_image': face_path,
                 'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                'det_score': float(face.det_score),
                 'bbox_with_margin': [int(x1_margin), int(y1_margin), int(x2_margin), int(y2_margin)]
             })
         
@@ -157,6 +170,8 @@ def main():
                       help='顔画像と結果を保存するディレクトリ (デフォルト: face_images)')
     parser.add_argument('--margin', type=float, default=0.2,
                       help='顔の周りに追加するマージン (デフォルト: 0.2)')
+    parser.add_argument('--face_filter', type=str, default=None,
+                      help='score_image と同じ顔の絞り込み条件 (例: min_size=0.015,min_score=0.6。デフォルト: 絞り込まない)')
     args = parser.parse_args()
     
     # 出力ディレクトリの設定
@@ -178,7 +193,13 @@ def main():
     
     # テスト画像の処理
     print(f"テスト画像を処理しています: {args.image}")
-    test_vectors, test_faces_info = process_test_image(app, args.image, test_faces_dir, args.margin)
+    face_filter = None
+    if args.face_filter is not None:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web-ui', 'functions'))
+        from face_filter import FaceFilter
+        face_filter = FaceFilter.parse(args.face_filter)
+    test_vectors, test_faces_info = process_test_image(app, args.image, test_faces_dir, args.margin,
+                                                       face_filter=face_filter)
     if test_vectors is None:
         return
     
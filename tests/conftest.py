@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+テスト共通のフィクスチャ
+
+モデルを使うテストは、tools/vendor_models.py で web-ui/functions/insightface に配置した
+同梱モデル（チェックサムを確認する）か、~/.insightface/models/buffalo_l を使う。
+どちらも無ければスキップし、テスト中にモデルをダウンロードすることはない。
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+FUNCTIONS_DIR = Path(__file__).parent.parent / "web-ui" / "functions"
+MODEL_DIR = Path.home() / ".insightface" / "models" / "buffalo_l"
+sys.path.append(str(FUNCTIONS_DIR))
+
+
+@pytest.fixture(scope="session")
+def buffalo_app():
+    """検出 + 認識だけをロードした InsightFace アプリ（モデルが無ければスキップ）
+
+    セッション設定は score_image と同じ ort_session.SessionConfig（ORT_* の環境変数と
+    web-ui/functions/ort_cache の最適化済みモデル）を使う。
+    """
+    from model_bundle import local_root, verify
+    from model_manager import FaceModel
+    from ort_session import SessionConfig
+
+    root = local_root()
+    if root is not None:
+        verify(root, "buffalo_l", full=True)
+    elif not MODEL_DIR.exists():
+        pytest.skip(f"buffalo_l モデルがありません（tools/vendor_models.py で配置してください）: "
+                    f"{MODEL_DIR}")
+    model = FaceModel(name="buffalo_l", det_size=(640, 640), warmup=False, root=root,
+                      session_config=SessionConfig.from_env(cache_dir=FUNCTIONS_DIR / "ort_cache"))
+    return model.get()
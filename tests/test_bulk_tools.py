@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+まとめて処理するツール（score_album / prepare_idol_embeddings）の再開処理のテスト
+"""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "tools"))
+
+from prepare_idol_embeddings import file_sha256, is_reusable, load_manifest  # noqa: E402
+from score_album import collect_paths, load_done  # noqa: E402
+
+ASSETS = Path(__file__).parent / "assets"
+
+
+def test_collect_paths_from_dirs_files_and_lists(tmp_path):
+    listing = tmp_path / "paths.txt"
+    listing.write_text(f"{ASSETS / 'test_image.jpg'}\n\n{tmp_path / 'extra.png'}\n", encoding="utf-8")
+    paths = collect_paths([str(ASSETS), str(ASSETS / "test_image.jpg"), str(listing)])
+
+    assert paths[:len(list(ASSETS.glob("*.jpg")))] == sorted(str(p) for p in ASSETS.glob("*.jpg"))
+    assert paths.count(str(ASSETS / "test_image.jpg")) == 1
+    assert paths[-1] == str(tmp_path / "extra.png")
+
+
+def test_journals_tolerate_truncated_last_line(tmp_path):
+    journal = tmp_path / "album.jsonl"
+    journal.write_text(json.dumps({"path": "a.jpg"}) + "\n" + '{"path": "b.j', encoding="utf-8")
+    assert load_done(journal) == {"a.jpg"}
+
+    manifest = tmp_path / "idol.manifest.jsonl"
+    sha = file_sha256(ASSETS / "test_image.jpg")
+    ok = {"sha256": sha, "image": "x.jpg", "faces": [{"face_image": None, "vector": [0.0]}]}
+    manifest.write_text(json.dumps(ok) + "\n" + '{"sha256": "trunc', encoding="utf-8")
+    loaded = load_manifest(str(manifest))
+    assert list(loaded) == [sha]
+    assert is_reusable(loaded[sha], save_crops=False)
+    assert not is_reusable(loaded[sha], save_crops=True)   # 切り抜きが無いので再処理
+    assert not is_reusable({**ok, "error": "broken"}, save_crops=False)
+
+
+def test_idol_worker_loads_detection_and_recognition_only(monkeypatch):
+    """ワーカーは検出・認識だけを、スレッド数を絞った SessionConfig でロードする"""
+    import model_manager
+    import prepare_idol_embeddings
+
+    created = []
+
+    class _Model:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+
+        def get(self):
+            return "app"
+
+    monkeypatch.setattr(model_manager, "FaceModel", _Model)
+    prepare_idol_embeddings._init_worker(320, 1)
+    assert prepare_idol_embeddings._app == "app"
+    kwargs = created[0]
+    assert kwargs["allowed_modules"] == ["detection", "recognition"]
+    assert kwargs["det_size"] == (320, 320)
+    assert kwargs["session_config"].intra_op_threads == 1
+    assert not kwargs["session_config"].allow_spinning
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+クライアントレジストリとフェーズ計測のテスト
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from clients import ClientRegistry  # noqa: E402
+from timing import PhaseTimer  # noqa: E402
+
+
+def test_registry_creates_each_client_once():
+    """並行して get() しても各クライアントは一度だけ生成されることを確認"""
+    created = []
+
+    def factory():
+        time.sleep(0.01)
+        created.append(object())
+        return created[-1]
+
+    registry = ClientRegistry({"storage": factory})
+    barrier = threading.Barrier(8)
+    got = []
+
+    def worker():
+        barrier.wait()
+        got.append(registry.storage())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert all(c is created[0] for c in got)
+
+
+def test_register_replaces_client():
+    """register() で生成関数を差し替えると新しいクライアントが使われることを確認"""
+    registry = ClientRegistry({"firestore": lambda: "real"})
+    assert registry.firestore() == "real"
+
+    registry.register("firestore", lambda: "fake")
+    assert registry.firestore() == "fake"
+
+
+def test_phase_timer_fields():
+    """フェーズごとの時間が積算され、*_ms のフィールドとして出力されることを確認"""
+    timer = PhaseTimer()
+    for _ in range(2):
+        with timer.phase("download"):
+            time.sleep(0.01)
+    with timer.phase("write"):
+        pass
+
+    fields = timer.fields()
+    assert set(fields) == {"download_ms", "write_ms", "total_ms"}
+    assert fields["download_ms"] >= 20
+    assert fields["total_ms"] >= fields["download_ms"]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+内容ハッシュをキーにしたスコアのキャッシュのテスト
+"""
+
+import base64
+import hashlib
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from content_cache import ContentCache, LRUCache, cache_key  # noqa: E402
+from vector_store import fingerprint  # noqa: E402
+
+
+class _FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class _FakeDoc:
+    def __init__(self, store, key):
+        self.store, self.key = store, key
+
+    def get(self):
+        return _FakeSnapshot(self.store.get(self.key))
+
+    def set(self, data):
+        self.store[self.key] = dict(data)
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.store = {}
+
+    def document(self, key):
+        return _FakeDoc(self.store, key)
+
+
+def test_cache_key_is_document_id_safe():
+    md5 = base64.b64encode(hashlib.md5(b"photo").digest()).decode()
+    key = cache_key(md5, "AAAAAA==")
+    assert key == "md5-" + hashlib.md5(b"photo").hexdigest()
+    assert "/" not in key
+    assert cache_key(None, "AAAAAA==") == "crc32c-00000000"
+    assert cache_key(None, None) is None
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+
+def test_two_tier_hits_and_version():
+    """別インスタンスでも Firestore の段でヒットし、ターゲットが変わればミスになる"""
+    collection = _FakeCollection()
+    first = ContentCache("v1", collection=lambda: collection)
+    first.put("md5-aa", 2, {"contest_vectors_1": 0.5}, path="wedding-photos/a.jpg")
+    first.put("md5-bb", 0, None)
+
+    second = ContentCache("v1", collection=lambda: collection)
+    value, outcome = second.get("md5-aa")
+    assert outcome == "hit_remote" and value["scores"] == {"contest_vectors_1": 0.5}
+    assert second.get("md5-aa")[1] == "hit_local"
+    assert second.get("md5-bb")[0]["faceCount"] == 0
+    assert second.get(None)[1] == "miss"
+    assert second.stats()["cacheHitRate"] == 0.75
+
+    assert ContentCache("v2", collection=lambda: collection).get("md5-aa") == (None, "miss")
+
+
+def test_fingerprint_changes_with_vectors():
+    a = {"contest_vectors_1": np.ones((2, 4), dtype=np.float32)}
+    b = {"contest_vectors_1": np.full((2, 4), 2, dtype=np.float32)}
+    assert fingerprint(a) == fingerprint(dict(a))
+    assert fingerprint(a) != fingerprint(b)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+検出サイズのポリシー（fixed / adaptive / tiled）のテスト
+"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from detection_policy import DetectionPolicy, merge_faces, tile_grid  # noqa: E402
+
+
+def _face(x, y, side):
+    return SimpleNamespace(bbox=np.array([x, y, x + side, y + side], dtype=np.float32))
+
+
+class _Detector:
+    """サイズごとに決まった顔を返し、呼ばれたサイズを記録する検出器"""
+
+    def __init__(self, by_size):
+        self.by_size = by_size
+        self.calls = []
+
+    def __call__(self, img, size):
+        self.calls.append(size)
+        return self.by_size.get(size, [])
+
+
+def test_parse():
+    assert DetectionPolicy.parse(None).spec == "fixed:640"
+    assert DetectionPolicy.parse("fixed:480").base_size == 480
+    policy = DetectionPolicy.parse("adaptive")
+    assert policy.sizes == (320, 640, 960) and policy.base_size == 640
+    assert DetectionPolicy.parse("adaptive:320,480,800").spec == "adaptive:320,480,800"
+    with pytest.raises(ValueError):
+        DetectionPolicy.parse("adaptive:640,320,960")
+    with pytest.raises(ValueError):
+        DetectionPolicy.parse("tiled:640")
+
+
+def test_fixed_detects_once():
+    detect = _Detector({640: [_face(0, 0, 100)]})
+    faces, sizes = DetectionPolicy.parse("fixed:640").detect(detect, np.zeros((960, 1280, 3)))
+    assert sizes == [640] and len(faces) == 1
+
+
+def test_adaptive_large_face_stays_on_prepass():
+    """自撮りのように顔が大きければ 320 だけで済む"""
+    detect = _Detector({320: [_face(300, 200, 500)], 640: [_face(300, 200, 500)]})
+    faces, sizes = DetectionPolicy.parse("adaptive").detect(detect, np.zeros((960, 1280, 3)))
+    assert sizes == [320] and len(faces) == 1
+
+
+def test_adaptive_small_image_uses_prepass_only():
+    detect = _Detector({})
+    _, sizes = DetectionPolicy.parse("adaptive").detect(detect, np.zeros((240, 320, 3)))
+    assert sizes == [320]
+
+
+def test_adaptive_small_faces_escalate_to_base():
+    """320 で小さい顔がある（ほかにも取りこぼしていそう）なら 640 で検出し直す"""
+    group = [_face(100 * i, 400, 60) for i in range(8)]
+    detect = _Detector({320: group[:3], 640: group})
+    faces, sizes = DetectionPolicy.parse("adaptive").detect(detect, np.zeros((960, 1280, 3)))
+    assert sizes == [320, 640] and len(faces) == 8
+
+
+def test_adaptive_distant_group_escalates_to_max():
+    """640 でも小さい顔が少ししか見つからない大きな画像は 960 まで上げる"""
+    distant = [_face(100 * i, 400, 30) for i in range(6)]
+    detect = _Detector({640: distant[:2], 960: distant})
+    faces, sizes = DetectionPolicy.parse("adaptive").detect(detect, np.zeros((1280, 1920, 3)))
+    assert sizes == [320, 640, 960] and len(faces) == 6
+
+    # 顔が 1 つも無い写真（風景など）は 960 まで上げない
+    _, sizes = DetectionPolicy.parse("adaptive").detect(_Detector({}), np.zeros((1280, 1920, 3)))
+    assert sizes == [320, 640]
+
+
+class _Scene:
+    """画像上の正解の顔のうち、検出入力上で min_px 以上のものを返す検出器
+
+    タイルの検出では、渡された配列（img のビュー）の位置から元の画像での範囲を求める。
+    """
+
+    def __init__(self, img, boxes, min_px=12):
+        self.img, self.boxes, self.min_px = img, boxes, min_px
+        self.calls = []
+
+    def __call__(self, crop, size):
+        self.calls.append(size)
+        offset = crop.ctypes.data - self.img.ctypes.data
+        y0, x0 = offset // self.img.strides[0], offset % self.img.strides[0] // self.img.strides[1]
+        h, w = crop.shape[:2]
+        scale = min(1.0, size / max(h, w))
+        faces = []
+        for x1, y1, x2, y2 in self.boxes:
+            if x1 >= x0 and y1 >= y0 and x2 <= x0 + w and y2 <= y0 + h \
+                    and (x2 - x1) * scale >= self.min_px:
+                bbox = np.array([x1 - x0, y1 - y0, x2 - x0, y2 - y0], dtype=np.float32)
+                faces.append(SimpleNamespace(bbox=bbox, kps=np.tile(bbox[:2], (5, 1)),
+                                             det_score=0.9 if scale == 1.0 else 0.7))
+        return faces
+
+
+def test_tile_grid_covers_image_with_overlap():
+    grid = tile_grid((1500, 2000), 640, 160)
+    xs, ys = sorted({x for x, _ in grid}), sorted({y for _, y in grid})
+    assert xs[0] == 0 and xs[-1] == 2000 - 640 and ys[0] == 0 and ys[-1] == 1500 - 640
+    assert all(b - a <= 640 - 160 for a, b in zip(xs, xs[1:]))
+    assert tile_grid((480, 600), 640, 160) == [(0, 0)]
+
+
+def test_merge_faces_keeps_best_of_overlapping():
+    faces = [SimpleNamespace(bbox=np.array([0, 0, 10, 10.]), det_score=0.7),
+             SimpleNamespace(bbox=np.array([1, 1, 11, 11.]), det_score=0.9),
+             SimpleNamespace(bbox=np.array([50, 0, 60, 10.]), det_score=0.6)]
+    assert merge_faces(faces) == faces[1:]
+
+
+def test_tiled_finds_back_rows_of_large_group_photo():
+    """640 では後ろの列の小さい顔が見えない集合写真は、タイルに分けて全員見つける"""
+    img = np.zeros((1500, 2000, 3), dtype=np.uint8)
+    front = [(100 + 220 * i, 1100, 145 + 220 * i, 1145) for i in range(8)]    # 640 で 14px
+    back = [(30 + 48 * i, 200 + 150 * r, 60 + 48 * i, 230 + 150 * r)          # 640 で 10px
+            for r in range(4) for i in range(40)]
+    detect = _Scene(img, front + back)
+    policy = DetectionPolicy.parse("tiled")
+    assert policy.spec == "tiled:640,640" and policy.base_size == 640
+
+    faces, sizes = policy.detect(detect, img)
+    assert sizes[0] == 640 and len(sizes) == 1 + len(tile_grid(img.shape, 640, 160))
+    found = sorted(tuple(int(v) for v in f.bbox) for f in faces)
+    assert found == sorted(front + back)                       # 重なりの重複も無い
+    assert all(f.det_score == 0.9 for f in faces)              # タイルの検出が残る
+    assert all((f.kps[0] == f.bbox[:2]).all() for f in faces)  # ランドマークも元の座標
+
+
+def test_tiled_skips_tiles_unless_crowded():
+    img = np.zeros((1500, 2000, 3), dtype=np.uint8)
+    # 顔が大きい写真・顔が少ない写真はタイルに分けない
+    for boxes in ([(500, 300, 1100, 900)], [(100, 100, 145, 145), (300, 100, 345, 145)]):
+        detect = _Scene(img, boxes)
+        _, sizes = DetectionPolicy.parse("tiled").detect(detect, img)
+        assert sizes == [640]
+    # 小さい画像はタイルに分けても解像度が上がらない
+    small = np.zeros((600, 800, 3), dtype=np.uint8)
+    detect = _Scene(small, [(20 * i, 0, 20 * i + 15, 15) for i in range(10)], min_px=1)
+    _, sizes = DetectionPolicy.parse("tiled").detect(detect, small)
+    assert sizes == [640]
+    with pytest.raises(ValueError):
+        DetectionPolicy.parse("tiled:640,640,960")
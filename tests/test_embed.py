@@ -11,17 +11,14 @@ import numpy as np
 from pathlib import Path
 from PIL import Image
 import insightface
-from insightface.app import FaceAnalysis
 
 # 必要に応じてプロジェクトのルートをパスに追加
 sys.path.append(str(Path(__file__).parent.parent))
 
 @pytest.fixture
-def face_app():
-    """InsightFaceアプリのフィクスチャ"""
-    app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-    app.prepare(ctx_id=0, det_size=(640, 640))
-    return app
+def face_app(buffalo_app):
+    """InsightFaceアプリのフィクスチャ（同梱モデルを使い、ダウンロードはしない）"""
+    return buffalo_app
 
 def test_face_detection(face_app):
     """テスト画像から顔が検出されることを確認"""
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+顔の埋め込み・bbox のバイナリ形式のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from face_embeddings import FaceEmbeddingsError, decode, encode, encode_faces  # noqa: E402
+
+
+def _unit(n, seed=0):
+    x = np.random.default_rng(seed).standard_normal((n, 512)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype, max_bytes, atol", [("float16", 1050, 1e-3), ("int8", 550, 2e-2)])
+def test_roundtrip(dtype, max_bytes, atol):
+    """量子化しても類似度がほぼ変わらず、1 顔あたりのサイズが小さいことを確認"""
+    embs = _unit(5)
+    bboxes = np.arange(20, dtype=np.float32).reshape(5, 4)
+    data = encode(embs, bboxes, np.full(5, 0.9), dtype=dtype)
+    assert len(data) <= 12 + 5 * max_bytes
+
+    records = decode(data)
+    np.testing.assert_array_equal(records.bboxes, bboxes)
+    np.testing.assert_allclose(records.det_scores, 0.9, rtol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(records.embeddings, axis=1), 1, atol=1e-5)
+    np.testing.assert_allclose(records.embeddings @ embs.T, embs @ embs.T, atol=atol)
+
+
+def test_encode_faces_restores_original_coordinates():
+    class _Face:
+        bbox = np.array([10, 20, 30, 40], dtype=np.float32)
+        det_score = 0.8
+
+    records = decode(encode_faces([_Face()], _unit(1), scale=0.5))
+    np.testing.assert_array_equal(records.bboxes, [[20, 40, 60, 80]])
+
+
+def test_empty_and_corrupt():
+    assert decode(encode(np.zeros((0, 512), dtype=np.float32))).embeddings.shape == (0, 512)
+    data = encode(_unit(2))
+    with pytest.raises(FaceEmbeddingsError):
+        decode(data[:-1])
+    with pytest.raises(FaceEmbeddingsError):
+        decode(b"XXXX" + data[4:])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+認識の前に顔を絞り込む条件（face_filter）のテスト
+"""
+
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from face_filter import FaceFilter, estimate_yaw, sharpness  # noqa: E402
+
+# 112x112 の標準ランドマーク（face_align.arcface_dst 相当）
+_KPS = np.array([[38.3, 51.7], [73.5, 51.5], [56.0, 71.7],
+                 [41.5, 92.4], [70.7, 92.2]], dtype=np.float32)
+
+
+def _face(x, y, side, score=0.9, kps=_KPS):
+    return SimpleNamespace(bbox=np.array([x, y, x + side, y + side], dtype=np.float32),
+                           det_score=score, kps=kps * side / 112 + [x, y])
+
+
+def test_parse_and_spec():
+    assert not FaceFilter.parse(None).enabled   # 既定では絞り込まない
+    assert not FaceFilter.parse("").enabled
+    f = FaceFilter.parse("min_score=0.7, max_yaw=45")
+    assert (f.min_score, f.max_yaw, f.min_size) == (0.7, 45.0, None)
+    assert f.spec == "min_score=0.7,max_yaw=45"
+    with pytest.raises(ValueError):
+        FaceFilter.parse("min_area=3")
+
+
+def test_size_and_score():
+    img = np.zeros((960, 1280, 3), dtype=np.uint8)
+    faces = [_face(0, 0, 200), _face(300, 0, 12), _face(600, 0, 200, score=0.55)]
+    stats = {}
+    kept = FaceFilter(min_size=0.015, min_score=0.6).apply(img, faces, stats)
+    assert kept == faces[:1]
+    assert stats == {"facesDetected": 3, "facesFiltered": 2,
+                     "filtered_small": 1, "filtered_low_score": 1}
+    assert FaceFilter().apply(img, faces) == faces     # 条件なしなら全部残す
+
+
+def test_yaw():
+    assert estimate_yaw(_KPS) < 5
+    turned = _KPS.copy()
+    turned[2, 0] = _KPS[1, 0] - 1                       # 鼻が右目の近くまで寄った横顔
+    assert estimate_yaw(turned) > 60
+
+    img = np.zeros((960, 1280, 3), dtype=np.uint8)
+    faces = [_face(0, 0, 200), _face(300, 0, 200, kps=turned)]
+    assert FaceFilter(max_yaw=45).apply(img, faces) == faces[:1]
+
+
+def test_blur():
+    rng = np.random.default_rng(0)
+    img = np.zeros((400, 800, 3), dtype=np.uint8)
+    img[:, :400] = rng.integers(0, 256, (400, 400, 3))  # くっきり（高周波が多い）
+    img[:, 400:] = 128                                  # のっぺり（ぼやけた顔の代わり）
+    sharp, flat = _face(50, 50, 300), _face(450, 50, 300)
+    assert sharpness(img, sharp.bbox) > 1000 > sharpness(img, flat.bbox)
+    assert FaceFilter(min_sharpness=20).apply(img, [sharp, flat]) == [sharp]
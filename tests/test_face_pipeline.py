@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+検出 → アライメント → バッチ認識パイプラインのテスト
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+import face_pipeline  # noqa: E402
+
+BKP_MAIN = Path(__file__).parent.parent / "functions_bkp" / "main.py"
+
+# 112x112 の標準ランドマーク（face_align.arcface_dst 相当）
+_KPS = np.array([[38.3, 51.7], [73.5, 51.5], [56.0, 71.7],
+                 [41.5, 92.4], [70.7, 92.2]], dtype=np.float32)
+
+
+class _StubDet:
+    """画像の左上ピクセル値の数だけ顔を返す検出モデル"""
+
+    def detect(self, img, max_num=0, metric="default"):
+        n = int(img[0, 0, 0])
+        h, w = img.shape[:2]
+        bboxes = np.array([[0, 0, w / 2, h / 2, 0.9]] * n, dtype=np.float32).reshape(n, 5)
+        kpss = np.stack([_KPS] * n) if n else np.zeros((0, 5, 2), dtype=np.float32)
+        return bboxes, kpss
+
+
+class _StubRec:
+    input_size = (112, 112)
+
+    def __init__(self):
+        self.batches = []
+
+    def get_feat(self, imgs):
+        self.batches.append(len(imgs))
+        # 各顔の平均輝度を埋め込みの 1 成分に入れる
+        feats = np.ones((len(imgs), 512), dtype=np.float32)
+        feats[:, 0] = [np.mean(im) for im in imgs]
+        return feats
+
+
+class _StubApp:
+    def __init__(self):
+        self.det_model = _StubDet()
+        self.models = {"detection": self.det_model, "recognition": _StubRec()}
+
+
+def _load_bkp():
+    """functions_bkp/main.py を web-ui/functions の main と別名で読み込む"""
+    spec = importlib.util.spec_from_file_location("functions_bkp_main", BKP_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _image(n_faces, value):
+    img = np.full((112, 112, 3), value, dtype=np.uint8)
+    img[0, 0, 0] = n_faces
+    return img
+
+
+def test_embed_images_runs_one_recognition_batch():
+    """全画像の顔が 1 回の認識バッチで処理され、画像ごとに正しく分配されることを確認"""
+    app = _StubApp()
+    imgs = [_image(2, 10), _image(0, 20), _image(3, 30)]
+
+    results = face_pipeline.embed_images(app, imgs)
+
+    assert app.models["recognition"].batches == [5]
+    assert [len(faces) for faces, _ in results] == [2, 0, 3]
+    assert [embs.shape for _, embs in results] == [(2, 512), (0, 512), (3, 512)]
+    for faces, embs in results:
+        np.testing.assert_allclose(np.linalg.norm(embs, axis=1), 1.0, atol=1e-5)
+        for face, emb in zip(faces, embs):
+            assert face.embedding is not None
+            np.testing.assert_array_equal(face.embedding, emb)
+
+    # 画像ごとの輝度の違いが埋め込みに残っている（顔の取り違えが無い）
+    first = results[0][1][:, 0]
+    last = results[2][1][:, 0]
+    assert np.all(first < last.min())
+
+
+def test_embed_images_splits_large_batches():
+    """batch_size を超える顔数は複数バッチに分けて処理されることを確認"""
+    app = _StubApp()
+    results = face_pipeline.embed_images(app, [_image(5, 10)], batch_size=2)
+
+    assert app.models["recognition"].batches == [2, 2, 1]
+    assert results[0][1].shape == (5, 512)
+
+
+class _StubHires:
+    """縮小率 0.5 でデコードされた画像の代わり"""
+    downscaled = True
+    scale = 0.5
+
+    def __init__(self, full):
+        self.full = full
+        self.calls = 0
+
+    def full_resolution(self):
+        self.calls += 1
+        return self.full
+
+
+def test_small_faces_are_aligned_from_full_resolution():
+    """縮小画像で小さい顔は元解像度の画像から切り出されることを確認"""
+    app = _StubApp()
+    small = _image(1, 10)
+    hires = _StubHires(np.full((224, 224, 3), 200, dtype=np.uint8))
+
+    faces, embs = face_pipeline.embed_image(app, small, hires=hires)
+
+    assert hires.calls == 1
+    # 元解像度の画像（輝度 200）から切り出されている
+    assert app.models["recognition"].batches == [1]
+    _, plain = face_pipeline.embed_image(_StubApp(), small)
+    assert embs[0, 0] > plain[0, 0]
+
+
+def test_face_filter_skips_recognition():
+    """絞り込みで除いた顔は認識されず、件数が stats に記録されることを確認"""
+    from face_filter import FaceFilter
+
+    app = _StubApp()
+    stats = {}
+    results = face_pipeline.embed_images(app, [_image(2, 10), _image(3, 30)],
+                                         face_filter=FaceFilter(min_score=0.95), stats=stats)
+
+    assert app.models["recognition"].batches == []
+    assert [len(faces) for faces, _ in results] == [0, 0]
+    assert stats == {"facesDetected": 5, "facesFiltered": 5, "filtered_low_score": 5}
+
+    # 条件を満たす顔はそのまま認識される
+    faces, _ = face_pipeline.embed_image(app, _image(2, 10), face_filter=FaceFilter(min_score=0.5))
+    assert len(faces) == 2 and app.models["recognition"].batches == [2]
+
+
+def test_embed_image_matches_per_face_path(buffalo_app):
+    """バッチ認識の結果が FaceAnalysis.get() の顔ごとの結果と一致することを確認"""
+    image_path = Path(__file__).parent / "assets" / "test_image.jpg"
+    img = np.asarray(Image.open(image_path).convert("RGB"))
+
+    expected_faces = buffalo_app.get(img)
+    assert expected_faces, "テスト画像から顔が検出されませんでした"
+    expected = np.stack(
+        [f.embedding / np.linalg.norm(f.embedding) for f in expected_faces]
+    )
+
+    faces, embs = face_pipeline.embed_image(buffalo_app, img)
+
+    assert len(faces) == len(expected_faces)
+    for face, ref in zip(faces, expected_faces):
+        np.testing.assert_allclose(face.bbox, ref.bbox, atol=1e-3)
+    np.testing.assert_allclose(embs, expected, atol=1e-4)
+
+
+def test_bkp_embed_faces_runs_one_recognition_batch():
+    """functions_bkp の photo_uploaded も全顔を 1 回の認識バッチで処理することを確認"""
+    bkp = _load_bkp()
+    bkp.app = _StubApp()
+
+    faces, embs = bkp.embed_faces(_image(4, 10))
+    assert len(faces) == 4 and embs.shape == (4, 512)
+    assert bkp.app.models["recognition"].batches == [4]
+    np.testing.assert_allclose(np.linalg.norm(embs, axis=1), 1.0, atol=1e-5)
+
+    faces, embs = bkp.embed_faces(_image(0, 10))
+    assert faces == [] and embs.shape == (0, 512)
+    assert bkp.app.models["recognition"].batches == [4]
+
+
+def test_bkp_embed_faces_matches_per_face_path(buffalo_app):
+    """functions_bkp のバッチ認識が FaceAnalysis.get() の顔ごとの結果と一致することを確認"""
+    bkp = _load_bkp()
+    bkp.app = buffalo_app
+    image_path = Path(__file__).parent / "assets" / "test_image.jpg"
+    img = np.asarray(Image.open(image_path).convert("RGB"))
+
+    expected_faces = buffalo_app.get(img)
+    assert expected_faces, "テスト画像から顔が検出されませんでした"
+    expected = np.stack(
+        [f.embedding / np.linalg.norm(f.embedding) for f in expected_faces]
+    )
+
+    faces, embs = bkp.embed_faces(img)
+
+    assert len(faces) == len(expected_faces)
+    np.testing.assert_allclose(embs, expected, atol=1e-4)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Firestore のグループコミット（group_commit.py）のテスト
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(ROOT / "benchmarks"))
+
+from fakes import FakeFirestoreClient  # noqa: E402
+from group_commit import GroupCommit  # noqa: E402
+
+
+def test_coalesce_and_flush_in_batches():
+    """同じドキュメントへの書き込みが 1 件にまとまり、batch_max 件ずつコミットされることを確認"""
+    db = FakeFirestoreClient()
+    committed = []
+    writer = GroupCommit(lambda: db, max_ops=100, max_delay=60, after_commit=committed.extend,
+                         batch_max=2)
+    scores = db.collection("contestScores")
+    writer.set(scores.document("a"), {"faceCount": 1, "scores": {"c1": 0.1}})
+    writer.set(scores.document("a"), {"scores": {"c2": 0.2}}, merge=True)
+    writer.set(scores.document("b"), {"faceCount": 9})
+    writer.set(scores.document("b"), {"faceCount": 2})
+    writer.set(scores.document("c"), {"faceCount": 3})
+    assert writer.pending == 3 and db.commits == 0
+
+    assert writer.flush() == 3
+    assert db.commits == 2
+    assert db.docs["contestScores/a"] == {"faceCount": 1, "scores": {"c1": 0.1, "c2": 0.2}}
+    assert db.docs["contestScores/b"] == {"faceCount": 2}
+    assert [ref.id for ref, _ in committed] == ["a", "b", "c"]
+    assert writer.stats() == {"writesQueued": 5, "writesCoalesced": 2, "writesCommitted": 3,
+                              "writeCommits": 2, "writesPending": 0}
+
+
+def test_sync_waits_for_own_writes_and_groups_concurrent_requests():
+    """同時に sync() した 8 リクエストの書き込みが 1 回のコミットになり、返る前にコミット済み"""
+    db = FakeFirestoreClient()
+    writer = GroupCommit(lambda: db, max_ops=8, max_delay=5)
+    collection = db.collection("contestScores")
+    seen = {}
+
+    def request(i):
+        writer.set(collection.document(f"p{i}"), {"n": i})
+        writer.sync()
+        seen[i] = f"contestScores/p{i}" in db.docs   # 返った時点でコミットされている
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert seen == {i: True for i in range(8)}
+    assert db.commits == 1 and writer.pending == 0
+
+    # max_delay を過ぎれば 1 件だけでもコミットする
+    sync = GroupCommit(lambda: db, max_delay=0.01)
+    sync.set(collection.document("q"), {"n": 1})
+    sync.sync()
+    assert db.docs["contestScores/q"] == {"n": 1}
+    sync.sync()   # 何も積んでいなければすぐ返る
+
+
+def test_failed_commit_raises_in_every_waiting_request():
+    db = FakeFirestoreClient()
+    original = db._write
+
+    def broken(ops):
+        raise RuntimeError("unavailable")
+
+    db._write = broken
+    writer = GroupCommit(lambda: db, max_ops=2, max_delay=5)
+    collection = db.collection("contestScores")
+    errors = []
+
+    def request(i):
+        writer.set(collection.document(f"p{i}"), {"n": i})
+        try:
+            writer.sync()
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+    assert len(errors) == 2 and writer.counts["failed"] == 2 and writer.pending == 0
+
+    # 失敗は次のバッチに持ち越さない
+    db._write = original
+    gen = writer.set(collection.document("p9"), {"n": 9})
+    writer.close()
+    writer.sync(gen)
+    assert db.docs["contestScores/p9"] == {"n": 9}
+    with pytest.raises(RuntimeError):
+        writer.sync(gen - 1)
+
+
+def test_sync_raises_when_an_earlier_batch_of_the_request_failed():
+    """書き込みが 2 つのバッチに分かれ、先のバッチだけ失敗したリクエストも例外になる
+
+    同じ後のバッチだけに書き込んだリクエストは成功する。
+    """
+    db = FakeFirestoreClient()
+    original = db._write
+    started, release = threading.Event(), threading.Event()
+
+    def failing(ops):
+        started.set()
+        release.wait(5)
+        raise RuntimeError("commit failed")
+
+    db._write = failing
+    writer = GroupCommit(lambda: db, max_ops=100, max_delay=0.05)
+    collection = db.collection("contestScores")
+
+    # リクエスト A のスコアが入ったバッチのコミット中に、A の埋め込みと B の書き込みが次のバッチに入る
+    first_a = writer.set(collection.document("a"), {"n": 1})
+    flusher = threading.Thread(target=writer.close)
+    flusher.start()
+    assert started.wait(5)
+    last_a = writer.set(db.collection("faceEmbeddings").document("a"), {"n": 1})
+    gen_b = writer.set(collection.document("b"), {"n": 2})
+    assert last_a == gen_b == first_a + 1
+
+    results = {}
+
+    def request(name, gen, since):
+        try:
+            writer.sync(gen, since=since)
+            results[name] = "ok"
+        except RuntimeError as e:
+            results[name] = str(e)
+
+    threads = [threading.Thread(target=request, args=("a", last_a, first_a)),
+               threading.Thread(target=request, args=("b", gen_b, None))]
+    for t in threads:
+        t.start()
+    db._write = original   # 失敗するのはコミット中の最初のバッチだけ
+    release.set()
+    for t in threads + [flusher]:
+        t.join(timeout=10)
+
+    assert results == {"a": "commit failed", "b": "ok"}
+    assert "contestScores/a" not in db.docs
+    assert db.docs["faceEmbeddings/a"] == {"n": 1} and db.docs["contestScores/b"] == {"n": 2}
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+score_image / score_object / score_images_batch（main.py）のテスト
+
+モデルは benchmarks/fakes.py の FakeFaceApp、Storage / Firestore はフェイクのクライアントを
+clients.registry に登録して使う（ローカルの負荷試験と同じ差し替え方）。
+"""
+
+import gc
+import io
+import sys
+import threading
+import time
+import weakref
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(ROOT / "benchmarks"))
+
+import clients  # noqa: E402
+import main  # noqa: E402
+from clients import registry  # noqa: E402
+from content_cache import cache_key  # noqa: E402
+from fakes import (FakeFaceApp, FakeFaceModel, FakeFirestoreClient,  # noqa: E402
+                   FakeStorageClient, transactional)
+from inference_pool import InferenceBusyError, InferencePool  # noqa: E402
+from photo_ids import photo_doc_id  # noqa: E402
+
+
+class _CountingApp(FakeFaceApp):
+    """検出を呼んだ回数を数えるフェイクのモデル"""
+
+    def __init__(self, faces_per_image=3):
+        super().__init__(faces_per_image=faces_per_image, detect_ms=0, embed_ms_per_face=0)
+        self.detect_calls = 0
+        detect = self.det_model.detect
+
+        def counting(*args, **kwargs):
+            self.detect_calls += 1
+            return detect(*args, **kwargs)
+
+        self.det_model.detect = counting
+
+
+class _FakeQueue:
+    def __init__(self):
+        self.tasks = []
+
+    def enqueue(self, data):
+        self.tasks.append(data)
+
+
+def _jpeg(seed):
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (96, 128, 3), dtype=np.uint8)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def env(monkeypatch):
+    """フェイクのクライアントとモデルを登録する（テストの後で本物の生成関数に戻す）"""
+    storage = FakeStorageClient()
+    db = FakeFirestoreClient(write_latency_ms=30)
+    queue = _FakeQueue()
+    app = _CountingApp()
+    registry.register("storage", lambda: storage)
+    registry.register("firestore", lambda: db)
+    registry.register("transactional", lambda: transactional)
+    registry.register("batch_queue", lambda: queue)
+    monkeypatch.setattr(main, "_face_model", FakeFaceModel(app))
+    yield SimpleNamespace(storage=storage, db=db, queue=queue, app=app)
+    main._writer.flush()
+    registry.register("storage", clients._storage_factory)
+    registry.register("firestore", clients._firestore_factory)
+    registry.register("transactional", clients._transactional_factory)
+    registry.register("batch_queue", main._batch_queue_factory)
+
+
+def _upload(env, name, seed, user="guest"):
+    path = f"wedding-photos/{name}"
+    env.storage.add_blob(main.BUCKET_NAME, path, _jpeg(seed), {"userName": user})
+    return path, cache_key(env.storage.bucket(main.BUCKET_NAME).get_blob(path).md5_hash)
+
+
+def _event(env, path):
+    blob = env.storage.bucket(main.BUCKET_NAME).get_blob(path)
+    return SimpleNamespace(data=SimpleNamespace(
+        bucket=main.BUCKET_NAME, name=path, metadata=blob.metadata,
+        md5_hash=blob.md5_hash, crc32c=None))
+
+
+def test_score_object_commits_before_returning(env):
+    """スコアと埋め込みが返る前にコミットされ、leaderboards にも反映されることを確認"""
+    path, key = _upload(env, "commit.jpg", seed=1)
+
+    scores = main.score_object(main.BUCKET_NAME, path, "guest", content_key=key)
+
+    doc_id = photo_doc_id(path)
+    saved = env.db.docs[f"contestScores/{doc_id}"]
+    assert saved == {"path": path, "faceCount": 3, "scores": scores, "userName": "guest"}
+    assert set(scores) == set(main._target_sets)
+    assert env.db.docs[f"faceEmbeddings/{doc_id}"]["path"] == path
+    assert f"scoreCache/{key}" in env.db.docs
+    for contest in scores:
+        top = env.db.docs[f"leaderboards/{contest}"]["top"]
+        assert [entry["id"] for entry in top] == [doc_id]
+    assert env.app.detect_calls == 1
+
+
+def test_cache_hit_skips_download_and_inference(env):
+    """同じ内容の画像はダウンロードも推論もせず、キャッシュのスコアを書き込む"""
+    path, key = _upload(env, "first.jpg", seed=2)
+    scores = main.score_object(main.BUCKET_NAME, path, "guest", content_key=key)
+
+    # 別のパスに同じ内容。Blob が無くてもキャッシュから書ける
+    copy = "wedding-photos/copy.jpg"
+    assert main.score_object(main.BUCKET_NAME, copy, "other", content_key=key) == scores
+    assert env.app.detect_calls == 1
+    saved = env.db.docs[f"contestScores/{photo_doc_id(copy)}"]
+    assert saved == {"path": copy, "faceCount": 3, "scores": scores, "userName": "other"}
+
+
+def test_removed_contest_is_dropped_on_rescore(env):
+    """保存済みのドキュメントに残っている削除済みコンテストのスコアは上書きで消える"""
+    path, key = _upload(env, "rescore.jpg", seed=3)
+    doc_path = f"contestScores/{photo_doc_id(path)}"
+    env.db.docs[doc_path] = {"path": path, "faceCount": 3, "userName": "guest",
+                             "scores": {"removed_contest": 0.9}}
+
+    scores = main.score_object(main.BUCKET_NAME, path, "guest", content_key=key)
+
+    assert "removed_contest" not in scores
+    assert env.db.docs[doc_path]["scores"] == scores
+    assert "leaderboards/removed_contest" not in env.db.docs
+
+
+def test_no_faces_writes_only_cache(env):
+    """顔が無い画像は contestScores に書かず、キャッシュのエントリだけコミットしてから返る"""
+    env.app.faces_per_image = 0
+    path, key = _upload(env, "empty.jpg", seed=4)
+
+    assert main.score_object(main.BUCKET_NAME, path, "guest", content_key=key) is None
+
+    doc_id = photo_doc_id(path)
+    assert f"contestScores/{doc_id}" not in env.db.docs
+    assert f"faceEmbeddings/{doc_id}" not in env.db.docs
+    assert env.db.docs[f"scoreCache/{key}"]["faceCount"] == 0
+    assert env.app.detect_calls == 1
+
+
+def test_score_image_defers_busy_photos_to_batch_queue(env, monkeypatch):
+    """推論プールが埋まっていたら、写真をタスクキュー（score_images_batch）に回す"""
+    path, _ = _upload(env, "busy.jpg", seed=5)
+
+    def busy(*args, **kwargs):
+        raise InferenceBusyError("queue full")
+
+    monkeypatch.setattr(main, "score_object", busy)
+    main.score_image.__wrapped__(_event(env, path))
+
+    assert env.queue.tasks == [{"bucket": main.BUCKET_NAME, "paths": [path]}]
+    assert f"contestScores/{photo_doc_id(path)}" not in env.db.docs
+
+
+def test_score_image_passes_user_name_and_content_key(env):
+    path, key = _upload(env, "event.jpg", seed=6, user="bride")
+
+    main.score_image.__wrapped__(_event(env, path))
+
+    saved = env.db.docs[f"contestScores/{photo_doc_id(path)}"]
+    assert saved["userName"] == "bride"
+    assert f"scoreCache/{key}" in env.db.docs
+    assert env.queue.tasks == []
+
+
+def test_score_images_batch_writes_every_photo(env):
+    """まとめて処理した写真のスコアがすべてコミットされ、画像以外のパスは除かれる"""
+    paths = [_upload(env, f"batch{i}.jpg", seed=10 + i)[0] for i in range(3)]
+
+    result = main.score_images_batch.__wrapped__(SimpleNamespace(
+        data={"bucket": main.BUCKET_NAME, "paths": paths + ["wedding-photos/note.txt"]}))
+
+    assert result == {"processed": 3, "saved": 3}
+    assert env.app.detect_calls == 3
+    for path in paths:
+        saved = env.db.docs[f"contestScores/{photo_doc_id(path)}"]
+        assert saved["faceCount"] == 3 and set(saved["scores"]) == set(main._target_sets)
+
+
+def test_score_images_batch_releases_images_before_recognition(env, monkeypatch):
+    """認識のバッチを実行する時点で、デコードした画像（元解像度の配列とバッファ）を手放している"""
+    paths = [_upload(env, f"release{i}.jpg", seed=20 + i)[0] for i in range(4)]
+    images = []
+    iter_images = main.iter_images
+
+    def recording(*args, **kwargs):
+        for blob_path, image, user_name in iter_images(*args, **kwargs):
+            if image is not None:
+                image.full_resolution()   # 小さい顔を元解像度から切り出した状態にする
+                images.append(weakref.ref(image))
+            yield blob_path, image, user_name
+
+    alive = []
+    recognizer = env.app.models["recognition"]
+    get_feat = recognizer.get_feat
+
+    def checking(imgs):
+        gc.collect()
+        alive.append(sum(ref() is not None for ref in images))
+        return get_feat(imgs)
+
+    monkeypatch.setattr(main, "iter_images", recording)
+    monkeypatch.setattr(recognizer, "get_feat", checking)
+    result = main.score_images_batch.__wrapped__(SimpleNamespace(
+        data={"bucket": main.BUCKET_NAME, "paths": paths}))
+
+    assert result == {"processed": 4, "saved": 4}
+    assert len(images) == 4 and alive == [0]
+
+
+def test_busy_photos_are_deferred_with_default_configuration(env, monkeypatch):
+    """既定の設定で推論が詰まると、空きを待ち切れない写真がタスクキューに回る
+
+    待ち時間だけ短くした、本番の既定（vCPU 数のワーカー、INFERENCE_QUEUE_SIZE）と
+    同じ大きさのプールに、FUNCTION_CONCURRENCY 件のイベントを同時に送る。
+    """
+    endpoint = main.score_image.__firebase_endpoint__
+    assert endpoint.timeoutSeconds == main.SCORE_IMAGE_TIMEOUT_SEC
+    assert endpoint.concurrency == main.FUNCTION_CONCURRENCY
+    assert main.INFERENCE_QUEUE_TIMEOUT * 4 <= main.SCORE_IMAGE_TIMEOUT_SEC
+    assert main.FUNCTION_CPU + main.INFERENCE_QUEUE_SIZE < main.FUNCTION_CONCURRENCY
+
+    pool = InferencePool(workers=main.FUNCTION_CPU, queue_size=main.INFERENCE_QUEUE_SIZE,
+                         queue_timeout=0.2)
+    monkeypatch.setattr(main, "_inference_pool", pool)
+    release = threading.Event()
+    detect = env.app.det_model.detect
+
+    def slow(*args, **kwargs):
+        release.wait(5)
+        return detect(*args, **kwargs)
+
+    env.app.det_model.detect = slow
+    paths = [_upload(env, f"crowd{i}.jpg", seed=30 + i)[0]
+             for i in range(main.FUNCTION_CONCURRENCY)]
+    threads = [threading.Thread(target=main.score_image.__wrapped__, args=(_event(env, p),))
+               for p in paths]
+    for t in threads:
+        t.start()
+    expected = main.FUNCTION_CONCURRENCY - main.FUNCTION_CPU - main.INFERENCE_QUEUE_SIZE
+    deadline = time.monotonic() + 5
+    while len(env.queue.tasks) < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(timeout=10)
+    pool.shutdown()
+
+    deferred = {task["paths"][0] for task in env.queue.tasks}
+    scored = {p for p in paths if f"contestScores/{photo_doc_id(p)}" in env.db.docs}
+    assert len(deferred) == expected
+    assert scored | deferred == set(paths) and not scored & deferred
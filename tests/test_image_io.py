@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+画像の縮小デコードと EXIF 回転のテスト
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from image_io import decode_image  # noqa: E402
+
+TEST_IMAGE = Path(__file__).parent / "assets" / "test_image.jpg"
+
+
+def _jpeg_bytes(size, orientation=None):
+    img = Image.open(TEST_IMAGE).convert("RGB").resize(size)
+    buf = io.BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        img.save(buf, "JPEG", quality=90, exif=exif)
+    else:
+        img.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def test_small_image_is_not_downscaled():
+    """max_side より小さい画像はそのまま（従来と同じ配列）になることを確認"""
+    decoded = decode_image(str(TEST_IMAGE), max_side=1280)
+    expected = np.asarray(Image.open(TEST_IMAGE).convert("RGB"))
+
+    assert not decoded.downscaled
+    np.testing.assert_array_equal(decoded.array, expected)
+    assert decoded.full_resolution() is decoded.array
+
+
+def test_large_jpeg_is_downscaled_at_decode():
+    """大きな JPEG は長辺 max_side 以上を保ったまま縮小デコードされることを確認"""
+    data = _jpeg_bytes((6000, 3375))
+    decoded = decode_image(data, max_side=1280)
+
+    h, w, _ = decoded.array.shape
+    assert 1280 <= max(h, w) < 6000
+    assert decoded.scale == w / 6000
+    assert decoded.full_resolution().shape == (3375, 6000, 3)
+
+
+def test_exif_orientation_is_applied():
+    """EXIF Orientation=6（90度回転）が縮小時も元解像度でも適用されることを確認"""
+    data = _jpeg_bytes((4000, 2250), orientation=6)
+    decoded = decode_image(data, max_side=1280)
+
+    assert decoded.original_size == (2250, 4000)
+    h, w, _ = decoded.array.shape
+    assert h > w
+    assert decoded.full_resolution().shape == (4000, 2250, 3)
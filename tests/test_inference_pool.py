@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上限付き推論プールのテスト
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from inference_pool import InferenceBusyError, InferencePool  # noqa: E402
+
+
+def test_concurrency_is_bounded_by_workers():
+    """同時に実行される推論はワーカー数までであることを確認"""
+    pool = InferencePool(workers=2, queue_size=10)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def task():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return 1
+
+    futures = [pool.submit(task) for _ in range(8)]
+    assert sum(f.result() for f in futures) == 8
+    assert peak[0] == 2
+    assert pool.pending == 0
+    pool.shutdown()
+
+
+def test_full_queue_raises_busy_error():
+    """実行中 + 待機中が上限に達したら InferenceBusyError になることを確認"""
+    pool = InferencePool(workers=1, queue_size=1, queue_timeout=0.05)
+    release = threading.Event()
+
+    first = pool.submit(release.wait)
+    second = pool.submit(release.wait)
+    with pytest.raises(InferenceBusyError):
+        pool.submit(release.wait)
+
+    release.set()
+    assert first.result() and second.result()
+    # 空きができれば再び受け付ける
+    assert pool.run(lambda: "ok") == "ok"
+    pool.shutdown()
+
+
+def test_exception_releases_slot():
+    """推論で例外が出ても枠が解放されることを確認"""
+    pool = InferencePool(workers=1, queue_size=0, queue_timeout=0.05)
+
+    def fail():
+        raise ValueError("boom")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            pool.run(fail)
+    assert pool.pending == 0
+    pool.shutdown()
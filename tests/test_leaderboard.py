@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+コンテストごとのランキング集計（leaderboards）のテスト
+"""
+
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(ROOT / "benchmarks"))
+
+from fakes import FakeFirestoreClient, transactional  # noqa: E402
+from leaderboard import apply_records, build_boards, rebuild, update_leaderboards  # noqa: E402
+
+
+def _record(user, scores, faces=1):
+    return {"path": f"wedding-photos/{user}.jpg", "userName": user, "faceCount": faces,
+            "scores": scores}
+
+
+def _records(n=40, seed=0):
+    rng = random.Random(seed)
+    return [(f"photo{i:03d}", _record(f"guest{rng.randrange(8)}",
+                                      {"c1": rng.random(), "c2": rng.random()}))
+            for i in range(n)]
+
+
+def test_build_boards_top_and_user_best():
+    records = _records()
+    boards = build_boards(records, top_n=5)
+
+    c1 = sorted(records, key=lambda r: -r[1]["scores"]["c1"])
+    assert [e["id"] for e in boards["c1"]["top"]] == [doc_id for doc_id, _ in c1[:5]]
+
+    users = boards["c1"]["users"]
+    assert len(users) == min(5, len({r["userName"] for _, r in records}))
+    for e in users:
+        assert e["score"] == max(r["scores"]["c1"] for _, r in records
+                                 if r["userName"] == e["userName"])
+    assert [e["score"] for e in users] == sorted((e["score"] for e in users), reverse=True)
+
+
+def test_incremental_matches_full_rebuild():
+    """1 枚ずつ反映した結果が、全件からの集計と一致することを確認"""
+    records = _records()
+    boards = {}
+    for record in records:
+        boards.update(apply_records(boards, [record], top_n=5))
+    assert boards == build_boards(records, top_n=5)
+
+    # 変化しない写真（上位にもユーザーのベストにも入らない）なら何も返さない
+    low = ("photo999", _record("guest0", {"c1": -1.0, "c2": -1.0}))
+    assert apply_records(boards, [low], top_n=5) == {}
+
+
+def test_rescored_photo_replaces_old_entry():
+    boards = build_boards([("a", _record("alice", {"c1": 0.9})),
+                           ("b", _record("bob", {"c1": 0.5}))])
+    boards.update(apply_records(boards, [("a", _record("alice", {"c1": 0.1}))]))
+    assert [(e["id"], e["score"]) for e in boards["c1"]["top"]] == [("b", 0.5), ("a", 0.1)]
+    assert [e["userName"] for e in boards["c1"]["users"]] == ["bob", "alice"]
+
+
+def test_lower_rescore_keeps_users_other_best_photo():
+    """ベストでない写真が下がっても上がっても、ユーザーのベストはいちばん高い写真のまま"""
+    boards = build_boards([("a", _record("alice", {"c1": 0.9})),
+                           ("a2", _record("alice", {"c1": 0.5}))])
+    boards.update(apply_records(boards, [("a2", _record("alice", {"c1": 0.3}))]))
+    assert [(e["id"], e["score"]) for e in boards["c1"]["users"]] == [("a", 0.9)]
+    boards.update(apply_records(boards, [("a2", _record("alice", {"c1": 0.95}))]))
+    assert [(e["id"], e["score"]) for e in boards["c1"]["users"]] == [("a2", 0.95)]
+
+
+def test_dropped_best_photo_is_reselected_from_contest_scores():
+    """ベストの写真が下がったら、そのユーザーの contestScores からベストを選び直す"""
+    db = FakeFirestoreClient()
+    records = [("a", _record("alice", {"c1": 0.9})), ("a2", _record("alice", {"c1": 0.5})),
+               ("b", _record("bob", {"c1": 0.7}))]
+    for doc_id, record in records:
+        db.collection("contestScores").document(doc_id).set(record)
+        update_leaderboards(db, [(doc_id, record)], transactional=transactional)
+
+    rescored = ("a", _record("alice", {"c1": 0.1}))
+    update_leaderboards(db, [rescored], transactional=transactional)
+    users = db.docs["leaderboards/c1"]["users"]
+    assert [(e["id"], e["score"]) for e in users] == [("b", 0.7), ("a2", 0.5)]
+
+    db.collection("contestScores").document("a").set(rescored[1])
+    assert {k: v for k, v in db.docs.items() if k.startswith("leaderboards/")} == \
+        {f"leaderboards/{c}": b for c, b in rebuild(db, dry_run=True).items()}
+
+
+def test_user_board_is_truncated_to_top_n():
+    records = [(f"p{i}", _record(f"guest{i}", {"c1": i / 10})) for i in range(10)]
+    boards = build_boards(records, top_n=3)
+    assert [e["userName"] for e in boards["c1"]["users"]] == ["guest9", "guest8", "guest7"]
+    boards.update(apply_records(boards, [("p0", _record("guest0", {"c1": 1.0}))], top_n=3))
+    assert [e["userName"] for e in boards["c1"]["users"]] == ["guest0", "guest9", "guest8"]
+
+
+def test_photos_without_user_name_stay_out_of_user_board():
+    """userName の無い写真は上位には入るが、ユーザーごとのベストにはまとめない"""
+    records = [("a", _record("alice", {"c1": 0.5})),
+               ("b", {**_record("x", {"c1": 0.9}), "userName": None}),
+               ("c", {**_record("x", {"c1": 0.8}), "userName": ""})]
+    boards = build_boards(records)
+    assert [e["id"] for e in boards["c1"]["top"]] == ["b", "c", "a"]
+    assert [e["id"] for e in boards["c1"]["users"]] == ["a"]
+    boards.update(apply_records(boards, records[1:]))
+    assert [e["id"] for e in boards["c1"]["users"]] == ["a"]
+
+
+def test_transactional_update_and_rebuild():
+    db = FakeFirestoreClient()
+    records = _records(20)
+    for doc_id, record in records:
+        db.collection("contestScores").document(doc_id).set(record)
+        update_leaderboards(db, [(doc_id, record)], top_n=5, transactional=transactional)
+    incremental = {k: v for k, v in db.docs.items() if k.startswith("leaderboards/")}
+
+    db.collection("leaderboards").document("old_contest").set({"top": [], "users": []})
+    rebuild(db, top_n=5)
+    assert "leaderboards/old_contest" not in db.docs
+    assert {k: v for k, v in db.docs.items() if k.startswith("leaderboards/")} == incremental
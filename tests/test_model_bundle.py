@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+同梱モデルの配置とチェックサムの確認のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+import model_bundle  # noqa: E402
+from model_bundle import ModelBundleError, model_dir, vendor, verify  # noqa: E402
+from model_manager import FaceModel  # noqa: E402
+
+
+@pytest.fixture
+def source(tmp_path):
+    """展開済みの buffalo_l を模したディレクトリ（使わないモデルも含む）"""
+    src = tmp_path / "src"
+    src.mkdir()
+    for name, size in [("det_10g.onnx", 100), ("w600k_r50.onnx", 300), ("genderage.onnx", 50)]:
+        (src / name).write_bytes(bytes(range(256)) * (size // 256) + b"x" * (size % 256))
+    return src
+
+
+def _pin(source, root):
+    """source のファイルの値を checksums.json としてコミットした状態にする"""
+    vendor(source, root, update=True)
+    for file_name in ("det_10g.onnx", "w600k_r50.onnx"):
+        (model_dir(root, "buffalo_l") / file_name).unlink()
+
+
+def test_committed_checksums_cover_bundle():
+    """リポジトリの checksums.json に同梱するファイルすべての値がある"""
+    path = model_dir(model_bundle.BUNDLE_ROOT, "buffalo_l") / model_bundle.CHECKSUMS_NAME
+    if not path.exists():
+        pytest.skip("checksums.json がまだありません（tools/vendor_models.py --update で作成）")
+    checksums = model_bundle.load_checksums(model_bundle.BUNDLE_ROOT, "buffalo_l")
+    for file_name in model_bundle.BUNDLE_FILES["buffalo_l"]:
+        assert len(checksums[file_name]["sha256"]) == 64
+        assert checksums[file_name]["size"] > 0
+
+
+def test_vendor_copies_only_needed_files(source, tmp_path):
+    root = tmp_path / "bundle"
+    _pin(source, root)
+    checksums = vendor(source, root)
+    assert set(checksums) == {"det_10g.onnx", "w600k_r50.onnx"}
+    assert sorted(p.name for p in model_dir(root, "buffalo_l").iterdir()) == \
+        ["checksums.json", "det_10g.onnx", "w600k_r50.onnx"]
+    assert verify(root) == root
+
+
+def test_verify_fails_fast(source, tmp_path):
+    root = tmp_path / "bundle"
+    with pytest.raises(ModelBundleError, match="checksums.json"):
+        verify(root)
+
+    _pin(source, root)
+    vendor(source, root)
+    det = model_dir(root, "buffalo_l") / "det_10g.onnx"
+    det.write_bytes(b"y" * 100)                  # 同じサイズで内容だけ違う
+    verify(root, full=False)
+    with pytest.raises(ModelBundleError, match="SHA-256"):
+        verify(root)
+
+    det.unlink()
+    with pytest.raises(ModelBundleError, match="det_10g.onnx"):
+        verify(root, full=False)
+
+    # FaceModel もダウンロードを試みずに失敗する
+    with pytest.raises(ModelBundleError):
+        FaceModel(root=root, verify_root="size", warmup=False).get()
+
+
+def test_vendor_rejects_changed_source(source, tmp_path):
+    """コミット済みの checksums.json と違うファイルは --update なしでは配置しない"""
+    root = tmp_path / "bundle"
+    with pytest.raises(ModelBundleError, match="checksums.json"):
+        vendor(source, root)                      # 値が無ければダウンロードしたものを信用しない
+    _pin(source, root)
+    vendor(source, root)
+    (source / "w600k_r50.onnx").write_bytes(b"new model")
+    with pytest.raises(ModelBundleError, match="--update"):
+        vendor(source, root)
+    assert verify(root)                           # 既存のファイルはそのまま
+    assert vendor(source, root, update=True)["w600k_r50.onnx"]["size"] == 9
+
+
+def test_local_root(source, tmp_path, monkeypatch):
+    root = tmp_path / "bundle"
+    monkeypatch.setattr(model_bundle, "BUNDLE_ROOT", root)
+    assert model_bundle.local_root() is None
+    _pin(source, root)
+    vendor(source, root)
+    assert model_bundle.local_root() == root
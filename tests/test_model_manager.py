@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+FaceModel（遅延初期化・ウォームアップ）のテスト
+"""
+
+import hashlib
+import json
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from model_manager import FaceModel  # noqa: E402
+
+
+class _StubRec:
+    def __init__(self):
+        self.calls = []
+
+    def get_feat(self, imgs):
+        self.calls.append(np.asarray(imgs).shape)
+        return np.zeros((1, 512), dtype=np.float32)
+
+
+class _StubApp:
+    def __init__(self):
+        self.models = {"recognition": _StubRec()}
+        self.calls = []
+
+    def get(self, img):
+        self.calls.append(img.shape)
+        return []
+
+
+class _CountingModel(FaceModel):
+    """実モデルの代わりにスタブを返し、生成回数を数える"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.created = 0
+
+    def _create_app(self):
+        self.created += 1
+        return _StubApp()
+
+
+def test_lazy_load_and_warmup():
+    """get() まではロードせず、ロード時に検出・認識のウォームアップが走ることを確認"""
+    model = _CountingModel(det_size=(320, 320))
+    assert not model.loaded
+    assert model.created == 0
+
+    app = model.get()
+    assert model.loaded
+    assert app.calls == [(320, 320, 3)]
+    assert app.models["recognition"].calls == [(112, 112, 3)]
+    assert set(model.timings) == {"load", "warmup"}
+
+    assert model.get() is app
+    assert model.created == 1
+
+
+def test_concurrent_get_loads_once():
+    """複数スレッドから同時に get() してもロードは一度だけであることを確認"""
+    model = _CountingModel(warmup=False)
+    barrier = threading.Barrier(8)
+    apps = []
+
+    def worker():
+        barrier.wait()
+        apps.append(model.get())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert model.created == 1
+    assert all(a is apps[0] for a in apps)
+    assert "warmup" not in model.timings
+
+
+def test_preload_loads_in_background():
+    """preload() のロードが終わるまで get() が待ち、ロードは一度だけであることを確認"""
+    started, release = threading.Event(), threading.Event()
+
+    class _SlowModel(_CountingModel):
+        def _create_app(self):
+            started.set()
+            release.wait(5)
+            return super()._create_app()
+
+    model = _SlowModel(warmup=False)
+    model.preload()
+    assert started.wait(5)
+    model.preload()            # ロード中に呼んでも 2 つ目のスレッドは作らない
+    assert not model.loaded
+
+    release.set()
+    app = model.get()
+    assert model.loaded and model.created == 1
+    assert model.get() is app
+
+
+def _onnx_models(directory):
+    """検出（SCRFD と同じ 9 出力）と認識（112x112 入力）の形だけを持つモデルを置く"""
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper
+
+    def save(file_name, input_shape, outputs):
+        nodes = [helper.make_node("Identity", ["input.1"], [name]) for name in outputs]
+        graph = helper.make_graph(
+            nodes, file_name,
+            [helper.make_tensor_value_info("input.1", TensorProto.FLOAT, input_shape)],
+            [helper.make_tensor_value_info(name, TensorProto.FLOAT, input_shape)
+             for name in outputs])
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        onnx.save(model, directory / file_name)
+
+    def save_rec(file_name):
+        # mxnet 版の ArcFace と同じく先頭が Sub / Mul（insightface は入力の正規化を 0 / 1 にする）。
+        # どちらも定数 0 / 1 との演算なので、Identity だけのグラフと同じ結果になる
+        zero = helper.make_tensor("zero", TensorProto.FLOAT, [1], [0.0])
+        one = helper.make_tensor("one", TensorProto.FLOAT, [1], [1.0])
+        shape = [1, 3, 112, 112]
+        graph = helper.make_graph(
+            [helper.make_node("Sub", ["input.1", "zero"], ["t"], name="Sub_0"),
+             helper.make_node("Mul", ["t", "one"], ["fc1"], name="Mul_1")],
+            file_name,
+            [helper.make_tensor_value_info("input.1", TensorProto.FLOAT, shape)],
+            [helper.make_tensor_value_info("fc1", TensorProto.FLOAT, shape)],
+            initializer=[zero, one])
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        onnx.save(model, directory / file_name)
+
+    directory.mkdir(parents=True)
+    save("det_10g.onnx", [1, 3, "h", "w"], [f"out{i}" for i in range(9)])
+    save_rec("w600k_r50.onnx")
+    (directory / "genderage.onnx").write_bytes(b"not used")   # セッションを作らずに飛ばす
+
+
+def test_sessions_use_session_config(tmp_path):
+    """作ったセッションに SessionConfig のスレッド数・最適化レベルが反映されることを確認"""
+    ort = pytest.importorskip("onnxruntime")
+    pytest.importorskip("insightface")
+    from ort_session import SessionConfig
+
+    _onnx_models(tmp_path / "models" / "tiny_pack")
+    config = SessionConfig(intra_op_threads=2, inter_op_threads=3, optimization_level="basic",
+                           allow_spinning=False)
+    app = FaceModel(name="tiny_pack", root=tmp_path, warmup=False, session_config=config).get()
+    assert set(app.models) == {"detection", "recognition"}
+    assert app.det_model is app.models["detection"]
+    for model in app.models.values():
+        opts = model.session.get_session_options()
+        assert opts.intra_op_num_threads == 2
+        assert opts.inter_op_num_threads == 3
+        assert opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+        assert opts.get_session_config_entry("session.intra_op.allow_spinning") == "0"
+
+
+def test_sessions_load_ort_cache(tmp_path):
+    """最適化済みモデルのキャッシュがあれば、そのファイルからグラフ最適化なしでセッションを作る
+
+    model_file は元のモデルのまま（ArcFaceONNX の入力の正規化が変わらない）。
+    """
+    ort = pytest.importorskip("onnxruntime")
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("insightface")
+    from ort_session import MANIFEST_NAME, SessionConfig, build_cache
+
+    source = tmp_path / "models" / "tiny_pack"
+    _onnx_models(source)
+    cache_dir = tmp_path / "ort_cache"
+    build_cache([source / "det_10g.onnx", source / "w600k_r50.onnx"], cache_dir, "tiny_pack")
+
+    # グラフの書き換えで先頭の Sub / Mul が消えた（名前が変わった）キャッシュにする
+    cached_rec = cache_dir / "models" / "tiny_pack" / "w600k_r50.onnx"
+    model = onnx.load(cached_rec)
+    del model.graph.node[:]
+    del model.graph.initializer[:]
+    model.graph.node.append(onnx.helper.make_node("Identity", ["input.1"], ["fc1"], name="fused"))
+    onnx.save(model, cached_rec)
+    manifest_path = cache_dir / "models" / "tiny_pack" / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest["models"]["w600k_r50.onnx"]["sha256"] = hashlib.sha256(
+        cached_rec.read_bytes()).hexdigest()
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+
+    model = FaceModel(name="tiny_pack", root=tmp_path, warmup=False,
+                      session_config=SessionConfig(intra_op_threads=1, cache_dir=cache_dir))
+    app = model.get()
+    assert model.model_root == str(cache_dir)
+    for m in app.models.values():
+        assert Path(m.model_file).parent == source
+        opts = m.session.get_session_options()
+        assert opts.intra_op_num_threads == 1
+        assert opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    rec = app.models["recognition"]
+    assert (rec.input_mean, rec.input_std) == (0.0, 1.0)
+
+    # manifest の SHA-256 と一致しないキャッシュは使わず、元のモデルを最適化して読み込む
+    (cache_dir / "models" / "tiny_pack" / "det_10g.onnx").write_bytes(b"corrupted")
+    model = FaceModel(name="tiny_pack", root=tmp_path, warmup=False,
+                      session_config=SessionConfig(intra_op_threads=1, cache_dir=cache_dir))
+    app = model.get()
+    assert model.model_root == tmp_path
+    for m in app.models.values():
+        opts = m.session.get_session_options()
+        assert opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_ALL
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime のセッション設定と最適化済みモデルのキャッシュのテスト
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+ort = pytest.importorskip("onnxruntime")
+onnx = pytest.importorskip("onnx")
+
+from ort_session import MANIFEST_NAME, SessionConfig, build_cache  # noqa: E402
+
+
+def _tiny_model(path):
+    """y = (x + 0) * 1 の最適化で消せる演算を含むモデル"""
+    from onnx import TensorProto, helper
+
+    zero = helper.make_tensor("zero", TensorProto.FLOAT, [1], [0.0])
+    one = helper.make_tensor("one", TensorProto.FLOAT, [1], [1.0])
+    graph = helper.make_graph(
+        [helper.make_node("Add", ["x", "zero"], ["t"]),
+         helper.make_node("Mul", ["t", "one"], ["y"])],
+        "tiny",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 4])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, [1, 4])],
+        initializer=[zero, one],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+    return path
+
+
+def test_from_env_and_session_options():
+    config = SessionConfig.from_env(
+        {"ORT_INTRA_OP_THREADS": "2", "ORT_OPT_LEVEL": "basic", "ORT_ALLOW_SPINNING": "0",
+         "ORT_EXECUTION_MODE": "parallel"},
+        intra_op_threads=8, cache_dir="/nonexistent")
+    assert config.intra_op_threads == 2      # 環境変数が defaults より優先
+    assert config.cache_dir == Path("/nonexistent")
+
+    opts = config.session_options()
+    assert opts.intra_op_num_threads == 2
+    assert opts.graph_optimization_level == ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+    assert opts.execution_mode == ort.ExecutionMode.ORT_PARALLEL
+    assert opts.get_session_config_entry("session.intra_op.allow_spinning") == "0"
+
+    with pytest.raises(ValueError):
+        SessionConfig(optimization_level="max")
+
+
+def test_build_cache_and_model_root(tmp_path):
+    """最適化済みモデルが書き出され、同じ ORT のバージョンのときだけ使われることを確認"""
+    source = _tiny_model(tmp_path / "tiny.onnx")
+    cache_dir = tmp_path / "ort_cache"
+    config = SessionConfig(cache_dir=cache_dir)
+    assert config.model_root("tiny_pack") is None
+
+    manifest = build_cache([source], cache_dir, "tiny_pack", level="extended")
+    optimized = cache_dir / "models" / "tiny_pack" / "tiny.onnx"
+    assert optimized.exists()
+    assert manifest["ort_version"] == ort.__version__
+    assert set(manifest["models"]) == {"tiny.onnx"}
+    assert config.model_root("tiny_pack") == str(cache_dir)
+
+    # 最適化済みのモデルでも結果は同じ
+    x = np.arange(4, dtype=np.float32).reshape(1, 4)
+    sess = ort.InferenceSession(str(optimized), sess_options=config.session_options(),
+                                providers=["CPUExecutionProvider"])
+    np.testing.assert_array_equal(sess.run(None, {"x": x})[0], x)
+
+    # ORT のバージョンが違うキャッシュは使わない
+    manifest_path = optimized.parent / MANIFEST_NAME
+    manifest["ort_version"] = "0.0.0"
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert config.model_root("tiny_pack") is None
+
+
+def test_build_cache_rejects_changed_outputs(tmp_path, monkeypatch):
+    """最適化の前後で出力が変わるモデルはキャッシュに書き出さない"""
+    from onnx import TensorProto, helper
+
+    import ort_session
+
+    source = _tiny_model(tmp_path / "tiny.onnx")
+    ort_session.check_parity(source, source)
+
+    # 出力が 2 倍になるモデル（グラフの書き換えで計算が変わった場合の代わり）
+    two = helper.make_tensor("two", TensorProto.FLOAT, [1], [2.0])
+    graph = helper.make_graph(
+        [helper.make_node("Mul", ["x", "two"], ["y"])], "doubled",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 4])],
+        [helper.make_tensor_value_info("y", TensorProto.FLOAT, [1, 4])],
+        initializer=[two])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    doubled = tmp_path / "doubled.onnx"
+    onnx.save(model, doubled)
+    with pytest.raises(ValueError, match="differs"):
+        ort_session.check_parity(source, doubled)
+
+    check_parity = ort_session.check_parity
+
+    def check(source_file, optimized_file):
+        check_parity(doubled, optimized_file)
+
+    monkeypatch.setattr(ort_session, "check_parity", check)
+    cache_dir = tmp_path / "ort_cache"
+    with pytest.raises(ValueError):
+        build_cache([source], cache_dir, "tiny_pack")
+    assert list((cache_dir / "models" / "tiny_pack").iterdir()) == []
+    assert SessionConfig(cache_dir=cache_dir).model_root("tiny_pack") is None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Storage のパスから決まるドキュメント ID（photo_ids.py）と移行スクリプトのテスト
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(ROOT / "benchmarks"))
+sys.path.append(str(ROOT / "tools"))
+
+from fakes import FakeFirestoreClient  # noqa: E402
+from migrate_doc_ids import migrate, photo_path  # noqa: E402
+from photo_ids import blob_path_of, photo_doc_id  # noqa: E402
+
+# JavaScript の encodeURIComponent（web-ui/src/photoId.js）の結果
+JS_VECTORS = [
+    ("wedding-photos/IMG_0001.JPG", "wedding-photos%2FIMG_0001.JPG"),
+    ("guest a/写真 (1).jpg", "guest%20a%2F%E5%86%99%E7%9C%9F%20(1).jpg"),
+    ("x/it's!*~_-.png", "x%2Fit's!*~_-.png"),
+    ("a%2Fb/c?d#e&f=g+h.jpg", "a%252Fb%2Fc%3Fd%23e%26f%3Dg%2Bh.jpg"),
+]
+
+
+def test_photo_doc_id_matches_encode_uri_component():
+    for path, expected in JS_VECTORS:
+        assert photo_doc_id(path) == expected
+        assert blob_path_of(expected) == path
+    # 同じファイル名でもフォルダが違えば別のドキュメント
+    assert photo_doc_id("guest1/IMG_0001.jpg") != photo_doc_id("guest2/IMG_0001.jpg")
+    for bad in ("", "__name__", "x" * 1501):
+        with pytest.raises(ValueError):
+            photo_doc_id(bad)
+
+
+def test_photo_path_from_legacy_fields():
+    assert photo_path({"storagePath": "wedding-photos/a.jpg"}) == "wedding-photos/a.jpg"
+    url = ("https://firebasestorage.googleapis.com/v0/b/bucket/o/"
+           "wedding-photos%2Fb.jpg?alt=media&token=t")
+    assert photo_path({"photoUrl": url}) == "wedding-photos/b.jpg"
+    assert photo_path({"photoUrl": "https://storage.googleapis.com/bucket/wedding-photos/c.jpg"}) \
+        == "wedding-photos/c.jpg"
+    assert photo_path({"fileName": "d.jpg"}) == "wedding-photos/d.jpg"
+    assert photo_path({"userName": "guest"}) is None
+
+
+def test_migrate_moves_documents_and_is_idempotent():
+    db = FakeFirestoreClient()
+    new_id = photo_doc_id("wedding-photos/b.jpg")
+    db.docs.update({
+        "contestScores/a": {"path": "wedding-photos/a.jpg", "faceCount": 1},
+        "contestScores/b": {"path": "wedding-photos/b.jpg", "faceCount": 1},
+        f"contestScores/{new_id}": {"path": "wedding-photos/b.jpg", "faceCount": 2},
+        "faceEmbeddings/a": {"path": "wedding-photos/a.jpg", "data": b""},
+        "photos/AutoId123": {"fileName": "a.jpg", "userName": "guest"},
+        "photos/broken": {"userName": "guest"},
+    })
+
+    results = migrate(db, batch_max=2)
+    assert results["contestScores"] == {"moved": 1, "dropped": 1, "unchanged": 1, "unknown": 0}
+    assert results["photos"] == {"moved": 1, "dropped": 0, "unchanged": 0, "unknown": 1}
+    a_id = photo_doc_id("wedding-photos/a.jpg")
+    assert sorted(db.docs) == sorted([
+        f"contestScores/{a_id}", f"contestScores/{new_id}", f"faceEmbeddings/{a_id}",
+        f"photos/{a_id}", "photos/broken"])
+    assert db.docs[f"contestScores/{new_id}"]["faceCount"] == 2   # 新しい ID の方を残す
+    assert db.docs[f"photos/{a_id}"]["storagePath"] == "wedding-photos/a.jpg"
+
+    again = migrate(db)
+    assert all(stats["moved"] == stats["dropped"] == 0 for stats in again.values())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ターゲットベクトル変更時の差分再計算のテスト（Firestore はメモリ上のフェイク）
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT / "web-ui" / "functions"))
+sys.path.append(str(ROOT / "benchmarks"))
+
+from face_embeddings import COLLECTION, decode, encode  # noqa: E402
+from fakes import DELETE_FIELD, FakeFirestoreClient  # noqa: E402
+from rescoring import Checkpoint, load_state, rescore  # noqa: E402
+
+
+def _unit(rng, n):
+    x = rng.standard_normal((n, 512)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def db():
+    """写真 7 枚（うち 1 枚は埋め込み無し）の contestScores / faceEmbeddings"""
+    rng = np.random.default_rng(0)
+    db = FakeFirestoreClient()
+    for i in range(7):
+        doc_id = f"photo{i:02d}"
+        db.collection("contestScores").document(doc_id).set(
+            {"path": f"wedding-photos/{doc_id}.jpg", "userName": "guest", "scores": {}})
+        if i != 3:
+            db.collection(COLLECTION).document(doc_id).set({"data": encode(_unit(rng, i % 3 + 1))})
+    return db
+
+
+def test_only_changed_contests_are_rewritten(db, tmp_path):
+    rng = np.random.default_rng(1)
+    targets = {"contest_vectors_1": _unit(rng, 4), "contest_vectors_2": _unit(rng, 6)}
+    stats = rescore(db, targets, page_size=3, delete_field=DELETE_FIELD)
+    assert stats["changed"] == ["contest_vectors_1", "contest_vectors_2"]
+    assert (stats["photos"], stats["skipped"], stats["commits"]) == (6, 1, 3)
+    assert not stats["complete"] and load_state(db) == {}   # スキップがあれば状態は進めない
+
+    doc = db.docs["contestScores/photo01"]
+    faces = decode(db.docs["faceEmbeddings/photo01"]["data"]).embeddings
+    expected = float((faces @ targets["contest_vectors_1"].T).mean())
+    assert doc["scores"]["contest_vectors_1"] == pytest.approx(expected, abs=1e-5)
+    assert doc["userName"] == "guest"
+    assert "contest_vectors_1" not in db.docs["contestScores/photo03"]["scores"]
+
+    # 顔が 0 枚と分かっている写真はスキップに数えない
+    db.docs["contestScores/photo03"].update(faceCount=0, scores={"contest_vectors_2": 0.1})
+    stats = rescore(db, targets, delete_field=DELETE_FIELD)
+    assert (stats["photos"], stats["skipped"], stats["complete"]) == (6, 0, True)
+
+    # 変更なし → 何もしない
+    assert rescore(db, targets, delete_field=DELETE_FIELD)["photos"] == 0
+
+    # 1 つ差し替えて 1 つ削除 → その列だけ
+    before = db.docs["contestScores/photo01"]["scores"]["contest_vectors_1"]
+    targets = {"contest_vectors_1": targets["contest_vectors_1"],
+               "contest_vectors_3": _unit(rng, 2)}
+    stats = rescore(db, targets, delete_field=DELETE_FIELD,
+                    checkpoint=Checkpoint(tmp_path / "ckpt.json"))
+    assert (stats["changed"], stats["removed"]) == (["contest_vectors_3"], ["contest_vectors_2"])
+    scores = db.docs["contestScores/photo01"]["scores"]
+    assert set(scores) == {"contest_vectors_1", "contest_vectors_3"}
+    assert scores["contest_vectors_1"] == before
+    assert db.docs["contestScores/photo03"]["scores"] == {}   # 埋め込みが無い写真からも消す
+    assert not (tmp_path / "ckpt.json").exists()
+
+
+def test_skipped_photos_keep_checkpoint(db, tmp_path):
+    """埋め込みの無い写真があれば、その手前でチェックポイントを止めて状態を進めない"""
+    rng = np.random.default_rng(3)
+    targets = {"contest_vectors_1": _unit(rng, 4)}
+    ckpt = Checkpoint(tmp_path / "ckpt.json")
+    stats = rescore(db, targets, page_size=2, checkpoint=ckpt)
+    assert (stats["photos"], stats["skipped"], stats["complete"]) == (6, 1, False)
+    assert ckpt.load()["last_doc_id"] == "photo02" and load_state(db) == {}
+
+    def infer(paths):
+        return {p: ([type("F", (), {"bbox": np.zeros(4, np.float32), "det_score": 0.9})()],
+                    _unit(rng, 1), 1.0) for p in paths}
+
+    stats = rescore(db, targets, page_size=2, checkpoint=ckpt, infer_missing=infer)
+    assert stats["resumed"] and stats["complete"] and stats["photos"] == 4   # photo03 から
+    assert ckpt.load() is None and load_state(db)["hashes"]
+
+
+def test_resume_from_checkpoint_and_infer_missing(db, tmp_path):
+    rng = np.random.default_rng(2)
+    targets = {"contest_vectors_1": _unit(rng, 4)}
+    ckpt = Checkpoint(tmp_path / "ckpt.json")
+
+    def flaky_infer(paths):
+        raise RuntimeError("interrupted")
+
+    with pytest.raises(RuntimeError):
+        rescore(db, targets, page_size=2, checkpoint=ckpt, infer_missing=flaky_infer)
+    assert ckpt.load()["last_doc_id"] == "photo01"   # 1 ページ目までは書き込み済み
+
+    class _Face:
+        bbox = np.zeros(4, dtype=np.float32)
+        det_score = 0.9
+
+    def infer(paths):
+        return {p: ([_Face()], _unit(rng, 1), 1.0) for p in paths}
+
+    stats = rescore(db, targets, page_size=2, checkpoint=ckpt, infer_missing=infer)
+    assert stats["resumed"] and (stats["photos"], stats["inferred"]) == (5, 1)
+    assert "faceEmbeddings/photo03" in db.docs
+    assert all("contest_vectors_1" in db.docs[f"contestScores/photo{i:02d}"]["scores"]
+               for i in range(7))
+    assert ckpt.load() is None
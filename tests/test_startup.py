@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+コールドスタートの計測（tools/profile_startup.py）と、遅延 import のテスト
+"""
+
+import inspect
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+FUNCTIONS_DIR = Path(__file__).parent.parent / "web-ui" / "functions"
+sys.path.append(str(Path(__file__).parent.parent / "tools"))
+sys.path.append(str(FUNCTIONS_DIR))
+
+import model_manager  # noqa: E402
+from profile_startup import by_package, parse_importtime  # noqa: E402
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |     numpy._utils
+import time:      3000 |       3120 |   numpy
+import time:       500 |        500 |   insightface.utils
+import time:       800 |       4420 | face_pipeline
+"""
+
+
+def test_parse_importtime():
+    entries = parse_importtime(SAMPLE)
+    assert entries[0] == ("numpy._utils", 120, 120, 2)
+    assert entries[-1] == ("face_pipeline", 800, 4420, 0)
+    assert by_package(entries) == [("numpy", 3120), ("face_pipeline", 800), ("insightface", 500)]
+
+
+def test_pipeline_modules_do_not_import_insightface():
+    """insightface の import はモデルのロードまで遅らせる（関数のモジュールの import では読まない）"""
+    code = ("import sys; import face_pipeline, model_manager, storage_io, tracing; "
+            "print('insightface' in sys.modules, 'onnxruntime' in sys.modules)")
+    out = subprocess.run([sys.executable, "-c", code], cwd=FUNCTIONS_DIR, check=True,
+                         capture_output=True, text=True).stdout.split()
+    assert out == ["False", "False"]
+
+
+def _pinned_version(package):
+    for line in (FUNCTIONS_DIR / "requirements.txt").read_text().splitlines():
+        name, _, version = line.partition("==")
+        if name.strip() == package:
+            return version.strip()
+    return None
+
+
+def test_import_insightface_with_pinned_version():
+    """requirements.txt で固定した insightface に、使うサブモジュールと session= の引数がある"""
+    insightface = pytest.importorskip("insightface")
+    pinned = _pinned_version("insightface")
+    assert pinned == "0.7.3"
+    if insightface.__version__ != pinned:
+        pytest.skip(f"insightface {insightface.__version__} は固定した {pinned} ではありません")
+
+    model_manager.import_insightface()
+    assert all(name in sys.modules for name in model_manager.INSIGHTFACE_MODULES)
+    from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+    from insightface.model_zoo.scrfd import SCRFD
+    for cls in (SCRFD, ArcFaceONNX):
+        assert "session" in inspect.signature(cls.__init__).parameters
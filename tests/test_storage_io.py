@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+メモリ上のバッファを使う Storage I/O 層のテスト
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from storage_io import BufferPool, iter_images, open_image  # noqa: E402
+
+ASSETS = Path(__file__).parent / "assets"
+
+
+class _FakeBlob:
+    def __init__(self, data, metadata=None):
+        self.data = data
+        self.metadata = metadata
+
+    def download_to_file(self, f):
+        # 実際のクライアントと同様にチャンクに分けて書き込む
+        for i in range(0, len(self.data), 65536):
+            f.write(self.data[i:i + 65536])
+
+
+class _FakeBucket:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    def get_blob(self, name):
+        return self.blobs.get(name)
+
+
+def test_open_image_reuses_buffer():
+    """同じバッファを使い回しても、大きい画像の後の小さい画像が正しく読めることを確認"""
+    pool = BufferPool(max_idle=1)
+    big = (ASSETS / "test_image_3.jpg").read_bytes()
+    small = (ASSETS / "test_image.jpg").read_bytes()
+
+    with open_image(_FakeBlob(big), pool) as decoded:
+        assert pool._idle == []  # 使用中のバッファはプールに戻っていない
+        assert decoded.array.shape == (1040, 1572, 3)
+
+    with open_image(_FakeBlob(small), pool) as decoded:
+        expected = np.asarray(Image.open(ASSETS / "test_image.jpg").convert("RGB"))
+        np.testing.assert_array_equal(decoded.array, expected)
+        np.testing.assert_array_equal(decoded.full_resolution(), expected)
+
+    assert len(pool._idle) == 1
+
+
+def test_iter_images_keeps_order_and_skips_failures():
+    """並列ダウンロードでも順番が保たれ、存在しない blob はスキップされることを確認"""
+    data = (ASSETS / "test_image.jpg").read_bytes()
+    bucket = _FakeBucket({
+        "a.jpg": _FakeBlob(data, {"userName": "alice"}),
+        "b.jpg": _FakeBlob(b"not an image"),
+        "c.jpg": _FakeBlob(data),
+    })
+    pool = BufferPool()
+
+    results = [(path, user) for path, _, user in
+               iter_images(bucket, ["a.jpg", "b.jpg", "missing.jpg", "c.jpg"], pool, workers=3)]
+
+    assert results == [("a.jpg", "alice"), ("c.jpg", None)]
+    assert 1 <= len(pool._idle) <= 3
+
+
+def test_iter_images_skip_does_not_download():
+    """skip が True を返した blob はダウンロードせず None を返すことを確認"""
+    data = (ASSETS / "test_image.jpg").read_bytes()
+
+    class _NoDownloadBlob(_FakeBlob):
+        def download_to_file(self, f):
+            raise AssertionError("should not be downloaded")
+
+    bucket = _FakeBucket({"a.jpg": _NoDownloadBlob(data, {"userName": "alice"}),
+                          "b.jpg": _FakeBlob(data)})
+    results = list(iter_images(bucket, ["a.jpg", "b.jpg"], BufferPool(),
+                               skip=lambda path, blob: path == "a.jpg"))
+
+    assert [(p, img is None, u) for p, img, u in results] == [
+        ("a.jpg", True, "alice"), ("b.jpg", False, None)]
+
+
+def test_iter_images_prefetches_at_most_workers():
+    """呼び出し側が止まっている間に、workers 枚より先をダウンロードしないことを確認"""
+    data = (ASSETS / "test_image.jpg").read_bytes()
+    fetched = []
+
+    class _RecordingBucket(_FakeBucket):
+        def get_blob(self, name):
+            fetched.append(name)
+            return super().get_blob(name)
+
+    names = [f"{i}.jpg" for i in range(8)]
+    bucket = _RecordingBucket({name: _FakeBlob(data) for name in names})
+    images = iter_images(bucket, names, BufferPool(), workers=2)
+
+    next(images)
+    time.sleep(0.2)   # 先読みが進むだけの時間を置く
+    assert len(fetched) <= 3   # 受け取った 1 枚 + 先読み 2 枚
+    assert [path for path, _, _ in images] == names[1:]
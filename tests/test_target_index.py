@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+ターゲットベクトルの索引（重心・IVF 近傍探索）のテスト
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+FUNCTIONS_DIR = Path(__file__).parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from quantize import QuantizedMatrix  # noqa: E402
+from target_index import FusedTargets, IVFIndex, TargetIndex  # noqa: E402
+from vector_store import load_vector_sets  # noqa: E402
+
+
+def _clustered(n, n_clusters=40, dim=512, noise=0.5, seed=0):
+    """人物ごとに数枚ずつ似た顔がある状況を模した正規化ベクトル"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim))
+    x = centers[rng.integers(0, n_clusters, n)] + noise * rng.standard_normal((n, dim))
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32), centers
+
+
+@pytest.fixture
+def faces():
+    """検出された顔の埋め込み（ターゲットの人物に似た顔と無関係な顔）"""
+    rng = np.random.default_rng(1)
+    _, centers = _clustered(1, seed=0)
+    x = np.concatenate([centers[:10] + 0.5 * rng.standard_normal((10, 512)),
+                        rng.standard_normal((10, 512))])
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_mean_score_equals_all_pairs_mean():
+    """重心による平均スコアが全ペア平均と一致することを確認（リポジトリのベクトル）"""
+    target_sets = load_vector_sets(FUNCTIONS_DIR / "target_vectors")
+    rng = np.random.default_rng(0)
+    face_embs = rng.standard_normal((7, 512)).astype(np.float32)
+    face_embs /= np.linalg.norm(face_embs, axis=1, keepdims=True)
+
+    for vectors in target_sets.values():
+        expected = float((face_embs @ vectors.T).mean())
+        assert TargetIndex(vectors).mean_score(face_embs) == pytest.approx(expected, abs=1e-6)
+
+
+def test_ivf_recall_against_brute_force(faces):
+    """IVF の最近傍が総当たりとほぼ一致することを確認"""
+    vectors, _ = _clustered(5000)
+    index = IVFIndex(vectors, nprobe=8)
+
+    sims, ids = index.search(faces, k=5)
+    exact = faces @ vectors.T
+    exact_ids = np.argsort(-exact, axis=1)[:, :5]
+
+    recall = np.mean([len(set(ids[i]) & set(exact_ids[i])) / 5 for i in range(len(faces))])
+    assert recall >= 0.9
+    np.testing.assert_allclose(sims[:, 0], exact.max(axis=1), atol=0.02)
+
+
+def test_max_score_close_to_brute_force(faces):
+    """IVF を使った最大値ベースのスコアが総当たりとほぼ一致することを確認"""
+    vectors, _ = _clustered(3000)
+    approx = TargetIndex(vectors, brute_force_max=1000)
+    exact = TargetIndex(vectors, brute_force_max=10 ** 9)
+    assert approx.ivf is not None and exact.ivf is None
+
+    alpha = 0.8
+    expected = float((vectors @ faces.T).max(0).sum() / (len(faces) ** alpha))
+    assert exact.max_score(faces, alpha) == pytest.approx(expected, abs=1e-5)
+    assert approx.max_score(faces, alpha) == pytest.approx(expected, rel=0.01)
+
+
+def test_topk_small_set_is_exact():
+    """総当たりの topk が類似度の降順になっていることを確認"""
+    vectors, _ = _clustered(50)
+    index = TargetIndex(vectors)
+    sims, ids = index.topk(vectors[:3], k=4)
+
+    assert ids.shape == (3, 4)
+    np.testing.assert_array_equal(ids[:, 0], [0, 1, 2])
+    assert np.all(np.diff(sims, axis=1) <= 0)
+
+
+def test_fused_scores_match_per_contest_loop(faces):
+    """まとめた行列での計算が、コンテストごとのループと一致することを確認"""
+    rng = np.random.default_rng(2)
+    target_sets = {}
+    for i, m in enumerate([1, 3, 8, 0, 20, 1500]):
+        vectors, _ = _clustered(m, seed=i) if m else (np.zeros((0, 512), np.float32), None)
+        target_sets[f"contest_{i}"] = vectors
+    indexes = {name: TargetIndex(v, brute_force_max=1000) for name, v in target_sets.items()}
+    fused = FusedTargets(indexes)
+    face_embs = faces[rng.permutation(len(faces))[:6]]
+
+    assert "contest_3" not in fused.names  # ターゲット 0 件は除外
+    means = fused.mean_scores(face_embs)
+    maxes = fused.max_scores(face_embs, alpha=0.8)
+    for name, idx in indexes.items():
+        if not len(idx):
+            continue
+        expected_mean = float((face_embs @ target_sets[name].T).mean())
+        assert means[name] == pytest.approx(expected_mean, abs=1e-5)
+        assert maxes[name] == pytest.approx(idx.max_score(face_embs, 0.8), abs=1e-5)
+
+
+def test_many_photo_scores_match_single_photo(faces):
+    """複数写真をまとめた計算が、写真 1 枚ずつの計算と一致することを確認"""
+    target_sets = {f"contest_{i}": _clustered(m, seed=i)[0] for i, m in enumerate([2, 5, 30])}
+    fused = FusedTargets({name: TargetIndex(v) for name, v in target_sets.items()})
+    sizes = [1, 4, 2, 7]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    face_embs = faces[:sum(sizes)]
+
+    means = fused.mean_scores_many(face_embs, offsets)
+    maxes = fused.max_scores_many(face_embs, offsets, alpha=0.8, chunk=3)
+    for p, (start, n) in enumerate(zip(offsets, sizes)):
+        photo = face_embs[start:start + n]
+        np.testing.assert_allclose(means[p], list(fused.mean_scores(photo).values()), atol=1e-5)
+        np.testing.assert_allclose(maxes[p], list(fused.max_scores(photo, 0.8).values()),
+                                   atol=1e-5)
+    assert fused.mean_scores_many(face_embs[:0], []).shape == (0, 3)
+
+
+@pytest.mark.parametrize("dtype,tol", [("float16", 1e-3), ("int8", 5e-3)])
+def test_quantized_targets_close_to_float32(faces, dtype, tol):
+    """量子化したターゲットのスコアが float32 とほぼ一致することを確認"""
+    target_sets = {f"contest_{i}": _clustered(m, seed=i)[0] for i, m in enumerate([3, 50])}
+    ref = FusedTargets({name: TargetIndex(v) for name, v in target_sets.items()})
+    fused = FusedTargets({name: TargetIndex(QuantizedMatrix.from_float(v, dtype))
+                          for name, v in target_sets.items()})
+    assert isinstance(fused.matrix, QuantizedMatrix) and fused.matrix.dtype == np.dtype(dtype)
+
+    face_embs = faces[:8]
+    for name, score in fused.max_scores(face_embs, alpha=0.8).items():
+        assert score == pytest.approx(ref.max_scores(face_embs, alpha=0.8)[name], abs=tol)
+    for name, score in fused.mean_scores(face_embs).items():
+        assert score == pytest.approx(ref.mean_scores(face_embs)[name], abs=tol)
+    quantized = QuantizedMatrix.from_float(face_embs, dtype)
+    np.testing.assert_allclose(quantized.matmul_t(face_embs, chunk=3), face_embs @ face_embs.T,
+                               atol=tol)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スパン・カウンタの記録とメトリクスの書き出し（tracing.py）のテスト
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "web-ui" / "functions"))
+
+from timing import PhaseTimer  # noqa: E402
+from tracing import Trace, Tracer  # noqa: E402
+
+
+def test_trace_spans_and_log_fields():
+    """スパンが開始順に記録され、fields() と "trace" がログのフィールドになることを確認"""
+    tracer = Tracer()
+    trace = tracer.start("score_image")
+    assert isinstance(trace, Trace) and trace.invocation == "cold"
+    with trace.phase("download"):
+        time.sleep(0.01)
+    trace.add("queue", 5.0)
+    with trace.phase("detect"):
+        pass
+    trace.count("downloadBytes", 1000)
+    trace.count("faceCount", 3)
+
+    fields = tracer.finish(trace)
+    assert fields["download_ms"] >= 10
+    assert fields["downloadBytes"] == 1000 and fields["faceCount"] == 3
+    payload = fields["trace"]
+    assert payload["name"] == "score_image" and payload["invocation"] == "cold"
+    assert [s["name"] for s in payload["spans"]] == ["download", "queue", "detect"]
+    assert payload["spans"][1]["durationMs"] == 5.0
+    assert payload["counters"] == {"downloadBytes": 1000, "faceCount": 3}
+
+    assert tracer.start("score_image").invocation == "warm"
+
+
+def test_metrics_render():
+    tracer = Tracer()
+    collected = []
+    tracer.add_sink(collected.append)
+    for faces in (0, 3):
+        trace = tracer.start("score_image")
+        trace.add("detect", 30.0)
+        trace.count("faceCount", faces)
+        tracer.finish(trace)
+    assert len(collected) == 2
+
+    text = tracer.render()
+    assert "# TYPE photo_contest_stage_seconds histogram" in text
+    assert 'photo_contest_stage_seconds_bucket{function="score_image",stage="detect",le="0.05"} 2' in text
+    assert 'photo_contest_stage_seconds_bucket{function="score_image",stage="detect",le="0.025"} 0' in text
+    assert 'photo_contest_stage_seconds_count{function="score_image",stage="total"} 2' in text
+    assert 'photo_contest_faces_per_image_bucket{function="score_image",le="0"} 1' in text
+    assert 'photo_contest_invocations_total{function="score_image",start="cold"} 1' in text
+    assert "# TYPE photo_contest_face_count_total counter" in text
+    assert 'photo_contest_face_count_total{function="score_image"} 3' in text
+
+    om = tracer.render("openmetrics")
+    assert "# TYPE photo_contest_face_count counter" in om
+    assert om.endswith("# EOF\n")
+
+
+def test_disabled_tracer():
+    """無効なら素の PhaseTimer を返し、メトリクスもログの "trace" も出さない"""
+    tracer = Tracer.from_env({"TRACING": "0"})
+    timer = tracer.start("score_image")
+    assert type(timer) is PhaseTimer
+    with timer.phase("detect"):
+        pass
+    fields = tracer.finish(timer)
+    assert "trace" not in fields and "detect_ms" in fields
+    assert tracer.render() == "\n"
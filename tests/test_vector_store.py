@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+コンパイル済みターゲットベクトル（.vec）の読み書きのテスト
+"""
+
+import json
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+FUNCTIONS_DIR = Path(__file__).parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+import vector_store  # noqa: E402
+
+
+@pytest.fixture
+def vec_dir(tmp_path):
+    """リポジトリの contest_vectors_*.json をコピーした作業ディレクトリ"""
+    for src in (FUNCTIONS_DIR / "target_vectors").glob("contest_vectors_*.json"):
+        shutil.copy(src, tmp_path / src.name)
+    return tmp_path
+
+
+def test_compiled_matches_json(vec_dir):
+    """コンパイル済みファイルとJSONから同じ正規化ベクトルが得られることを確認"""
+    from_json = vector_store.load_vector_sets(vec_dir)
+    assert from_json, "ターゲットベクトルが読み込めませんでした"
+
+    for json_path in vec_dir.glob("contest_vectors_*.json"):
+        vector_store.compile_json(json_path)
+    compiled = vector_store.load_vector_sets(vec_dir)
+
+    assert compiled.keys() == from_json.keys()
+    for name, vectors in compiled.items():
+        assert isinstance(vectors, np.memmap)
+        assert vectors.dtype == np.float32
+        np.testing.assert_allclose(vectors, from_json[name], atol=1e-7)
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+
+
+def test_header_and_sidecar(vec_dir):
+    """ヘッダとサイドカーに名前・次元・行数・face_info が入っていることを確認"""
+    json_path = vec_dir / "contest_vectors_1.json"
+    vec_path = vector_store.compile_json(json_path)
+    with json_path.open(encoding="utf-8") as f:
+        data = json.load(f)
+
+    name, dim, rows, _, dtype = vector_store.read_header(vec_path)
+    assert (name, dim, rows, dtype) == ("contest_vectors_1", 512, len(data["vectors"]), "float32")
+
+    meta = vector_store.load_meta(vec_path)
+    assert meta["face_info"] == data["face_info"]
+
+
+def test_corrupted_file_is_rejected(vec_dir):
+    """データ部が壊れている場合はチェックサムで検出されることを確認"""
+    vec_path = vector_store.compile_json(vec_dir / "contest_vectors_1.json")
+    raw = bytearray(vec_path.read_bytes())
+    raw[-1] ^= 0xFF
+    vec_path.write_bytes(bytes(raw))
+
+    with pytest.raises(vector_store.VectorStoreError):
+        vector_store.load_vector_store(vec_path)
+
+
+def test_stale_compiled_file_falls_back_to_json(vec_dir):
+    """JSON が更新された場合は古い .vec ではなく JSON を読むことを確認"""
+    json_path = vec_dir / "contest_vectors_1.json"
+    vector_store.compile_json(json_path)
+
+    with json_path.open(encoding="utf-8") as f:
+        data = json.load(f)
+    data["vectors"] = data["vectors"][:1]
+    with json_path.open("w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    vectors = vector_store.load_vector_sets(vec_dir)["contest_vectors_1"]
+    assert not isinstance(vectors, np.memmap)
+    assert vectors.shape[0] == 1
+
+
+@pytest.mark.parametrize("dtype, ratio, atol", [("float16", 2, 1e-3), ("int8", 4, 1e-2)])
+def test_quantized_store(vec_dir, dtype, ratio, atol):
+    """量子化して保存したファイルが小さく、類似度の誤差が小さいことを確認"""
+    json_path = vec_dir / "contest_vectors_1.json"
+    full = vector_store.compile_json(json_path, vec_dir / "full.vec")
+    vec_path = vector_store.compile_json(json_path, dtype=dtype)
+    assert vector_store.read_header(vec_path)[4] == dtype
+    assert (vec_path.stat().st_size - 128) * ratio <= (full.stat().st_size - 128) * 1.01
+
+    _, exact = vector_store.load_vector_store(full)
+    _, quantized = vector_store.load_vector_store(vec_path)
+    assert quantized.dtype == np.dtype(dtype)
+    np.testing.assert_allclose(quantized.matmul_t(exact), exact @ exact.T, atol=atol)
+
+    loaded = vector_store.load_vector_sets(vec_dir)["contest_vectors_1"]
+    np.testing.assert_allclose(np.asarray(loaded), exact, atol=atol)
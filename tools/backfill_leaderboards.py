@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+contestScores の全件から leaderboards（コンテストごとのランキング）を作り直すスクリプト
+
+leaderboards は score_image が写真ごとに更新しますが、導入前のスコアや、
+rescore_contests.py でまとめて再計算したスコアを反映するときに使います。
+
+使い方:
+    python tools/backfill_leaderboards.py [--top_n 100] [--emulator] [--dry_run]
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# Cloud Functions 側のモジュールを利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from leaderboard import TOP_N, rebuild  # noqa: E402
+
+PROJECT_ID = "wedding-photo-contest-dev-032"
+FIRESTORE_EMULATOR_HOST = "localhost:8080"   # web-ui/firebase.json のエミュレーター
+
+
+def main():
+    parser = argparse.ArgumentParser(description='contestScores から leaderboards を作り直す')
+    parser.add_argument('--top_n', type=int, default=TOP_N, help='管理者用ランキングの件数')
+    parser.add_argument('--project', default=PROJECT_ID, help='Firebase のプロジェクト ID')
+    parser.add_argument('--emulator', action='store_true',
+                        help=f'Firestore エミュレーター（{FIRESTORE_EMULATOR_HOST}）に接続する')
+    parser.add_argument('--dry_run', action='store_true', help='集計だけして書き込まない')
+    args = parser.parse_args()
+
+    if args.emulator:
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", FIRESTORE_EMULATOR_HOST)
+    from google.cloud import firestore
+    db = firestore.Client(project=args.project)
+
+    boards = rebuild(db, top_n=args.top_n, dry_run=args.dry_run)
+    for contest, board in sorted(boards.items()):
+        best = board["top"][0] if board["top"] else None
+        print(f"{contest}: {len(board['users'])} 人 / 上位 {len(board['top'])} 枚"
+              + (f" / 1 位 {best['userName']} ({best['score']:.4f})" if best else ""))
+    if args.dry_run:
+        print("（dry run: 書き込んでいません）")
+
+
+if __name__ == "__main__":
+    main()
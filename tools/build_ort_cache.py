@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+検出・認識モデルをグラフ最適化して、Cloud Functions に同梱するキャッシュを作るスクリプト
+
+score_image は web-ui/functions/ort_cache に最適化済みのモデルがあればそれを読み込み、
+コールドスタートでのグラフ最適化を省きます（web-ui/functions/ort_session.py）。
+キャッシュは作成した onnxruntime のバージョンでしか使われないので、
+requirements.txt と同じバージョンの onnxruntime で実行してからデプロイしてください。
+最適化の前後で出力が変わるモデルがあると、キャッシュを書き出さずにエラーで終了します。
+
+使い方:
+    python tools/build_ort_cache.py                       # ~/.insightface の buffalo_l から
+    python tools/build_ort_cache.py --root /path/to/insightface --level basic
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Cloud Functions 側のモジュールを利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from model_bundle import local_root  # noqa: E402
+from model_manager import DEFAULT_MODULES, FaceModel  # noqa: E402
+from ort_session import CACHE_LEVEL, LEVELS, build_cache  # noqa: E402
+
+
+def model_files(name, root, modules=DEFAULT_MODULES):
+    """FaceModel が modules に使う ONNX ファイル（ほかのモデルは同梱しない）"""
+    app = FaceModel(name=name, allowed_modules=modules, root=root, warmup=False).get()
+    return [app.models[m].model_file for m in modules]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='最適化済みモデルのキャッシュを作る')
+    parser.add_argument('--name', default='buffalo_l', help='InsightFace のモデル名')
+    parser.add_argument('--root', default=local_root(),
+                        help='元のモデルの root（既定は同梱モデル、無ければ ~/.insightface）')
+    parser.add_argument('--output', type=Path, default=FUNCTIONS_DIR / "ort_cache",
+                        help='キャッシュのディレクトリ（ORT_CACHE_DIR）')
+    parser.add_argument('--level', choices=LEVELS, default=CACHE_LEVEL,
+                        help='グラフ最適化レベル（all は作成したマシンの CPU に依存する）')
+    args = parser.parse_args()
+
+    files = model_files(args.name, args.root)
+    t0 = time.perf_counter()
+    manifest = build_cache(files, args.output, args.name, level=args.level)
+    print(f"onnxruntime {manifest['ort_version']} / level={manifest['level']} / "
+          f"{time.perf_counter() - t0:.1f} 秒")
+    for file_name in manifest["models"]:
+        path = args.output / "models" / args.name / file_name
+        print(f"  {path} ({path.stat().st_size / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
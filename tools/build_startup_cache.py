@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+デプロイ前に、コールドスタートで毎回やっている準備をまとめて済ませておくスクリプト
+
+    1. 検出・認識モデルのグラフ最適化（web-ui/functions/ort_cache、build_ort_cache.py と同じ）
+    2. ターゲットベクトル（target_vectors/contest_vectors_*.json）の .vec へのコンパイル
+       （JSON のパースと正規化を省き、memmap で読み込む）
+
+どちらも main.py の起動時に自動で使われます（古い・バージョンの違うものは無視して元の
+ファイルを読み込みます）。最後に tools/profile_startup.py と同じ方法で、新しいプロセスでの
+import main（モデルがあればロードと最初の 1 枚も）の時間を表示します。
+
+使い方:
+    python tools/build_startup_cache.py [--vstore_dtype float16] [--skip_models]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+from model_bundle import local_root  # noqa: E402
+from ort_session import CACHE_LEVEL, LEVELS, build_cache  # noqa: E402
+from vector_store import META_SUFFIX, compile_json  # noqa: E402
+
+VEC_DIR = FUNCTIONS_DIR / "target_vectors"
+MODEL_DIR = Path.home() / ".insightface" / "models"
+
+
+def compile_targets(vec_dir=VEC_DIR, dtype="float32"):
+    """vec_dir の contest_vectors_*.json をすべて .vec にコンパイルし、書き出したパスを返す"""
+    paths = []
+    for json_path in sorted(Path(vec_dir).glob("contest_vectors_*.json")):
+        if json_path.name.endswith(META_SUFFIX):
+            continue
+        paths.append(compile_json(json_path, dtype=dtype))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='コールドスタート用のキャッシュをまとめて作る')
+    parser.add_argument('--name', default='buffalo_l', help='InsightFace のモデル名')
+    parser.add_argument('--root', default=local_root(),
+                        help='元のモデルの root（既定は同梱モデル、無ければ ~/.insightface）')
+    parser.add_argument('--level', choices=LEVELS, default=CACHE_LEVEL,
+                        help='グラフ最適化レベル')
+    parser.add_argument('--vstore_dtype', choices=['float32', 'float16', 'int8'],
+                        default='float32', help='.vec の保存形式')
+    parser.add_argument('--skip_models', action='store_true',
+                        help='モデルの最適化を行わない（ターゲットベクトルだけ）')
+    args = parser.parse_args()
+
+    has_models = args.root is not None or (MODEL_DIR / args.name).exists()
+    if not args.skip_models and has_models:
+        from build_ort_cache import model_files
+
+        t0 = time.perf_counter()
+        manifest = build_cache(model_files(args.name, args.root), FUNCTIONS_DIR / "ort_cache",
+                               args.name, level=args.level)
+        print(f"最適化済みモデル: onnxruntime {manifest['ort_version']} / level={manifest['level']}"
+              f" / {', '.join(manifest['models'])}（{time.perf_counter() - t0:.1f} 秒）")
+    elif not args.skip_models:
+        print("モデルが無いので最適化済みモデルは作りません（tools/vendor_models.py で配置してください）")
+
+    t0 = time.perf_counter()
+    paths = compile_targets(dtype=args.vstore_dtype)
+    print(f"ターゲットベクトル: {len(paths)} ファイルを {args.vstore_dtype} でコンパイル"
+          f"（{time.perf_counter() - t0:.2f} 秒）")
+
+    from profile_startup import phases
+
+    result = phases(dict(os.environ), model=has_models)
+    line = f"import main {result['import_main']:.3f} 秒"
+    if has_models:
+        line += (f" / モデル {result['model']:.3f} 秒 / 最初の 1 枚 {result['first_image']:.3f} 秒"
+                 f" / 合計 {result['import_main'] + result['model'] + result['first_image']:.3f} 秒")
+    print(f"コールドスタート（新しいプロセス）: {line}")
+
+
+if __name__ == "__main__":
+    main()
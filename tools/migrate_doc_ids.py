@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+既存のドキュメントを Storage のパスから決まる ID（web-ui/functions/photo_ids.py）に移すスクリプト
+
+以前の ID（contestScores / faceEmbeddings はファイル名の拡張子なし、photos は addDoc の
+自動 ID）のドキュメントを新しい ID にコピーして、古いドキュメントを削除します。
+
+    contestScores / faceEmbeddings : ドキュメントの "path" から ID を決める
+    photos : "storagePath"、無ければ photoUrl（Storage のダウンロード URL / 公開 URL）、
+             それも無ければ --photos_prefix + fileName から決める
+
+新しい ID のドキュメントが既にある場合（移行前に関数が新しい ID で書き込んだ写真）は
+そちらを残して古いドキュメントだけを削除します。最後に leaderboards を作り直します
+（ランキングのエントリはドキュメント ID を持っているため）。何度実行しても結果は同じです。
+
+使い方:
+    python tools/migrate_doc_ids.py --dry_run      # 移す件数だけ表示
+    python tools/migrate_doc_ids.py [--emulator]
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+# Cloud Functions 側のモジュールを利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from face_embeddings import COLLECTION as EMBEDDINGS_COLLECTION  # noqa: E402
+from leaderboard import rebuild as rebuild_leaderboards  # noqa: E402
+from photo_ids import photo_doc_id  # noqa: E402
+
+PROJECT_ID = "wedding-photo-contest-dev-032"
+FIRESTORE_EMULATOR_HOST = "localhost:8080"   # web-ui/firebase.json のエミュレーター
+PHOTOS_PREFIX = "wedding-photos/"            # ImageUpload.js のアップロード先
+FIRESTORE_BATCH_MAX = 500
+
+
+def photo_path(data, prefix=PHOTOS_PREFIX):
+    """photos のドキュメントから Storage のパスを求める（分からなければ None）"""
+    if data.get("storagePath"):
+        return data["storagePath"]
+    url = urlparse(data.get("photoUrl") or "")
+    if "/o/" in url.path:                          # getDownloadURL: .../v0/b/{bucket}/o/{パス}?alt=media
+        return unquote(url.path.split("/o/", 1)[1])
+    if url.netloc == "storage.googleapis.com":     # 公開 URL: /{bucket}/{パス}（functions_bkp）
+        parts = url.path.lstrip("/").split("/", 1)
+        if len(parts) == 2:
+            return unquote(parts[1])
+    if data.get("fileName"):
+        return prefix + data["fileName"]
+    return None
+
+
+def migrate(db, collections=("contestScores", EMBEDDINGS_COLLECTION, "photos"),
+            prefix=PHOTOS_PREFIX, dry_run=False, batch_max=FIRESTORE_BATCH_MAX):
+    """collections のドキュメントを新しい ID に移し、{collection: 集計} を返す
+
+    集計は moved（コピーして削除）/ dropped（新しい ID が既にあるので削除だけ）/
+    unchanged（既に新しい ID）/ unknown（パスが分からないのでそのまま）の件数。
+    """
+    batch, n_ops = db.batch(), 0
+
+    def move(old_ref, new_ref=None, data=None):
+        # コピーと削除は同じバッチに入れる（途中で止まっても両方あるか両方ないか）
+        nonlocal batch, n_ops
+        if dry_run:
+            return
+        if n_ops + 2 > batch_max:
+            batch.commit()
+            batch, n_ops = db.batch(), 0
+        if new_ref is not None:
+            batch.set(new_ref, data)
+            n_ops += 1
+        batch.delete(old_ref)
+        n_ops += 1
+
+    results = {}
+    for name in collections:
+        collection = db.collection(name)
+        snaps = list(collection.stream())   # 書き込みながら読まないよう先に全件読む
+        existing = {snap.id for snap in snaps}
+        stats = results[name] = {"moved": 0, "dropped": 0, "unchanged": 0, "unknown": 0}
+        for snap in snaps:
+            data = snap.to_dict()
+            path = photo_path(data, prefix) if name == "photos" else data.get("path")
+            if not path:
+                stats["unknown"] += 1
+                continue
+            doc_id = photo_doc_id(path)
+            if doc_id == snap.id:
+                stats["unchanged"] += 1
+                continue
+            if doc_id in existing:
+                stats["dropped"] += 1
+                move(snap.reference)
+                continue
+            if name == "photos":
+                data["storagePath"] = path
+            move(snap.reference, collection.document(doc_id), data)
+            existing.add(doc_id)
+            stats["moved"] += 1
+    if n_ops:
+        batch.commit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ドキュメントを Storage のパスから決まる ID に移す')
+    parser.add_argument('--collections', nargs='+',
+                        default=["contestScores", EMBEDDINGS_COLLECTION, "photos"],
+                        help='移すコレクション')
+    parser.add_argument('--photos_prefix', default=PHOTOS_PREFIX,
+                        help='photos に storagePath / photoUrl が無いときに fileName に付けるパス')
+    parser.add_argument('--project', default=PROJECT_ID, help='Firebase のプロジェクト ID')
+    parser.add_argument('--emulator', action='store_true',
+                        help=f'Firestore エミュレーター（{FIRESTORE_EMULATOR_HOST}）に接続する')
+    parser.add_argument('--dry_run', action='store_true', help='件数だけ数えて書き込まない')
+    args = parser.parse_args()
+
+    if args.emulator:
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", FIRESTORE_EMULATOR_HOST)
+    from google.cloud import firestore
+    db = firestore.Client(project=args.project)
+
+    results = migrate(db, args.collections, prefix=args.photos_prefix, dry_run=args.dry_run)
+    for name, stats in results.items():
+        print(f"{name}: 移動 {stats['moved']} / 重複で削除 {stats['dropped']} / "
+              f"移行済み {stats['unchanged']} / パス不明 {stats['unknown']}")
+    if args.dry_run:
+        print("（dry run: 書き込んでいません）")
+    elif "contestScores" in args.collections:
+        boards = rebuild_leaderboards(db)
+        print(f"leaderboards を作り直しました: {len(boards)} コンテスト")
+
+
+if __name__ == "__main__":
+    main()
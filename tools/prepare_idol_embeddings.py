@@ -4,19 +4,146 @@
 アイドル画像から顔の特徴ベクトルを抽出するスクリプト
 抽出したベクトルはfunctions/idol_vectors.jsonに保存します
 また、顔画像を切り取ってface_images/idol_facesに保存し、対応情報をidol_vectors.jsonに含めます
+--export_vstore を付けると、Cloud Functions 用のコンパイル済みベクトル（.vec）も書き出します
+--compile で既存の contest_vectors_*.json を .vec に変換できます
+--vstore_dtype float16 / int8 で .vec を量子化して小さくできます（スコアの誤差は
+benchmarks/bench_quantized.py で確認できます）
+
+画像の処理は --jobs 個のワーカープロセスで並列に行い（各ワーカーは検出・認識のモデルだけを
+ORT スレッド --threads 本でロードする）、1 枚ごとの結果を
+マニフェスト（<出力名>.manifest.jsonl、画像の内容の SHA-256 がキー）に追記します。
+再実行時は新しい・変更された画像だけを処理するので、途中で止まっても続きから再開できます。
 """
 
 import os
 import sys
 import json
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 from PIL import Image
-import insightface
-from insightface.app import FaceAnalysis
 import glob
 from pathlib import Path
 
+# Cloud Functions 側のモジュール（vector_store）を利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+def compile_vector_files(paths, dtype="float32"):
+    """JSON のターゲットベクトルを .vec にコンパイルする（ディレクトリ指定時は中の *.json 全部）"""
+    from vector_store import META_SUFFIX, compile_json
+
+    json_files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            json_files.extend(f for f in sorted(p.glob("*.json"))
+                              if not f.name.endswith(META_SUFFIX))
+        else:
+            json_files.append(p)
+
+    for json_file in json_files:
+        vec_path = compile_json(json_file, dtype=dtype)
+        print(f"コンパイルしました: {json_file} -> {vec_path}（{dtype}）")
+
+def file_sha256(path):
+    """画像ファイルの内容の SHA-256（マニフェストのキー）"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(path):
+    """マニフェスト（1 行 1 画像の JSONL）を {sha256: record} で読み込む
+
+    途中で止まって最後の行が壊れている場合は、その行だけ読み飛ばす。
+    """
+    manifest = {}
+    if not os.path.exists(path):
+        return manifest
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                manifest[record['sha256']] = record
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return manifest
+
+def is_reusable(record, save_crops):
+    """マニフェストの結果をそのまま使えるか（エラーや、必要な切り抜きが無い場合は再処理）"""
+    if record.get('error'):
+        return False
+    if save_crops:
+        return all(face.get('face_image') and os.path.exists(face['face_image'])
+                   for face in record['faces'])
+    return True
+
+# ---------- ワーカープロセス ----------
+_app = None
+
+def _init_worker(det_size, threads):
+    """ワーカーごとにモデル（検出 + 認識のみ）を 1 回だけロードする
+
+    ワーカー同士で CPU を分け合うので、ORT のスレッド数は threads に絞り、スピンさせない。
+    """
+    global _app
+    from model_bundle import local_root
+    from model_manager import FaceModel
+    from ort_session import SessionConfig
+
+    config = SessionConfig.from_env(intra_op_threads=threads, allow_spinning=False)
+    _app = FaceModel(name='buffalo_l', det_size=(det_size, det_size),
+                     allowed_modules=['detection', 'recognition'], root=local_root(),
+                     session_config=config, warmup=False).get()
+
+def process_image(img_path, sha256, margin, faces_dir, save_crops):
+    """1 枚の画像の顔を検出し、マニフェストの 1 行分の結果を返す"""
+    record = {'sha256': sha256, 'image': img_path, 'faces': []}
+    try:
+        img = Image.open(img_path).convert('RGB')
+        img_array = np.array(img)
+
+        # 顔検出
+        faces = _app.get(img_array)
+        image_filename = os.path.splitext(os.path.basename(img_path))[0]
+
+        for i, face in enumerate(faces):
+            # L2正規化
+            embedding = face.embedding / np.linalg.norm(face.embedding)
+
+            # バウンディングボックスを取得
+            bbox = face.bbox.astype(int)
+            x1, y1, x2, y2 = bbox
+
+            face_path = None
+            if save_crops:
+                # マージンを追加
+                width, height = x2 - x1, y2 - y1
+                margin_w, margin_h = int(width * margin), int(height * margin)
+
+                # マージン付きの座標を計算（画像の範囲内に収める）
+                x1_margin = max(0, x1 - margin_w)
+                y1_margin = max(0, y1 - margin_h)
+                x2_margin = min(img.width, x2 + margin_w)
+                y2_margin = min(img.height, y2 + margin_h)
+
+                # 顔領域を切り取って保存（元の画像名_顔番号.jpg）
+                face_img = img.crop((x1_margin, y1_margin, x2_margin, y2_margin))
+                face_path = os.path.join(faces_dir, f"idol_{image_filename}_face{i+1}.jpg")
+                face_img.save(face_path, quality=95)
+
+            record['faces'].append({
+                'face_index': i + 1,
+                'face_image': face_path,
+                'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                'vector': embedding.tolist(),
+            })
+    except Exception as e:
+        record['error'] = str(e)
+    return record
+
 def main():
     parser = argparse.ArgumentParser(description='アイドル画像から顔特徴ベクトルを抽出')
     parser.add_argument('--input_dir', type=str, default='idol_images', 
@@ -29,8 +156,25 @@ def main():
                         help='使用する顔の最大数')
     parser.add_argument('--margin', type=float, default=0.2,
                         help='顔の周りに追加するマージン（バウンディングボックスに対する割合）')
+    parser.add_argument('--export_vstore', action='store_true',
+                        help='JSONに加えてコンパイル済みベクトル（.vec）も書き出す')
+    parser.add_argument('--compile', nargs='+', metavar='PATH',
+                        help='既存のJSON（またはそのディレクトリ）を.vecにコンパイルして終了')
+    parser.add_argument('--vstore_dtype', choices=['float32', 'float16', 'int8'], default='float32',
+                        help='.vec のデータ型（float16 / int8 は量子化して保存する）')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='並列に処理するワーカープロセス数')
+    parser.add_argument('--no-crops', dest='no_crops', action='store_true',
+                        help='顔の切り抜き画像を保存しない')
+    parser.add_argument('--det_size', type=int, default=640, help='検出の入力サイズ')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='ワーカー 1 つあたりの ONNX Runtime のスレッド数')
     args = parser.parse_args()
     
+    if args.compile:
+        compile_vector_files(args.compile, dtype=args.vstore_dtype)
+        return
+    
     # 出力ディレクトリが存在するか確認
     output_dir = "functions/target_vectors"
     if not os.path.exists(output_dir):
@@ -38,7 +182,9 @@ def main():
     
     # 顔画像保存用ディレクトリの作成
     idol_faces_dir = os.path.join("face_images", args.faces_dir)
-    os.makedirs(idol_faces_dir, exist_ok=True)
+    save_crops = not args.no_crops
+    if save_crops:
+        os.makedirs(idol_faces_dir, exist_ok=True)
     
     # 入力ディレクトリが存在するか確認
     src_image_dir = os.path.join("src_images", args.input_dir)
@@ -48,117 +194,83 @@ def main():
         print(f"サポートされる画像形式: .jpg, .jpeg, .png")
         sys.exit(1)
     
-    # 画像ファイルのリストを取得（Pathを使用して重複を避ける）
-    image_files = []
-    for ext in ['.jpg', '.jpeg', '.png']:
-        for file in Path(src_image_dir).glob(f'*{ext.lower()}'):
-            image_files.append(str(file))
-        for file in Path(src_image_dir).glob(f'*{ext.upper()}'):
-            image_files.append(str(file))
-    
-    # 重複を排除
-    image_files = list(set(image_files))
+    # 画像ファイルのリストを取得（拡張子の大文字・小文字を問わず、名前順）
+    image_files = sorted(str(file) for file in Path(src_image_dir).iterdir()
+                         if file.suffix.lower() in ('.jpg', '.jpeg', '.png'))
     
     if not image_files:
         print(f"エラー: '{src_image_dir}' ディレクトリに画像ファイルが見つかりません。")
         sys.exit(1)
     
-    print(f"合計 {len(image_files)} 枚の画像が見つかりました。処理を開始します...")
+    # マニフェストを読み込み、新しい・変更された画像だけを処理する
+    output_path = os.path.join(output_dir, args.output)
+    manifest_path = os.path.splitext(output_path)[0] + '.manifest.jsonl'
+    manifest = load_manifest(manifest_path)
+    hashes = {img_path: file_sha256(img_path) for img_path in image_files}
+    todo = [p for p in image_files
+            if not (hashes[p] in manifest and is_reusable(manifest[hashes[p]], save_crops))]
+    
+    print(f"合計 {len(image_files)} 枚の画像が見つかりました"
+          f"（処理済み {len(image_files) - len(todo)} 枚、新規・変更 {len(todo)} 枚）。")
     
-    # InsightFaceの初期化
-    print("InsightFaceモデルをロードしています...")
-    app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-    app.prepare(ctx_id=0, det_size=(640, 640))
+    if todo:
+        print(f"InsightFaceモデルを {min(args.jobs, len(todo))} 個のワーカーでロードしています...")
+        with open(manifest_path, 'a', encoding='utf-8') as out, \
+                ProcessPoolExecutor(max_workers=min(args.jobs, len(todo)),
+                                    initializer=_init_worker,
+                                    initargs=(args.det_size, args.threads)) as executor:
+            futures = [executor.submit(process_image, p, hashes[p], args.margin,
+                                       idol_faces_dir, save_crops) for p in todo]
+            for done, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                # 1 枚ごとにマニフェストへ追記（途中で止まってもここまでの結果は残る）
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                manifest[record['sha256']] = record
+                if record.get('error'):
+                    print(f"  [{done}/{len(todo)}] エラー: {record['image']}: {record['error']}")
+                elif not record['faces']:
+                    print(f"  [{done}/{len(todo)}] 警告: 画像に顔が検出されませんでした: {record['image']}")
+                else:
+                    print(f"  [{done}/{len(todo)}] {record['image']}: 顔 {len(record['faces'])} 個")
     
-    # 結果を保存するデータ構造
+    # 結果を画像の名前順にまとめる
     result = {
         'vectors': [],       # 特徴ベクトルの配列
         'face_info': []      # 顔情報（元画像、切り出し後の画像パス、バウンディングボックスなど）
     }
-    
-    vector_index = 0
-    
-    # 各画像から顔を検出し、特徴ベクトルを抽出
     for img_path in image_files:
-        print(f"処理中: {img_path}")
-        
-        # 画像ファイル名（拡張子なし）を取得
-        image_filename = os.path.splitext(os.path.basename(img_path))[0]
-        
-        try:
-            img = Image.open(img_path).convert('RGB')
-            img_array = np.array(img)
-            
-            # 顔検出
-            faces = app.get(img_array)
-            
-            if not faces:
-                print(f"  警告: 画像に顔が検出されませんでした: {img_path}")
-                continue
-            
-            # 各顔の特徴ベクトルを正規化して保存
-            for i, face in enumerate(faces):
-                # L2正規化
-                embedding = face.embedding / np.linalg.norm(face.embedding)
-                
-                # バウンディングボックスを取得
-                bbox = face.bbox.astype(int)
-                x1, y1, x2, y2 = bbox
-                
-                # マージンを追加
-                width, height = x2 - x1, y2 - y1
-                margin_w, margin_h = int(width * args.margin), int(height * args.margin)
-                
-                # マージン付きの座標を計算（画像の範囲内に収める）
-                x1_margin = max(0, x1 - margin_w)
-                y1_margin = max(0, y1 - margin_h)
-                x2_margin = min(img.width, x2 + margin_w)
-                y2_margin = min(img.height, y2 + margin_h)
-                
-                # 顔領域を切り取り
-                face_img = img.crop((x1_margin, y1_margin, x2_margin, y2_margin))
-                
-                # 保存するファイル名（元の画像名_顔番号.jpg）
-                face_filename = f"idol_{image_filename}_face{i+1}.jpg"
-                face_path = os.path.join(idol_faces_dir, face_filename)
-                
-                # 顔画像を保存
-                face_img.save(face_path, quality=95)
-                
-                # ベクトルと顔情報を結果に追加
-                result['vectors'].append(embedding.tolist())
-                result['face_info'].append({
-                    'vector_index': vector_index,
-                    'original_image': img_path,
-                    'face_index': i + 1,
-                    'face_image': face_path,
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                })
-                
-                print(f"  顔 {i+1}/{len(faces)} を処理し、保存しました: {face_path}")
-                vector_index += 1
-                
-                # 最大数に達したら終了
-                if vector_index >= args.max_faces:
-                    break
-            
-            # 最大数に達したら終了
-            if vector_index >= args.max_faces:
-                print(f"最大顔数 {args.max_faces} に到達しました。")
-                break
-        
-        except Exception as e:
-            print(f"  エラー: 画像処理中に例外が発生しました: {e}")
+        record = manifest.get(hashes[img_path])
+        if record is None or record.get('error'):
             continue
+        for face in record['faces']:
+            if len(result['vectors']) >= args.max_faces:
+                break
+            result['face_info'].append({
+                'vector_index': len(result['vectors']),
+                'original_image': img_path,
+                'face_index': face['face_index'],
+                'face_image': face['face_image'],
+                'bbox': face['bbox']
+            })
+            result['vectors'].append(face['vector'])
+        if len(result['vectors']) >= args.max_faces:
+            print(f"最大顔数 {args.max_faces} に到達しました。")
+            break
     
-    # 結果の保存
-    output_path = os.path.join(output_dir, args.output)
+    # 結果の保存（一時ファイルに書いてから置き換える）
     if result['vectors']:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, output_path)
         
         print(f"合計 {len(result['vectors'])} 個の顔特徴ベクトルを {output_path} に保存しました。")
-        print(f"切り取った顔画像は {idol_faces_dir} に保存されています。")
+        
+        if args.export_vstore:
+            compile_vector_files([output_path], dtype=args.vstore_dtype)
+        if save_crops:
+            print(f"切り取った顔画像は {idol_faces_dir} に保存されています。")
     else:
         print("エラー: 有効な顔が検出されませんでした。")
         sys.exit(1)
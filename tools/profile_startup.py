@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cloud Functions（web-ui/functions/main.py）のコールドスタートの内訳を計測するスクリプト
+
+新しいプロセスで次の 2 つを計測します。
+
+    1. python -X importtime -c "import main" の結果を、モジュールごと（自身の時間・
+       依存を含む累積時間）とトップレベルのパッケージごとに集計した表
+    2. 起動の段階ごとの時間
+         import_main : main.py の import（モジュールの import + ターゲットベクトルの読み込みなど）
+         model       : FaceModel のロード（insightface の import / セッション作成 / ウォームアップ）。
+                       MODEL_PRELOAD が無ければ最初のリクエストで行う
+         first_image : 最初の 1 枚の検出 + 認識
+
+2 は --model を付けたときだけモデルをロードします（同梱モデルか ~/.insightface が必要）。
+--env で MODEL_PRELOAD=1 などの環境変数を指定して比較できます。
+
+使い方:
+    python tools/profile_startup.py [--top 25] [--model] [--json startup.json]
+    python tools/profile_startup.py --model --env MODEL_PRELOAD=1
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+TEST_IMAGE = Path(__file__).resolve().parent.parent / "tests" / "assets" / "test_image.jpg"
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+# 別プロセスで実行する計測（結果を JSON で標準出力の最終行に出す）
+_PHASES = """
+import json, sys, time
+t0 = time.perf_counter()
+import main
+result = {"import_main": time.perf_counter() - t0,
+          "insightface_imported": "insightface" in sys.modules,
+          "modules": len(sys.modules)}
+if MODEL:
+    from face_pipeline import embed_image
+    from image_io import decode_image
+    t0 = time.perf_counter()
+    app = main._face_model.get()
+    result["model"] = time.perf_counter() - t0
+    result["model_timings"] = main._face_model.timings
+    img = decode_image(IMAGE, max_side=main.DECODE_MAX_SIDE).array
+    t0 = time.perf_counter()
+    faces, _ = embed_image(app, img, policy=main.DET_POLICY, face_filter=main.FACE_FILTER)
+    result["first_image"] = time.perf_counter() - t0
+    result["faces"] = len(faces)
+print(json.dumps(result))
+"""
+
+
+def parse_importtime(text):
+    """-X importtime の出力を [(モジュール, 自身の μs, 累積 μs, 深さ)] にする"""
+    entries = []
+    for line in text.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cumulative_us, indent, module = m.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def by_package(entries):
+    """トップレベルのパッケージごとの自身の時間の合計（μs、多い順）"""
+    totals = {}
+    for module, self_us, _, _ in entries:
+        top = module.split(".")[0]
+        totals[top] = totals.get(top, 0) + self_us
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+
+def _run(args, env):
+    return subprocess.run([sys.executable, *args], cwd=FUNCTIONS_DIR, env=env,
+                          capture_output=True, text=True)
+
+
+def importtime(env):
+    proc = _run(["-X", "importtime", "-c", "import main"], env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import main に失敗しました:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def phases(env, model=False, image=TEST_IMAGE):
+    code = f"MODEL = {model!r}\nIMAGE = {str(image)!r}\n" + _PHASES
+    proc = _run(["-c", code], env)
+    if proc.returncode != 0:
+        raise RuntimeError(f"計測に失敗しました:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='main.py のコールドスタートの内訳')
+    parser.add_argument('--top', type=int, default=25, help='表示するモジュールの数')
+    parser.add_argument('--model', action='store_true',
+                        help='モデルのロードと最初の 1 枚の時間も計測する')
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='計測するプロセスに渡す環境変数')
+    parser.add_argument('--json', type=Path, default=None, help='結果を書き出す JSON')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update(item.split("=", 1) for item in args.env)
+
+    phases(env)   # .pyc を作っておく（1 回目はコンパイルの時間が入る）
+    entries = importtime(env)
+    total_us = sum(self_us for _, self_us, _, _ in entries)
+    print(f"import main: モジュール {len(entries)} 個 / 合計 {total_us / 1e6:.3f} 秒\n")
+
+    print(f"{'package':<32} {'self s':>8} {'share':>6}")
+    packages = by_package(entries)
+    for top, self_us in packages[:args.top]:
+        print(f"{top:<32} {self_us / 1e6:>8.3f} {self_us / total_us:>6.1%}")
+
+    print(f"\n{'module（累積の多い順）':<48} {'cumul s':>8} {'self s':>8}")
+    for module, self_us, cumulative_us, _ in sorted(entries, key=lambda e: -e[2])[:args.top]:
+        print(f"{module:<48} {cumulative_us / 1e6:>8.3f} {self_us / 1e6:>8.3f}")
+
+    result = phases(env, model=args.model)
+    print(f"\n起動の段階: import main {result['import_main']:.3f} 秒 "
+          f"（insightface の import {'あり' if result['insightface_imported'] else 'なし'}）")
+    if args.model:
+        timings = result["model_timings"]
+        print(f"  モデル {result['model']:.3f} 秒（import {timings.get('import', 0):.3f} / "
+              f"ロード {timings.get('load', 0):.3f} / ウォームアップ {timings.get('warmup', 0):.3f}）")
+        print(f"  最初の 1 枚 {result['first_image']:.3f} 秒（{result['faces']} 顔）")
+        print(f"  最初のリクエスト（モデル + 最初の 1 枚）{result['model'] + result['first_image']:.3f} 秒")
+        print(f"  合計 {result['import_main'] + result['model'] + result['first_image']:.3f} 秒")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "env": args.env, "phases": result,
+            "packages": [{"package": top, "self_us": us} for top, us in packages],
+            "modules": [{"module": m, "self_us": s, "cumulative_us": c, "depth": d}
+                        for m, s, c, d in entries],
+        }, ensure_ascii=False, indent=1) + "\n", encoding="utf-8")
+        print(f"\n結果を書き出しました: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
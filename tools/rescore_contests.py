@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+保存済みの顔の埋め込み（faceEmbeddings）から contestScores を再計算するスクリプト
+
+ターゲットベクトル（contest_vectors_*）をデプロイした後に実行すると、前回の実行から
+追加・変更・削除されたコンテストの列だけを、推論なしで NumPy の行列演算で
+計算し直します（web-ui/functions/rescoring.py）。埋め込みが保存されていない古い写真は
+Storage から読み込んでまとめて推論し、埋め込みも保存します。最後に leaderboards も作り直します。
+途中で止めても、同じコマンドをもう一度実行すればチェックポイントから再開します。
+
+    mean: 全ペアの類似度平均（score_image と同じ）
+    max : 顔ごとの最大類似度の合計 / 顔の数^α（functions_bkp と同じ）
+
+使い方:
+    python tools/rescore_contests.py                       # 差分だけ
+    python tools/rescore_contests.py --all --formula max   # 全コンテストを max 式で
+    python tools/rescore_contests.py --emulator            # ローカルのエミュレーター
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Cloud Functions 側のモジュールを利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from leaderboard import rebuild as rebuild_leaderboards  # noqa: E402
+from rescoring import PAGE_SIZE, Checkpoint, make_inference_fallback, rescore  # noqa: E402
+from vector_store import load_vector_sets  # noqa: E402
+
+PROJECT_ID = "wedding-photo-contest-dev-032"
+BUCKET_NAME = "wedding-photo-contest-dev-032.firebasestorage.app"
+# web-ui/firebase.json のエミュレーター
+FIRESTORE_EMULATOR_HOST = "localhost:8080"
+STORAGE_EMULATOR_HOST = "http://localhost:9199"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='faceEmbeddings から contestScores を再計算')
+    parser.add_argument('--vec_dir', type=Path, default=FUNCTIONS_DIR / "target_vectors",
+                        help='contest_vectors_* のディレクトリ')
+    parser.add_argument('--formula', choices=['mean', 'max'], default='mean',
+                        help='スコア式（mean: 類似度平均 / max: 最大類似度の合計 / n^α）')
+    parser.add_argument('--alpha', type=float, default=float(os.environ.get('ALPHA', 0.8)),
+                        help='max のときの α')
+    parser.add_argument('--all', action='store_true',
+                        help='差分に関係なく全コンテストを再計算する')
+    parser.add_argument('--project', default=PROJECT_ID, help='Firebase のプロジェクト ID')
+    parser.add_argument('--bucket', default=BUCKET_NAME, help='写真のバケット')
+    parser.add_argument('--emulator', action='store_true',
+                        help='Firestore / Storage のエミュレーターに接続する')
+    parser.add_argument('--checkpoint', type=Path, default=Path('rescore_checkpoint.json'),
+                        help='チェックポイントのファイル')
+    parser.add_argument('--page_size', type=int, default=PAGE_SIZE,
+                        help='1 コミットで処理する写真数')
+    parser.add_argument('--no_inference', action='store_true',
+                        help='埋め込みが無い写真は推論せずスキップする')
+    parser.add_argument('--dry_run', action='store_true', help='計算だけして書き込まない')
+    args = parser.parse_args()
+
+    if args.emulator:
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", FIRESTORE_EMULATOR_HOST)
+        os.environ.setdefault("STORAGE_EMULATOR_HOST", STORAGE_EMULATOR_HOST)
+    from google.cloud import firestore
+    db = firestore.Client(project=args.project)
+
+    target_sets = load_vector_sets(args.vec_dir)
+    if not target_sets:
+        print(f"エラー: ターゲットベクトルが見つかりません: {args.vec_dir}")
+        sys.exit(1)
+
+    infer_missing = None
+    if not args.no_inference:
+        from google.cloud import storage
+        from detection_policy import DetectionPolicy
+        from face_filter import FaceFilter
+        from model_bundle import local_root
+        from model_manager import FaceModel
+        from storage_io import BufferPool
+        # score_image と同じ設定（DET_POLICY / FACE_FILTER の環境変数）で推論する
+        policy = DetectionPolicy.parse(os.environ.get("DET_POLICY"))
+        bucket = storage.Client(project=args.project).bucket(args.bucket)
+        infer_missing = make_inference_fallback(
+            FaceModel(name="buffalo_l", root=local_root(),
+                      det_size=(policy.base_size, policy.base_size)),
+            bucket, BufferPool(), max_side=1280, policy=policy,
+            face_filter=FaceFilter.parse(os.environ.get("FACE_FILTER")))
+
+    t0 = time.perf_counter()
+    stats = rescore(db, target_sets, formula=args.formula, alpha=args.alpha, full=args.all,
+                    checkpoint=Checkpoint(args.checkpoint), infer_missing=infer_missing,
+                    delete_field=firestore.DELETE_FIELD, page_size=args.page_size,
+                    dry_run=args.dry_run)
+    if not stats["changed"] and not stats["removed"]:
+        print("ターゲットベクトルに変更はありません")
+        return
+    # 再計算したスコアでランキング（leaderboards）も作り直す
+    if not args.dry_run:
+        rebuild_leaderboards(db)
+    elapsed = time.perf_counter() - t0
+    print(f"再計算: {', '.join(stats['changed']) or '-'} / 削除: {', '.join(stats['removed']) or '-'}"
+          f"{'（チェックポイントから再開）' if stats['resumed'] else ''}")
+    print(f"写真 {stats['photos']} 枚（推論 {stats['inferred']} 枚、スキップ {stats['skipped']} 枚）/ "
+          f"{stats['commits']} コミット / {elapsed:.2f} 秒{'（dry run）' if args.dry_run else ''}")
+    if stats["skipped"] and not args.dry_run:
+        print("埋め込みの無い写真をスキップしたので、変更は記録していません（チェックポイントは最初に"
+              "スキップした写真の手前です）。--no_inference を付けずに再実行してください")
+
+
+if __name__ == "__main__":
+    main()
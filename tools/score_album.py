@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+アルバム（ローカルの画像ディレクトリ）をまとめてスコア計算するスクリプト
+
+score_image と同じ処理（縮小デコード → 検出 → まとめて認識 → 全コンテストの
+スコア）を、プロセスプールで並列に実行します。各ワーカーは ONNX Runtime の
+セッションを 1 つずつ持ち、モデルのロードはワーカーの起動時に 1 回だけ行います。
+
+結果は 1 枚終わるごとに JSONL に追記するので、途中で止めても --resume で
+続きから再開できます。出力を .parquet にすると、JSONL に書きながら最後に
+Parquet に変換します（pyarrow が必要）。
+
+使い方:
+    python tools/score_album.py /media/sdcard/DCIM --output album_scores.jsonl --jobs 4
+    python tools/score_album.py paths.txt --output album_scores.parquet --resume
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+# Cloud Functions 側のモジュールを利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+DECODE_MAX_SIDE = 1280   # main.py と同じ
+
+# ---------- ワーカープロセス ----------
+_worker = {}
+
+
+def _init_worker(det_policy, face_filter, max_side, threads):
+    """ワーカーごとにモデルを 1 回だけロードする"""
+    from detection_policy import DetectionPolicy
+    from face_filter import FaceFilter
+    from model_bundle import local_root
+    from model_manager import FaceModel
+    from ort_session import SessionConfig
+
+    policy = DetectionPolicy.parse(det_policy)
+    config = SessionConfig.from_env(intra_op_threads=threads, allow_spinning=False,
+                                    cache_dir=FUNCTIONS_DIR / "ort_cache")
+    model = FaceModel(det_size=(policy.base_size, policy.base_size), session_config=config,
+                      root=local_root(),
+                      warmup_det_sizes=policy.sizes)
+    _worker.update(app=model.get(), max_side=max_side, policy=policy,
+                   face_filter=FaceFilter.parse(face_filter))
+
+
+def _embed_file(path):
+    """1 枚をデコード・推論して (path, 埋め込み, 除いた顔の数, 秒数, エラー) を返す
+
+    スコアは親プロセスで計算する。
+    """
+    from face_pipeline import embed_image
+    from image_io import decode_image
+
+    t0 = time.perf_counter()
+    stats = {}
+    try:
+        decoded = decode_image(path, max_side=_worker["max_side"])
+        _, embs = embed_image(_worker["app"], decoded.array, hires=decoded,
+                              policy=_worker["policy"], face_filter=_worker["face_filter"],
+                              stats=stats)
+        return path, embs, stats.get("facesFiltered", 0), time.perf_counter() - t0, None
+    except Exception as e:
+        return path, None, 0, time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+
+
+# ---------- 入出力 ----------
+def collect_paths(inputs):
+    """ディレクトリ（再帰）・画像ファイル・パスの一覧ファイル（1 行 1 パス）から画像を集める"""
+    paths = []
+    for item in map(Path, inputs):
+        if item.is_dir():
+            paths.extend(p for p in sorted(item.rglob("*")) if p.suffix.lower() in IMAGE_EXTS)
+        elif item.suffix.lower() in IMAGE_EXTS:
+            paths.append(item)
+        elif item.is_file():
+            with open(item, encoding="utf-8") as f:
+                paths.extend(Path(line.strip()) for line in f if line.strip())
+    return [str(p) for p in dict.fromkeys(paths)]
+
+
+def load_done(journal):
+    """JSONL に書き込み済みの画像パス（最後の行が途中で切れていても読める分だけ）"""
+    done = set()
+    if not journal.exists():
+        return done
+    with open(journal, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["path"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return done
+
+
+def to_parquet(journal, output):
+    """JSONL を scores.<contest> を列に展開した Parquet に変換する"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("エラー: Parquet の出力には pyarrow が必要です（pip install pyarrow）")
+        print(f"結果は {journal} に保存されています。")
+        sys.exit(1)
+
+    rows = []
+    with open(journal, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            scores = record.pop("scores", None) or {}
+            rows.append({**record, **{f"score_{k}": v for k, v in scores.items()}})
+    pq.write_table(pa.Table.from_pylist(rows), output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='アルバムをまとめてスコア計算する')
+    parser.add_argument('inputs', nargs='+',
+                        help='画像のディレクトリ / 画像ファイル / パスの一覧ファイル')
+    parser.add_argument('--output', type=Path, default=Path('album_scores.jsonl'),
+                        help='結果のファイル（.jsonl または .parquet）')
+    parser.add_argument('--vec_dir', type=Path, default=FUNCTIONS_DIR / "target_vectors",
+                        help='contest_vectors_* のディレクトリ')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='ワーカープロセス数')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='ワーカーあたりの ONNX Runtime スレッド数')
+    parser.add_argument('--formula', choices=['mean', 'max'], default='mean',
+                        help='スコア式（mean: 類似度平均 / max: 最大類似度の合計 / n^α）')
+    parser.add_argument('--alpha', type=float, default=float(os.environ.get('ALPHA', 0.8)),
+                        help='max のときの α')
+    parser.add_argument('--det_policy', default='fixed:640',
+                        help='検出サイズのポリシー（fixed:640 / adaptive:320,640,960）')
+    parser.add_argument('--face_filter', default=None,
+                        help='認識の前に除く顔の条件（例 min_size=0.015,min_score=0.6。'
+                             '空文字なら除かない。既定は score_image の既定と同じで除かない）')
+    parser.add_argument('--max_side', type=int, default=DECODE_MAX_SIDE,
+                        help='デコード時の縮小目安（0 なら縮小しない）')
+    parser.add_argument('--resume', action='store_true',
+                        help='出力に書き込み済みの画像をスキップして続きから処理する')
+    args = parser.parse_args()
+
+    from target_index import FusedTargets, build_indexes
+    from vector_store import load_vector_sets
+
+    target_sets = load_vector_sets(args.vec_dir)
+    if not target_sets:
+        print(f"エラー: ターゲットベクトルが見つかりません: {args.vec_dir}")
+        sys.exit(1)
+    fused = FusedTargets(build_indexes(target_sets))
+
+    parquet = args.output.suffix == ".parquet"
+    journal = args.output.with_suffix(".jsonl") if parquet else args.output
+    paths = collect_paths(args.inputs)
+    if args.resume:
+        done = load_done(journal)
+        paths = [p for p in paths if p not in done]
+    elif journal.exists():
+        journal.unlink()
+    if not paths:
+        print("処理する画像がありません")
+        if parquet and journal.exists():
+            to_parquet(journal, args.output)
+        return
+
+    print(f"{len(paths)} 枚 / ワーカー {args.jobs} x ORT スレッド {args.threads} / "
+          f"コンテスト {len(fused.names)} 件（{args.formula}）")
+    n_images = n_faces = n_filtered = n_errors = 0
+    t_start = time.perf_counter()
+    with open(journal, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                                initargs=(args.det_policy, args.face_filter,
+                                          args.max_side or None,
+                                          args.threads)) as executor:
+        # 投入する数を抑えて、終わったものから順に書き出す
+        pending, queue = set(), iter(paths)
+        while True:
+            for path in queue:
+                pending.add(executor.submit(_embed_file, path))
+                if len(pending) >= args.jobs * 4:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, embs, filtered, sec, error = future.result()
+                record = {"path": path, "faceCount": 0, "scores": None,
+                          "facesFiltered": filtered, "ms": round(sec * 1000, 1)}
+                n_filtered += filtered
+                if error:
+                    record["error"] = error
+                    n_errors += 1
+                elif len(embs):
+                    scores = (fused.max_scores(embs, args.alpha) if args.formula == "max"
+                              else fused.mean_scores(embs))
+                    record.update(faceCount=len(embs), scores=scores)
+                    n_faces += len(embs)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                n_images += 1
+                if n_images % 50 == 0:
+                    elapsed = time.perf_counter() - t_start
+                    print(f"  {n_images}/{len(paths)} 枚 "
+                          f"({n_images / elapsed:.2f} images/sec, {n_faces / elapsed:.1f} faces/sec)")
+
+    elapsed = time.perf_counter() - t_start
+    print(f"完了: {n_images} 枚（エラー {n_errors} 枚）/ 顔 {n_faces} 個"
+          f"（認識の前に除いた顔 {n_filtered} 個）/ {elapsed:.1f} 秒")
+    print(f"スループット: {n_images / elapsed:.2f} images/sec, {n_faces / elapsed:.1f} faces/sec"
+          f"（モデルのロードを含む）")
+    if parquet:
+        to_parquet(journal, args.output)
+        print(f"Parquet に変換しました: {args.output}")
+    else:
+        print(f"結果: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
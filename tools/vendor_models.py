@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+スコア計算に使う InsightFace のモデル（buffalo_l の検出 + 認識）を関数のディレクトリに配置するスクリプト
+
+~/.insightface/models/buffalo_l（無ければ --download で取得）から det_10g.onnx と
+w600k_r50.onnx だけを web-ui/functions/insightface/models/buffalo_l にコピーし、
+コミット済みの checksums.json の SHA-256 とサイズに一致しないファイルは配置しません
+（web-ui/functions/model_bundle.py）。checksums.json がまだ無いとき（最初の配置）と
+モデルを更新するときだけ、公開されている buffalo_l から --update を付けて配置し、
+ファイルから作られた checksums.json をコミットしてください。デプロイ前とテストの前に一度実行します
+（firebase deploy は predeploy で --check を実行し、配置されていなければ中止します）。
+
+使い方:
+    python tools/vendor_models.py
+    python tools/vendor_models.py --source /path/to/buffalo_l
+    python tools/vendor_models.py --download        # buffalo_l.zip をダウンロードしてから配置
+    python tools/vendor_models.py --download --update   # checksums.json を作る・書き直す
+    python tools/vendor_models.py --check           # 配置済みのファイルを確認するだけ
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Cloud Functions 側のモジュールを利用する
+FUNCTIONS_DIR = Path(__file__).resolve().parent.parent / "web-ui" / "functions"
+sys.path.append(str(FUNCTIONS_DIR))
+
+from model_bundle import BUNDLE_ROOT, ModelBundleError, model_dir, vendor, verify  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='InsightFace のモデルを関数のディレクトリに配置する')
+    parser.add_argument('--name', default='buffalo_l', help='InsightFace のモデル名')
+    parser.add_argument('--source', type=Path, default=None,
+                        help='展開済みのモデルのディレクトリ（既定は ~/.insightface/models/<name>）')
+    parser.add_argument('--download', action='store_true',
+                        help='ソースが無ければ insightface でダウンロードする')
+    parser.add_argument('--update', action='store_true',
+                        help='配置したファイルから checksums.json を作る・書き直す（最初の配置とモデルの更新）')
+    parser.add_argument('--check', action='store_true', help='配置済みのファイルを確認するだけ')
+    args = parser.parse_args()
+
+    try:
+        if args.check:
+            verify(BUNDLE_ROOT, args.name, full=True)
+            print(f"OK: {model_dir(BUNDLE_ROOT, args.name)}")
+            return
+        source = args.source or Path.home() / ".insightface" / "models" / args.name
+        if not source.exists() and args.download:
+            from insightface.utils.storage import ensure_available
+            source = Path(ensure_available("models", args.name, root="~/.insightface"))
+        checksums = vendor(source, BUNDLE_ROOT, args.name, update=args.update)
+    except ModelBundleError as e:
+        print(f"エラー: {e}")
+        sys.exit(1)
+
+    for file_name, entry in checksums.items():
+        print(f"  {file_name}  {entry['size'] / 1e6:.1f} MB  sha256={entry['sha256'][:16]}…")
+    print(f"配置しました: {model_dir(BUNDLE_ROOT, args.name)}")
+
+
+if __name__ == "__main__":
+    main()
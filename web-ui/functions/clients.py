@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Storage / Firestore クライアント（と Firestore のトランザクションの実行関数）のレジストリ
+
+クライアントはインスタンスごとに一度だけ作り、以降の呼び出しで使い回す。
+google-cloud のクライアントはスレッドセーフで、Firestore の gRPC チャネルや
+Storage の HTTP セッション（コネクションプール）もクライアント単位で保持されるので、
+同じインスタンスを共有すれば認証・TLS ハンドシェイクは初回だけになる。
+"""
+
+import threading
+
+
+def _storage_factory():
+    from google.cloud import storage
+    return storage.Client()
+
+
+def _firestore_factory():
+    from google.cloud import firestore
+    return firestore.Client()
+
+
+def _transactional_factory():
+    from google.cloud.firestore import transactional
+    return transactional
+
+
+class ClientRegistry:
+    """名前ごとにクライアントを一度だけ生成して保持する（スレッドセーフ）"""
+
+    def __init__(self, factories=None):
+        self._factories = dict(factories or {
+            "storage": _storage_factory,
+            "firestore": _firestore_factory,
+            "transactional": _transactional_factory,
+        })
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory):
+        """生成関数を登録する（テストでフェイクに差し替える場合など）"""
+        with self._lock:
+            self._factories[name] = factory
+            self._clients.pop(name, None)
+
+    def get(self, name):
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = self._factories[name]()
+            return self._clients[name]
+
+    def storage(self):
+        return self.get("storage")
+
+    def firestore(self):
+        return self.get("firestore")
+
+    def transactional(self):
+        """firestore.transactional（フェイクの Firestore を登録したときはフェイク用のものを登録する）"""
+        return self.get("transactional")
+
+
+registry = ClientRegistry()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+画像の内容ハッシュをキーにしたスコアのキャッシュ
+
+Storage の finalize イベントは再配信されることがあり、同じ写真（LINE アルバムの
+同じ画像など）が何度もアップロードされることもある。イベントのメタデータにある
+MD5（無ければ CRC32C）をキーに、検出・認識の結果（顔の数とスコア）を保存しておき、
+ヒットしたら画像をダウンロード・デコードせずにそのスコアを書き込む。
+
+    1 段目: インスタンス内の LRU
+    2 段目: Firestore の scoreCache コレクション（インスタンス間で共有）
+
+スコアはターゲットベクトルに依存するので、値には targetsVersion
+（vector_store.fingerprint）を入れ、現在のバージョンと違うものはミス扱いにする。
+"""
+
+import base64
+import logging
+import threading
+from collections import OrderedDict
+
+CACHE_COLLECTION = "scoreCache"
+
+
+def cache_key(md5_hash=None, crc32c=None):
+    """イベント / blob の md5Hash・crc32c（base64）からキャッシュキーを作る
+
+    Firestore のドキュメント ID に使えるよう 16 進にする。どちらも無ければ None。
+    """
+    for algo, value in (("md5", md5_hash), ("crc32c", crc32c)):
+        if value:
+            try:
+                return f"{algo}-{base64.b64decode(value).hex()}"
+            except (ValueError, TypeError):
+                logging.warning("Invalid %s hash: %r", algo, value)
+    return None
+
+
+class LRUCache:
+    """スレッドセーフな LRU キャッシュ"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ContentCache:
+    """LRU + Firestore の 2 段キャッシュ
+
+    Args:
+        version: 現在のターゲットベクトルのバージョン
+        collection: Firestore のコレクションを返す関数（None なら LRU のみ）
+        maxsize: LRU の件数
+    """
+
+    def __init__(self, version, collection=None, maxsize=1024):
+        self.version = version
+        self._collection = collection
+        self._local = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.counts = {"hit_local": 0, "hit_remote": 0, "miss": 0}
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def get(self, key):
+        """(value, outcome) を返す。outcome は "hit_local" / "hit_remote" / "miss"
+
+        value は {"faceCount": int, "scores": {...}, "faces": bytes}。ミスなら None。
+        """
+        if key is None:
+            self._count("miss")
+            return None, "miss"
+
+        value = self._local.get(key)
+        if value is not None and value.get("targetsVersion") == self.version:
+            self._count("hit_local")
+            return value, "hit_local"
+
+        if self._collection is not None:
+            try:
+                snapshot = self._collection().document(key).get()
+                value = snapshot.to_dict() if snapshot.exists else None
+            except Exception as e:
+                logging.warning("Score cache lookup failed for %s: %s", key, e)
+                value = None
+            if value is not None and value.get("targetsVersion") == self.version:
+                self._local.put(key, value)
+                self._count("hit_remote")
+                return value, "hit_remote"
+
+        self._count("miss")
+        return None, "miss"
+
+    def put(self, key, face_count, scores, path=None, faces=None, batch=None):
+        """結果を保存する（顔が無かった画像も faceCount=0 で保存する）
+
+        faces は face_embeddings.encode のバイナリ（ヒットした写真の faceEmbeddings 用）。
+
+        batch（Firestore の WriteBatch）を渡すと、Firestore への書き込みは
+        その batch に積むだけにする。積んだら True を返す。
+        """
+        if key is None:
+            return False
+        value = {"faceCount": face_count, "scores": scores,
+                 "targetsVersion": self.version, "path": path, "faces": faces}
+        self._local.put(key, value)
+        if self._collection is None:
+            return False
+        try:
+            ref = self._collection().document(key)
+            if batch is not None:
+                batch.set(ref, value)
+                return True
+            ref.set(value)
+        except Exception as e:
+            logging.warning("Score cache store failed for %s: %s", key, e)
+        return False
+
+    def stats(self):
+        """ログ用の集計（累計のヒット数とヒット率）"""
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        hits = counts["hit_local"] + counts["hit_remote"]
+        return {
+            "cacheHitsLocal": counts["hit_local"],
+            "cacheHitsRemote": counts["hit_remote"],
+            "cacheMisses": counts["miss"],
+            "cacheHitRate": round(hits / total, 3) if total else 0.0,
+        }
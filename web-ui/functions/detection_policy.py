@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+顔検出の入力サイズ（det_size）の選び方
+
+検出モデル（SCRFD）は画像を det_size x det_size に縮小・パディングしてから推論するので、
+計算量は det_size の 2 乗に比例する。自撮りのように顔が大きい写真は 320 でも同じ顔が
+見つかるが、集合写真の小さい顔は 640 以上でないと取りこぼす。
+
+    fixed:640            常に 640（従来どおり）
+    adaptive:320,640,960 まず 320 で検出し（画像が 320 以下ならそれだけ）、
+                         - 顔が見つからない・小さい顔がある → 640 で検出し直す
+                         - 640 でも顔が少なく小さい大きな画像（遠くから撮った集合写真）
+                           → 960 で検出し直す
+    tiled:640,640        まず画像全体を 640 で検出し、大きな画像で小さい顔がたくさん
+                         見つかったとき（大人数の集合写真で後ろの列を取りこぼしている）だけ、
+                         画像を縮小せずに 640x640 の重なりのあるタイルに分けて検出し、
+                         全体の検出結果と合わせて NMS でまとめる
+
+ポリシーは "fixed:<size>" / "adaptive:<prepass>,<base>,<max>" / "tiled:<base>,<tile>" の
+文字列で指定する（main.py では環境変数 DET_POLICY）。
+"""
+
+import logging
+import math
+
+import numpy as np
+
+DEFAULT_SPEC = "fixed:640"
+ADAPTIVE_SIZES = (320, 640, 960)
+TILED_SIZES = (640, 640)
+
+
+def tile_grid(shape, tile, overlap):
+    """画像を tile x tile のタイルで覆う左上の座標 [(x0, y0), ...]
+
+    隣り合うタイルは overlap ピクセル以上重なる（端のタイルも画像からはみ出さない）。
+    """
+    def starts(length):
+        if length <= tile:
+            return [0]
+        n = math.ceil((length - overlap) / (tile - overlap))
+        return [int(round(v)) for v in np.linspace(0, length - tile, n)]
+
+    h, w = shape[:2]
+    return [(x0, y0) for y0 in starts(h) for x0 in starts(w)]
+
+
+def _box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda b: (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])  # noqa: E731
+    return inter / np.maximum(area(box) + area(boxes) - inter, 1e-6)
+
+
+def merge_faces(faces, iou=0.4):
+    """det_score の高い順に、IoU が iou を超えて重なる顔を除く（NMS）"""
+    if len(faces) < 2:
+        return list(faces)
+    boxes = np.stack([np.asarray(f.bbox[:4], dtype=np.float32) for f in faces])
+    order = np.argsort([-float(f.det_score) for f in faces], kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        order = rest[_box_iou(boxes[i], boxes[rest]) <= iou]
+    return [faces[i] for i in sorted(keep)]
+
+
+class DetectionPolicy:
+    """検出サイズの決め方
+
+    Args:
+        mode: "fixed" / "adaptive" / "tiled"
+        sizes: fixed なら (size,)、adaptive なら (prepass, base, max)、tiled なら (base, tile)
+        min_face_px: 検出入力上の顔の短辺がこれ未満なら、もっと大きいサイズでも検出する
+        group_max_faces: base で見つかった顔がこれ以下で、どれも小さいときだけ max に上げる
+        small_face_ratio: 「小さい顔」とみなす、顔の短辺 / 画像の長辺
+        tile_min_faces: tiled で、全体の検出で見つかった顔がこれ以上のときだけタイルに分ける
+        tile_face_px: tiled で、全体の検出入力上の顔の短辺の中央値がこれ未満のときだけタイルに分ける
+        tile_min_gain: tiled で、画像の長辺 / base がこれ以上（タイルで解像度が上がる）のときだけ分ける
+        tile_overlap: 隣り合うタイルの重なり（タイルの辺に対する割合。小さい顔の大きさより広くする）
+        nms_iou: 全体とタイルの検出結果をまとめるときに同じ顔とみなす IoU
+    """
+
+    def __init__(self, mode="fixed", sizes=(640,), min_face_px=24, group_max_faces=3,
+                 small_face_ratio=0.05, tile_min_faces=6, tile_face_px=32, tile_min_gain=1.5,
+                 tile_overlap=0.25, nms_iou=0.4):
+        if mode not in ("fixed", "adaptive", "tiled"):
+            raise ValueError(f"unknown detection policy: {mode}")
+        sizes = tuple(int(s) for s in sizes)
+        if mode == "fixed" and len(sizes) != 1:
+            raise ValueError(f"fixed policy takes one size: {sizes}")
+        if mode == "adaptive" and (len(sizes) != 3 or list(sizes) != sorted(sizes)):
+            raise ValueError(f"adaptive policy takes prepass <= base <= max: {sizes}")
+        if mode == "tiled" and len(sizes) != 2:
+            raise ValueError(f"tiled policy takes base and tile sizes: {sizes}")
+        self.mode = mode
+        self.sizes = sizes
+        self.min_face_px = min_face_px
+        self.group_max_faces = group_max_faces
+        self.small_face_ratio = small_face_ratio
+        self.tile_min_faces = tile_min_faces
+        self.tile_face_px = tile_face_px
+        self.tile_min_gain = tile_min_gain
+        self.tile_overlap = tile_overlap
+        self.nms_iou = nms_iou
+
+    @classmethod
+    def parse(cls, spec=None):
+        """"fixed:640" / "adaptive" / "adaptive:320,640,960" / "tiled:640,640" から作る"""
+        spec = (spec or DEFAULT_SPEC).strip()
+        mode, _, sizes = spec.partition(":")
+        if not sizes:
+            default = {"fixed": (640,), "tiled": TILED_SIZES}.get(mode, ADAPTIVE_SIZES)
+            sizes = ",".join(map(str, default))
+        return cls(mode, [int(s) for s in sizes.split(",")])
+
+    @property
+    def spec(self):
+        return f"{self.mode}:{','.join(map(str, self.sizes))}"
+
+    @property
+    def base_size(self):
+        """FaceAnalysis.prepare() に渡す det_size（fixed の size / adaptive・tiled の base）"""
+        return self.sizes[1] if self.mode == "adaptive" else self.sizes[0]
+
+    def __repr__(self):
+        return f"DetectionPolicy({self.spec!r})"
+
+    def _too_small(self, faces, shape, size):
+        """検出入力上で min_face_px 未満の顔があるか"""
+        scale = size / max(shape[:2])
+        return any(min(f.bbox[2] - f.bbox[0], f.bbox[3] - f.bbox[1]) * scale < self.min_face_px
+                   for f in faces)
+
+    def _distant_group(self, faces, shape):
+        """顔が少なく、どれも画像に比べて小さい（遠くから撮った集合写真で取りこぼしている）"""
+        if not faces or len(faces) > self.group_max_faces:
+            return False
+        limit = max(shape[:2]) * self.small_face_ratio
+        return all(min(f.bbox[2] - f.bbox[0], f.bbox[3] - f.bbox[1]) < limit for f in faces)
+
+    def _crowded(self, faces, shape, size):
+        """大きな画像で小さい顔がたくさん見つかった（タイルに分ければもっと見つかりそう）"""
+        if len(faces) < self.tile_min_faces or max(shape[:2]) < size * self.tile_min_gain:
+            return False
+        scale = size / max(shape[:2])
+        sides = [min(f.bbox[2] - f.bbox[0], f.bbox[3] - f.bbox[1]) * scale for f in faces]
+        return float(np.median(sides)) < self.tile_face_px
+
+    def _detect_tiles(self, detect_fn, img, tile):
+        """重なりのあるタイルごとに縮小せずに検出し、img の座標に戻した顔のリストを返す
+
+        タイルの内側の辺に接している顔は、重なっている隣のタイルに丸ごと写っているので除く。
+        detect_fn が返した顔の bbox / kps はその場で img の座標に書き換える。
+        """
+        h, w = img.shape[:2]
+        grid = tile_grid(img.shape, tile, int(tile * self.tile_overlap))
+        faces = []
+        for x0, y0 in grid:
+            crop = img[y0:y0 + tile, x0:x0 + tile]
+            ch, cw = crop.shape[:2]
+            for f in detect_fn(crop, tile):
+                x1, y1, x2, y2 = f.bbox[:4]
+                if (x0 > 0 and x1 < 2) or (y0 > 0 and y1 < 2) or \
+                        (x0 + cw < w and x2 > cw - 2) or (y0 + ch < h and y2 > ch - 2):
+                    continue
+                f.bbox = np.asarray(f.bbox, dtype=np.float32) + \
+                    np.array([x0, y0, x0, y0], dtype=np.float32)
+                if getattr(f, "kps", None) is not None:
+                    f.kps = np.asarray(f.kps, dtype=np.float32) + np.array([x0, y0], np.float32)
+                faces.append(f)
+        return faces, len(grid)
+
+    def detect(self, detect_fn, img):
+        """detect_fn(img, size) で検出し (faces, 使ったサイズのリスト) を返す
+
+        tiled でタイルに分けた場合、サイズのリストにはタイルの数だけ tile が入る。
+        """
+        if self.mode == "fixed":
+            return detect_fn(img, self.sizes[0]), [self.sizes[0]]
+
+        if self.mode == "tiled":
+            base, tile = self.sizes
+            faces = detect_fn(img, base)
+            if not self._crowded(faces, img.shape, base):
+                return faces, [base]
+            tiled, n_tiles = self._detect_tiles(detect_fn, img, tile)
+            merged = merge_faces(list(faces) + tiled, self.nms_iou)
+            logging.debug("Tiled detection: tiles=%d faces=%d->%d", n_tiles, len(faces), len(merged))
+            return merged, [base] + [tile] * n_tiles
+
+        prepass, base, largest = self.sizes
+        long_side = max(img.shape[:2])
+        faces = detect_fn(img, prepass)
+        tried = [prepass]
+        # 画像がプレパスのサイズ以下なら、大きくしても解像度は増えない
+        if long_side <= prepass or (faces and not self._too_small(faces, img.shape, prepass)):
+            return faces, tried
+
+        faces = detect_fn(img, base)
+        tried.append(base)
+        if long_side > base and largest > base and self._distant_group(faces, img.shape):
+            faces = detect_fn(img, largest)
+            tried.append(largest)
+        logging.debug("Adaptive detection: sizes=%s faces=%d", tried, len(faces))
+        return faces, tried
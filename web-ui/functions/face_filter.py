@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+検出した顔のうち、認識に回す価値のない顔を除く（検出と認識の間の段）
+
+披露宴の集合写真では、後ろの席のゲストが小さい・ぼやけた・確信度の低い顔として
+何十個も検出され、全部を認識してスコアの平均に混ぜていた。ここでは
+
+    min_size  : bbox の短辺 / 画像の長辺 がこれ未満の顔を除く（0.02 なら 1280px 画像で 25px）
+    min_score : det_score がこれ未満の顔を除く
+    max_yaw   : 5 点のランドマークから推定した横向きの角度（度）がこれを超える顔を除く
+    min_sharpness : 顔の領域のラプラシアンの分散がこれ未満（ぼやけている）の顔を除く
+
+の条件で顔を絞り込む。設定は "min_size=0.02,min_score=0.6,max_yaw=60" の形式の文字列で
+指定する（main.py では環境変数 FACE_FILTER。既定は空文字で、何も除かない）。
+
+条件を指定すると、それまでスコアに含めていた顔が除かれるのでランキングが変わる
+（全部の顔が除かれた写真は contestScores に書かれない）。tiled の検出で見つけた後ろの列の
+小さい顔も min_size で除かれるので、併用するときは min_size を小さくする。
+"""
+
+import numpy as np
+
+DEFAULT_SPEC = ""   # 既定では絞り込まない（スコアが変わらない）
+SHARPNESS_SIZE = 64   # ぼやけの判定は顔を 64x64 に縮小してから行う（顔の大きさに依らない値にする）
+REASONS = ("small", "low_score", "yaw", "blur")
+
+
+def estimate_yaw(kps):
+    """5 点のランドマーク（左目・右目・鼻・口の左右）から横向きの角度（度）を大まかに推定する
+
+    正面なら鼻は両目の中点の真下にある。鼻の横方向のずれを目の間隔の半分で割った値を
+    sin(yaw) とみなす。
+    """
+    kps = np.asarray(kps, dtype=np.float32)
+    eye_mid = (kps[0] + kps[1]) / 2
+    half_eye = np.linalg.norm(kps[1] - kps[0]) / 2
+    if half_eye <= 0:
+        return 90.0
+    ratio = float(np.clip((kps[2, 0] - eye_mid[0]) / half_eye, -1.0, 1.0))
+    return float(np.degrees(np.arcsin(abs(ratio))))
+
+
+def sharpness(img, bbox):
+    """bbox 内のグレースケールのラプラシアンの分散（大きいほどくっきり）"""
+    h, w = img.shape[:2]
+    x1, y1 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+    x2, y2 = min(int(np.ceil(bbox[2])), w), min(int(np.ceil(bbox[3])), h)
+    if x2 - x1 < 3 or y2 - y1 < 3:
+        return 0.0
+    ys = np.linspace(y1, y2 - 1, SHARPNESS_SIZE).astype(np.int64)
+    xs = np.linspace(x1, x2 - 1, SHARPNESS_SIZE).astype(np.int64)
+    gray = img[ys[:, None], xs[None, :]].astype(np.float32)
+    if gray.ndim == 3:
+        gray = gray.mean(axis=2)
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+           - 4 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+
+class FaceFilter:
+    """顔を絞り込む条件（None の条件は使わない）"""
+
+    def __init__(self, min_size=None, min_score=None, max_yaw=None, min_sharpness=None):
+        self.min_size = min_size
+        self.min_score = min_score
+        self.max_yaw = max_yaw
+        self.min_sharpness = min_sharpness
+
+    @classmethod
+    def parse(cls, spec=None):
+        """"min_size=0.02,min_score=0.6" から作る（None なら DEFAULT_SPEC、空文字なら条件なし）"""
+        spec = DEFAULT_SPEC if spec is None else spec
+        kwargs = {}
+        for item in filter(None, (s.strip() for s in spec.split(","))):
+            key, sep, value = item.partition("=")
+            if not sep or key not in ("min_size", "min_score", "max_yaw", "min_sharpness"):
+                raise ValueError(f"invalid face filter: {item}")
+            kwargs[key] = float(value)
+        return cls(**kwargs)
+
+    @property
+    def spec(self):
+        return ",".join(f"{key}={value:g}" for key, value in (
+            ("min_size", self.min_size), ("min_score", self.min_score),
+            ("max_yaw", self.max_yaw), ("min_sharpness", self.min_sharpness))
+            if value is not None)
+
+    @property
+    def enabled(self):
+        return bool(self.spec)
+
+    def __repr__(self):
+        return f"FaceFilter({self.spec!r})"
+
+    def reason(self, img, face):
+        """face を除く理由（REASONS のどれか）。残すなら None"""
+        x1, y1, x2, y2 = face.bbox[:4]
+        if self.min_size is not None and \
+                min(x2 - x1, y2 - y1) < self.min_size * max(img.shape[:2]):
+            return "small"
+        if self.min_score is not None and face.det_score < self.min_score:
+            return "low_score"
+        if self.max_yaw is not None and getattr(face, "kps", None) is not None \
+                and estimate_yaw(face.kps) > self.max_yaw:
+            return "yaw"
+        if self.min_sharpness is not None and sharpness(img, face.bbox) < self.min_sharpness:
+            return "blur"
+        return None
+
+    def apply(self, img, faces, stats=None):
+        """条件を満たす顔だけを返す
+
+        stats（dict）を渡すと "facesDetected" / "facesFiltered" / "filtered_<理由>" の件数を加算する。
+        """
+        kept = []
+        for face in faces:
+            reason = self.reason(img, face) if self.enabled else None
+            if reason is None:
+                kept.append(face)
+            elif stats is not None:
+                stats[f"filtered_{reason}"] = stats.get(f"filtered_{reason}", 0) + 1
+        if stats is not None:
+            stats["facesDetected"] = stats.get("facesDetected", 0) + len(faces)
+            stats["facesFiltered"] = stats.get("facesFiltered", 0) + len(faces) - len(kept)
+        return kept
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+顔検出 → アライメント → 認識（バッチ）のパイプライン
+
+FaceAnalysis.get() は検出した顔ごとに認識モデルを 1 回ずつ実行する。
+ここでは検出だけを画像ごとに行い、アライメント済みの顔をまとめて
+(n_faces, 3, 112, 112) の 1 バッチで認識モデルに流す。複数画像の顔を
+まとめて 1 バッチにすることもできる。
+
+入力画像の扱い（チャネル順など）は FaceAnalysis.get() と同じ。
+検出の入力サイズは policy（detection_policy.DetectionPolicy）で画像ごとに選べる。
+省略時は FaceAnalysis.prepare() の det_size で 1 回だけ検出する。
+face_filter（face_filter.FaceFilter）を渡すと、小さい・確信度の低い顔などを認識の前に除く。
+
+insightface はパッケージの import だけで app / data / thirdparty などの使わないサブモジュールまで
+読み込むので、ここでは関数の中で import する（main.py の import = コールドスタートに含めず、
+モデルのロード時にまとめて読み込む）。
+"""
+
+import numpy as np
+
+from timing import NULL_TIMER
+
+
+def detect_faces(app, img, max_num=0, det_size=None):
+    """検出モデルだけを実行し、Face（bbox, kps, det_score）のリストを返す
+
+    det_size を指定すると、prepare() の det_size の代わりにその入力サイズで検出する。
+    """
+    from insightface.app.common import Face
+
+    kwargs = {"input_size": (det_size, det_size)} if det_size else {}
+    bboxes, kpss = app.det_model.detect(img, max_num=max_num, metric="default", **kwargs)
+    faces = []
+    for i in range(bboxes.shape[0]):
+        kps = kpss[i] if kpss is not None else None
+        faces.append(Face(bbox=bboxes[i, 0:4], kps=kps, det_score=bboxes[i, 4]))
+    return faces
+
+
+def detect_with_policy(app, img, policy=None):
+    """policy に従って検出する（policy が None なら detect_faces と同じ）"""
+    if policy is None:
+        return detect_faces(app, img)
+    faces, _ = policy.detect(lambda im, size: detect_faces(app, im, det_size=size), img)
+    return faces
+
+
+def align_faces(app, img, faces, hires=None):
+    """各顔をランドマークで認識モデルの入力サイズ（112x112）に切り出す
+
+    hires（image_io.DecodedImage）が縮小デコードされた画像で、顔の幅が入力サイズに
+    満たない場合は、元解像度の画像から切り出す。
+    """
+    from insightface.utils import face_align
+
+    size = app.models["recognition"].input_size[0]
+    crops = []
+    for f in faces:
+        src, kps = img, f.kps
+        if hires is not None and hires.downscaled and f.bbox[2] - f.bbox[0] < size:
+            src, kps = hires.full_resolution(), f.kps / hires.scale
+        crops.append(face_align.norm_crop(src, landmark=kps, image_size=size))
+    return crops
+
+
+def embed_crops(app, crops, batch_size=64):
+    """アライメント済みの顔をまとめて認識し、L2 正規化した (n, 512) 配列を返す"""
+    if not crops:
+        return np.zeros((0, 512), dtype=np.float32)
+    rec_model = app.models["recognition"]
+    feats = [rec_model.get_feat(crops[i:i + batch_size])
+             for i in range(0, len(crops), batch_size)]
+    embs = np.concatenate(feats, axis=0).astype(np.float32, copy=False)
+    return embs / np.linalg.norm(embs, axis=1, keepdims=True)
+
+
+def embed_image(app, img, batch_size=64, hires=None, timer=NULL_TIMER, policy=None,
+                face_filter=None, stats=None):
+    """1 枚の画像の全顔を 1 回の認識バッチで処理し (faces, embs) を返す
+
+    embs は FaceAnalysis.get() の各 face.embedding を L2 正規化して
+    np.stack したものと同じ (n_faces, 512) 配列。
+    bbox / kps は img の座標系（縮小デコードした場合は縮小後の座標）。
+    timer には "detect" / "embed" フェーズの時間が記録される。
+    face_filter で除いた顔は faces に含まれず、件数は stats（dict）に加算される。
+    """
+    with timer.phase("detect"):
+        faces = detect_with_policy(app, img, policy)
+        if face_filter is not None:
+            faces = face_filter.apply(img, faces, stats)
+    with timer.phase("embed"):
+        embs = embed_crops(app, align_faces(app, img, faces, hires=hires),
+                           batch_size=batch_size)
+    for face, emb in zip(faces, embs):
+        face.embedding = emb
+    return faces, embs
+
+
+def detect_and_align(app, image, timer=NULL_TIMER, policy=None, face_filter=None, stats=None):
+    """1 枚の画像を検出し、認識の入力に切り出した顔と合わせて (faces, crops) を返す
+
+    image は ndarray または image_io.DecodedImage。切り出しが済めば image（元解像度の
+    配列やダウンロードしたバッファ）はもう要らないので、呼び出し側はすぐに手放せる。
+    """
+    img, hires = (image.array, image) if hasattr(image, "array") else (image, None)
+    with timer.phase("detect"):
+        faces = detect_with_policy(app, img, policy)
+        if face_filter is not None:
+            faces = face_filter.apply(img, faces, stats)
+    with timer.phase("embed"):
+        crops = align_faces(app, img, faces, hires=hires)
+    return faces, crops
+
+
+def embed_aligned(app, aligned, batch_size=64, timer=NULL_TIMER):
+    """detect_and_align の結果のリストの顔をまとめて 1 回の認識バッチで処理する
+
+    Returns:
+        list: 画像ごとの (faces, embs)。顔が無い画像は ([], (0, 512) 配列)
+    """
+    with timer.phase("embed"):
+        embs = embed_crops(app, [crop for _, crops in aligned for crop in crops],
+                           batch_size=batch_size)
+
+    results, start = [], 0
+    for faces, _ in aligned:
+        part = embs[start:start + len(faces)]
+        for face, emb in zip(faces, part):
+            face.embedding = emb
+        results.append((faces, part))
+        start += len(faces)
+    return results
+
+
+def embed_images(app, images, batch_size=64, timer=NULL_TIMER, policy=None,
+                 face_filter=None, stats=None):
+    """複数画像の顔をまとめて 1 回の認識バッチで処理する
+
+    images は ndarray または image_io.DecodedImage のイテラブル。ジェネレータを渡すと
+    1 枚ずつ検出・切り出しを行うので、後続画像のダウンロードと並行して進められる。
+
+    Returns:
+        list: 画像ごとの (faces, embs)。顔が無い画像は ([], (0, 512) 配列)
+    """
+    aligned = [detect_and_align(app, image, timer=timer, policy=policy,
+                                face_filter=face_filter, stats=stats)
+               for image in images]
+    return embed_aligned(app, aligned, batch_size=batch_size, timer=timer)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+同時に処理している写真の Firestore への書き込みを 1 回のコミットにまとめる（グループコミット）
+
+score_image は写真 1 枚ごとに contestScores / faceEmbeddings / scoreCache を 1 回の
+コミットで書き、続けて leaderboards をトランザクションで更新していた。披露宴の最中に
+写真がまとめてアップロードされると、同時に実行される写真の数だけコミットと
+トランザクション（同じ leaderboards のドキュメントで競合して再試行する）が発生する。
+
+GroupCommit は WriteBatch と同じ set(ref, data, merge=False) で書き込みを受け取り、
+
+    - 同じドキュメントへの書き込みは 1 件にまとめる（後の set が勝ち、merge=True はフィールド単位でマージ）
+    - sync() を呼んだリクエストは、自分の書き込みを含むバッチのコミットが終わるまで待つ
+      （set() が返すバッチの番号を sync() に渡す）
+    - 待っているリクエストのうち 1 つが、最初の書き込みから max_delay 秒たつか、たまった件数が
+      max_ops に達したところで、500 件ずつの WriteBatch でまとめてコミットする
+    - コミットが終わったら after_commit([(ref, data), ...]) を呼ぶ（leaderboards の更新をまとめる）
+
+リクエストは自分の書き込みがコミットされてから返るので、応答の後に CPU が絞られても、
+インスタンスが落ちても書き込みは失われない。コミットに失敗したら、そのバッチを待っていた
+全リクエストの sync() が例外を投げる（イベントの再試行で書き直す）。
+max_delay=0 なら sync() のたびにすぐコミットする（写真ごとの同期書き込み）。
+"""
+
+import atexit
+import logging
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+BATCH_MAX = 500   # Firestore の WriteBatch 1 回あたりの上限
+_KEEP_ERRORS = 64  # 失敗したバッチの例外を覚えておく数
+
+
+def _merge(dst, src):
+    """set(merge=True) と同じく、入れ子の map もフィールド単位でマージした新しい dict を返す"""
+    merged = dict(dst)
+    for key, value in src.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class GroupCommit:
+    """書き込みをまとめてコミットするバッファ（スレッドセーフ）
+
+    Args:
+        client: Firestore クライアントを返す関数（clients.registry.firestore など）
+        max_ops: たまったドキュメント数がこれに達したらすぐにコミットする
+        max_delay: 最初の書き込みからこの秒数だけ、ほかのリクエストの書き込みを待つ（0 なら待たない）
+        after_commit: コミットした [(ref, data)] を受け取る関数（失敗してもコミットは成功扱い）
+
+    Attributes:
+        counts: {"queued", "coalesced", "committed", "commits", "failed"} の累計
+    """
+
+    def __init__(self, client, max_ops=400, max_delay=0.02, after_commit=None,
+                 batch_max=BATCH_MAX):
+        self._client = client
+        self.max_ops = max_ops
+        self.max_delay = max_delay
+        self.after_commit = after_commit
+        self.batch_max = batch_max
+        self.counts = {"queued": 0, "coalesced": 0, "committed": 0, "commits": 0, "failed": 0}
+        self._pending = OrderedDict()   # {ドキュメントのパス: [ref, data, merge]}
+        self._first_at = None
+        self._gen = 1           # まだコミットしていないバッチ（_pending）の番号
+        self._done = 0          # コミットが終わった（成功・失敗とも）最後のバッチの番号
+        self._flushing = False
+        self._errors = OrderedDict()   # {バッチの番号: 例外}
+        self._cond = threading.Condition()
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        """ログ用の集計（累計）"""
+        with self._cond:
+            return {"writesQueued": self.counts["queued"],
+                    "writesCoalesced": self.counts["coalesced"],
+                    "writesCommitted": self.counts["committed"],
+                    "writeCommits": self.counts["commits"],
+                    "writesPending": len(self._pending)}
+
+    def set(self, ref, data, merge=False):
+        """WriteBatch.set と同じ引数で書き込みを積み、それを含むバッチの番号を返す
+
+        content_cache.put の batch にも渡せる。コミットを待つには sync() を呼ぶ。
+        """
+        with self._cond:
+            self.counts["queued"] += 1
+            entry = self._pending.get(ref.path)
+            if entry is None:
+                self._pending[ref.path] = [ref, dict(data), merge]
+            else:
+                self.counts["coalesced"] += 1
+                if merge:
+                    entry[1] = _merge(entry[1], data)   # 前が set なら set のまま
+                else:
+                    entry[1:] = [dict(data), False]
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            if len(self._pending) >= self.max_ops:
+                self._cond.notify_all()   # 待っているリクエストにすぐコミットさせる
+            return self._gen
+
+    def _due(self):
+        return bool(self._pending) and (
+            len(self._pending) >= self.max_ops
+            or time.monotonic() - self._first_at >= self.max_delay)
+
+    def sync(self, gen=None, since=None):
+        """これまでに積んだ書き込み（gen を渡したらそのバッチまで）のコミットが終わるまで待つ
+
+        since から gen までのバッチ（since を省略したら gen のバッチだけ）のどれかが
+        コミットに失敗していたら、その例外を投げる。自分の書き込みが入ったバッチを確実に
+        確かめるには、set() が返した番号を渡す（最初の set の番号を since、最後を gen）。
+        gen を省略すると呼んだ時点の最新のバッチを待つが、それより前に失敗したバッチは見ない。
+        """
+        with self._cond:
+            if gen is None:
+                gen = self._gen if self._pending else self._gen - 1
+            since = gen if since is None else min(since, gen)
+            while self._done < gen:
+                if not self._flushing and self._gen == gen and self._due():
+                    self._flush_locked()   # 待っているリクエストのうち 1 つがまとめてコミットする
+                    continue
+                timeout = None
+                if not self._flushing and self._gen == gen:
+                    timeout = max(0.0, self._first_at + self.max_delay - time.monotonic())
+                self._cond.wait(timeout)
+            error = next((self._errors[g] for g in range(since, gen + 1) if g in self._errors),
+                         None)
+        if error is not None:
+            raise error
+
+    def flush(self):
+        """積んである書き込みをすべてコミットし、コミットしたドキュメント数を返す"""
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            if not self._pending:
+                return 0
+            gen = self._gen
+            committed = self._flush_locked()
+            error = self._errors.get(gen)
+        if error is not None:
+            raise error
+        return committed
+
+    def _flush_locked(self):
+        """_cond を持った状態で呼ぶ。コミットの間だけロックを離す"""
+        entries = list(self._pending.values())
+        gen = self._gen
+        self._pending = OrderedDict()
+        self._first_at = None
+        self._gen += 1
+        self._flushing = True
+        self._cond.release()
+        committed, error = [], None
+        try:
+            db = self._client()
+            for i in range(0, len(entries), self.batch_max):
+                chunk = entries[i:i + self.batch_max]
+                batch = db.batch()
+                for ref, data, merge in chunk:
+                    if merge:
+                        batch.set(ref, data, merge=True)
+                    else:
+                        batch.set(ref, data)
+                batch.commit()
+                committed.extend((ref, data) for ref, data, _ in chunk)
+        except Exception as e:
+            logging.error("Failed to commit %d writes: %s", len(entries) - len(committed), e)
+            error = e
+        finally:
+            self._after_commit(committed)
+            self._cond.acquire()
+        self.counts["committed"] += len(committed)
+        self.counts["commits"] += -(-len(committed) // self.batch_max)
+        if error is not None:
+            self.counts["failed"] += len(entries) - len(committed)
+            self._errors[gen] = error
+            while len(self._errors) > _KEEP_ERRORS:
+                self._errors.popitem(last=False)
+        self._done = gen
+        self._flushing = False
+        self._cond.notify_all()
+        return len(committed)
+
+    def _after_commit(self, committed):
+        if committed and self.after_commit is not None:
+            try:
+                self.after_commit(committed)
+            except Exception as e:
+                logging.warning("after_commit failed for %d writes: %s", len(committed), e)
+
+    def close(self):
+        """残っている書き込み（sync() を呼ばずに積んだもの）をコミットする"""
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error("Failed to flush pending writes: %s", e)
+
+    def flush_on_shutdown(self):
+        """プロセス終了時と SIGTERM（Cloud Run のインスタンス停止）で close() する
+
+        SIGTERM のハンドラはメインスレッドでしか登録できないので、それ以外では atexit だけを使う。
+        """
+        atexit.register(self.close)
+        try:
+            previous = signal.getsignal(signal.SIGTERM)
+        except ValueError:
+            return
+
+        def handler(signum, frame):
+            self.close()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.raise_signal(signal.SIGTERM)
+
+        try:
+            signal.signal(signal.SIGTERM, handler)
+        except ValueError:
+            pass
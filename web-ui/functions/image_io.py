@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+画像の読み込み（デコード時の縮小と EXIF 回転）
+
+スマートフォンの写真は 12〜48MP あるが、検出器は DET_SIZE（640x640）に縮小してから
+処理する。JPEG は PIL の draft() で DCT スケーリング（1/2, 1/4, 1/8）を使ってデコード
+段階で縮小し、さらに reduce() で整数倍縮小して、長辺が max_side 以上の最小サイズで
+配列にする。
+
+縮小した画像で小さい顔を切り出すと認識精度が落ちるため、必要なときだけ
+full_resolution() で元解像度の画像を改めてデコードできるようにしている。
+"""
+
+import io
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# EXIF Orientation のうち縦横が入れ替わるもの
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, (str, Path)):
+        return Image.open(source)
+    source.seek(0)
+    return Image.open(source)
+
+
+def _oriented_size(im):
+    """EXIF 回転を適用した後の (幅, 高さ)"""
+    orientation = im.getexif().get(0x0112, 1)
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        return im.height, im.width
+    return im.width, im.height
+
+
+def _to_rgb_array(im):
+    im = ImageOps.exif_transpose(im)
+    if im.mode != "RGB":
+        im = im.convert("RGB")
+    return np.asarray(im)
+
+
+class DecodedImage:
+    """デコード済みの画像
+
+    Attributes:
+        array: (h, w, 3) uint8 の RGB 配列（縮小済みの場合あり）
+        scale: array の幅 / 元画像（EXIF 回転後）の幅。縮小していなければ 1.0
+        original_size: 元画像（EXIF 回転後）の (幅, 高さ)
+    """
+
+    def __init__(self, source, array, original_size):
+        self._source = source
+        self._full = array if array.shape[1] == original_size[0] else None
+        self.array = array
+        self.original_size = original_size
+        self.scale = array.shape[1] / original_size[0]
+
+    @property
+    def downscaled(self):
+        return self.scale < 1.0
+
+    def full_resolution(self):
+        """元解像度の RGB 配列（初回呼び出し時にデコードしてキャッシュ）"""
+        if self._full is None:
+            with _open(self._source) as im:
+                self._full = _to_rgb_array(im)
+        return self._full
+
+
+def decode_image(source, max_side=None):
+    """画像をデコードして DecodedImage を返す
+
+    Args:
+        source: bytes / ファイルパス / バイナリのファイルオブジェクト
+        max_side: 長辺をこのサイズ以上の範囲でできるだけ小さくデコードする。
+                  None なら元解像度のまま。
+    """
+    with _open(source) as im:
+        original_size = _oriented_size(im)
+        if max_side:
+            long_side = max(original_size)
+            if long_side > max_side:
+                # draft は (幅, 高さ) の両方が要求サイズ以上になる最大の縮小率を選ぶ
+                ratio = max_side / long_side
+                im.draft("RGB", (int(im.width * ratio), int(im.height * ratio)))
+                factor = max(im.width, im.height) // max_side
+                if factor >= 2:
+                    im = im.reduce(factor)
+        array = _to_rgb_array(im)
+    return DecodedImage(source, array, original_size)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+推論（検出・認識）を実行する上限付きワーカープール
+
+関数インスタンスの concurrency を 1 より大きくすると、ダウンロードや Firestore 書き込みは
+リクエストごとのスレッドで並行に進む。推論までリクエスト数だけ並行に走らせると
+ONNX Runtime のスレッドが vCPU を取り合うので、推論だけはこのプールに投げて
+同時実行数を vCPU 数に揃える。
+
+待ち行列が埋まっている場合、run() は queue_timeout 秒まで待ってから
+InferenceBusyError を送出する（Storage のイベントは再試行されないので、score_image は
+その写真を再試行付きのタスクキュー score_images_batch に回す）。
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferenceBusyError(RuntimeError):
+    """推論プールの待ち行列が埋まっていて受け付けられない"""
+
+
+def available_cpus():
+    """このインスタンスで使える vCPU 数"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class InferencePool:
+    """同時実行 workers 件、待ち queue_size 件までの推論プール"""
+
+    def __init__(self, workers=None, queue_size=8, queue_timeout=30.0):
+        self.workers = workers or available_cpus()
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                            thread_name_prefix="inference")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """実行中 + 待機中のタスク数"""
+        return self._pending
+
+    def submit(self, fn, *args, **kwargs):
+        """空きを待って fn を投入し Future を返す（待ち切れなければ InferenceBusyError）"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise InferenceBusyError(
+                f"inference queue is full ({self.workers} running + {self.queue_size} queued)"
+            )
+        with self._lock:
+            self._pending += 1
+
+        def task():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._release()
+
+        try:
+            return self._executor.submit(task)
+        except BaseException:
+            self._release()
+            raise
+
+    def run(self, fn, *args, **kwargs):
+        """fn をプールで実行して結果を返す"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
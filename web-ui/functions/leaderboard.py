@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+コンテストごとのランキングの集計（Firestore: leaderboards/{contest}）
+
+Ranking.js / AdminRanking.jsx が contestScores を全件読んでブラウザで集計すると、
+閲覧者が更新するたびにコレクション全体の読み取りが発生する。score_image が
+スコアを書き込むたびに、コンテストごとの小さな集計ドキュメントを更新しておき、
+閲覧側はそれだけを読む。
+
+    leaderboards/{contest} = {
+        "contest": "contest_vectors_1",
+        "top":   [entry, ...],   # スコア上位 TOP_N 枚（管理者用ランキング）
+        "users": [entry, ...],   # ユーザーごとのベスト 1 枚をスコア順に上位 TOP_N 人（ランキング）。
+                                 # userName の無い写真は入れない（1 人にまとまってしまうので）
+    }
+    entry = {"id", "path", "userName", "faceCount", "score"}
+
+集計は純粋な関数（merge_entry / build_boards）で行い、score_image はトランザクションで、
+tools/backfill_leaderboards.py は contestScores 全件から作り直すときに使う。
+トランザクションは google.cloud.firestore.transactional と同じ形の関数で実行する
+（ローカルの負荷試験・テストでは benchmarks/fakes.py の transactional を渡す）。
+"""
+
+import logging
+
+COLLECTION = "leaderboards"
+TOP_N = 100
+
+
+def _sort_key(entry):
+    return (-entry["score"], entry["id"])
+
+
+def make_entry(doc_id, record, contest):
+    """contestScores のドキュメントから、そのコンテストのランキング項目を作る（スコアが無ければ None）"""
+    score = (record.get("scores") or {}).get(contest)
+    if score is None:
+        return None
+    return {
+        "id": doc_id,
+        "path": record.get("path"),
+        "userName": record.get("userName"),
+        "faceCount": record.get("faceCount", 0),
+        "score": float(score),
+    }
+
+
+def empty_board(contest):
+    return {"contest": contest, "top": [], "users": []}
+
+
+def merge_entry(board, entry, top_n=TOP_N, user_best=None):
+    """board に entry（同じ写真の古い項目は置き換え）を反映した新しい board を返す
+
+    user_best(userName, contest) は、そのユーザーのベストの写真が再計算で下がったときに
+    contestScores から選び直すための関数（ベストの項目か None を返す）。None なら下がった
+    項目をそのまま使う。
+    """
+    top = [e for e in board.get("top", []) if e["id"] != entry["id"]]
+    top.append(entry)
+    top.sort(key=_sort_key)
+
+    # ユーザーごとのベスト。ほかの写真のほうが高ければベストはそのまま残し、
+    # ベストの写真自体が下がったときだけ、そのユーザーの写真から選び直す
+    # userName の無い写真はどのユーザーのものか分からないので入れない
+    users = board.get("users", [])
+    if entry["userName"]:
+        best = next((e for e in users if e["userName"] == entry["userName"]), None)
+        users = [e for e in users if e["userName"] != entry["userName"]]
+        if best is None or best["score"] < entry["score"]:
+            best = entry
+        elif best["id"] == entry["id"]:
+            if entry["score"] < best["score"] and user_best is not None:
+                best = user_best(entry["userName"], board.get("contest")) or entry
+            else:
+                best = entry
+        users.append(best)
+    else:
+        users = [e for e in users if e["id"] != entry["id"]]
+    users.sort(key=_sort_key)
+
+    # 1 つのドキュメントに収まるように（上限 1 MiB）、ユーザー数も上位 top_n 人で切る。
+    # 切り捨てたユーザーのベストが後から上位に戻るべき場合は rebuild で直す
+    return {**board, "top": top[:top_n], "users": users[:top_n]}
+
+
+def build_boards(records, top_n=TOP_N):
+    """[(doc_id, record), ...] の全件から {contest: board} を作る（バックフィル用）"""
+    boards = {}
+    for doc_id, record in records:
+        for contest in (record.get("scores") or {}):
+            entry = make_entry(doc_id, record, contest)
+            if entry is not None:
+                board = boards.get(contest) or empty_board(contest)
+                boards[contest] = merge_entry(board, entry, top_n)
+    return boards
+
+
+def apply_records(boards, records, top_n=TOP_N, user_best=None):
+    """既存の {contest: board} に新しいスコアを反映し、変わった board だけを返す
+
+    user_best は merge_entry と同じ（ベストの写真が下がったユーザーの選び直しに使う）。
+    """
+    changed = {}
+    for doc_id, record in records:
+        for contest in (record.get("scores") or {}):
+            entry = make_entry(doc_id, record, contest)
+            if entry is None:
+                continue
+            board = changed.get(contest) or boards.get(contest) or empty_board(contest)
+            new = merge_entry(board, entry, top_n, user_best)
+            if new != board:
+                changed[contest] = new
+    return changed
+
+
+def update_leaderboards(db, records, top_n=TOP_N, transactional=None):
+    """records（[(doc_id, contestScores の record), ...]）を 1 回のトランザクションで反映する
+
+    同時に複数の写真が書き込まれても、Firestore のトランザクションが競合を検出して
+    再試行するので取りこぼしは起きない。transactional は firestore.transactional と同じく
+    transactional(fn)(db.transaction()) で fn を実行する関数（None なら firestore.transactional）。
+
+    ユーザーのベストの写真が再計算で下がったときは、そのユーザーの contestScores を読んで
+    ベストを選び直す（records の内容はコミット済みでなくてもそちらを優先する）。
+    """
+    contests = sorted({c for _, r in records for c in (r.get("scores") or {})})
+    if not contests:
+        return {}
+    collection = db.collection(COLLECTION)
+    refs = {c: collection.document(c) for c in contests}
+
+    def user_best(user_name, contest):
+        query = db.collection("contestScores").where("userName", "==", user_name)
+        found = {snap.id: snap.to_dict() for snap in query.stream()}
+        found.update(records)
+        entries = [make_entry(doc_id, record, contest) for doc_id, record in found.items()
+                   if record.get("userName") == user_name]
+        return min((e for e in entries if e is not None), key=_sort_key, default=None)
+
+    def run(transaction):
+        boards = {snap.id: snap.to_dict()
+                  for snap in db.get_all(list(refs.values()), transaction=transaction)
+                  if snap.exists}
+        changed = apply_records(boards, records, top_n, user_best)
+        for contest, board in changed.items():
+            transaction.set(refs[contest], board)
+        return changed
+
+    if transactional is None:
+        from google.cloud.firestore import transactional
+    return transactional(run)(db.transaction())
+
+
+def rebuild(db, top_n=TOP_N, dry_run=False):
+    """contestScores の全件から leaderboards を作り直す。古いコンテストの board は削除する"""
+    records = [(snap.id, snap.to_dict()) for snap in db.collection("contestScores").stream()]
+    boards = build_boards(records, top_n)
+    if dry_run:
+        return boards
+
+    collection = db.collection(COLLECTION)
+    batch = db.batch()
+    for contest, board in boards.items():
+        batch.set(collection.document(contest), board)
+    for snap in collection.stream():
+        if snap.id not in boards:
+            logging.info("Remove leaderboard of %s", snap.id)
+            batch.delete(snap.reference)
+    batch.commit()
+    return boards
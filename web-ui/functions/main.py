@@ -1,51 +1,217 @@
 # Cloud Functions (Gen 2, Python 3.12)
-from firebase_functions import storage_fn
+from firebase_functions import storage_fn, tasks_fn
 from firebase_functions import options  # region 指定用
-from google.cloud import storage, firestore
-from insightface.app import FaceAnalysis
+from firebase_functions import logger   # 構造化ログ（キーワード引数が jsonPayload のフィールドになる）
 
 from pathlib import Path
-import numpy as np
-from PIL import Image
-import tempfile, os, json, logging
+import os, time, logging
+
+from clients import registry
+from content_cache import CACHE_COLLECTION, ContentCache, cache_key
+from detection_policy import DetectionPolicy
+from face_embeddings import COLLECTION as EMBEDDINGS_COLLECTION, embeddings_record, encode_faces
+from face_filter import FaceFilter
+from face_pipeline import detect_and_align, embed_aligned, embed_image
+from inference_pool import InferenceBusyError, InferencePool, available_cpus
+from leaderboard import update_leaderboards
+from model_bundle import BUNDLE_ROOT
+from model_manager import FaceModel
+from ort_session import SessionConfig
+from photo_ids import photo_doc_id
+from storage_io import BufferPool, iter_images, open_image
+from target_index import FusedTargets, build_indexes
+from timing import NULL_TIMER
+from tracing import Tracer
+from vector_store import fingerprint, load_vector_sets
+from group_commit import GroupCommit
 
 # ---------- グローバル初期化（コールドスタート時に一度だけ） ----------
 #REGION = "asia-northeast1"
 REGION = "us-central1"
 BUCKET_NAME = "wedding-photo-contest-dev-032.firebasestorage.app"        # ★バケット ID
 VEC_DIR      = Path(__file__).with_name("target_vectors")
-DET_SIZE     = (640, 640)
+DECODE_MAX_SIDE = 1280      # デコード時の縮小目安（長辺がこれ以上の最小サイズ）
+IMAGE_EXTS   = (".jpg", ".jpeg", ".png")
+BATCH_MAX_IMAGES   = 32     # バッチ関数 1 回で処理する最大枚数
+DECODE_WORKERS     = 8      # ダウンロード・デコードの並列数
+FIRESTORE_BATCH_MAX = 500   # Firestore バッチ書き込みの上限
+SCORE_CACHE_SIZE   = 4096   # 内容ハッシュ → スコアの LRU の件数
+# score_image の Firestore への書き込みは同時に処理している写真の分をまとめてコミットする
+# （group_commit.py。各リクエストは自分の書き込みがコミットされるまで待ってから返る）
+#   GROUP_COMMIT_DELAY_MS : 最初の書き込みからほかの写真の書き込みを待つ時間（0 なら写真ごとにコミット）
+#   GROUP_COMMIT_MAX_OPS  : たまったドキュメント数がこれに達したらすぐにコミットする
+GROUP_COMMIT_DELAY_MS = float(os.environ.get("GROUP_COMMIT_DELAY_MS", 20))
+GROUP_COMMIT_MAX_OPS  = int(os.environ.get("GROUP_COMMIT_MAX_OPS", 400))
+EMBEDDING_DTYPE    = "float16"  # faceEmbeddings に保存する埋め込みの型（float16 / int8）
+
+# 並行実行の設定（デプロイ時は functions/.env などの環境変数で上書きできる）
+#   FUNCTION_CPU / FUNCTION_CONCURRENCY : インスタンスの vCPU 数と同時リクエスト数
+#   INFERENCE_WORKERS    : 推論を同時に実行する数（既定は vCPU 数）
+#   INFERENCE_QUEUE_SIZE : 実行中の推論のほかに、時間制限なしで待てる数（既定 0）。それも埋まっていると
+#                          INFERENCE_QUEUE_TIMEOUT 秒（既定 5）だけ空きを待ち、それでも空かなければ
+#                          score_image はその写真を score_images_batch のタスクキューに回す。
+#                          同時リクエスト数より小さくしないと待ちが埋まらず、タスクキューに回らない
+#   SCORE_IMAGE_TIMEOUT_SEC : score_image のタイムアウト。推論の空き待ち・ダウンロード・書き込みが
+#                          収まるように、INFERENCE_QUEUE_TIMEOUT より十分長くする
+#   ORT_INTRA_OP_THREADS : 推論 1 件あたりの ONNX Runtime スレッド数（既定は vCPU / ワーカー数）
+#   ORT_OPT_LEVEL / ORT_EXECUTION_MODE / ORT_ALLOW_SPINNING / ORT_INTRA_OP_AFFINITIES /
+#   ORT_CACHE_DIR        : そのほかのセッション設定（ort_session.py）。最適化済みモデルは
+#                          tools/build_ort_cache.py で ORT_CACHE に書き出してデプロイに同梱する
+FUNCTION_CPU         = int(os.environ.get("FUNCTION_CPU", 1))
+FUNCTION_CONCURRENCY = int(os.environ.get("FUNCTION_CONCURRENCY", 4))
+INFERENCE_WORKERS    = int(os.environ.get("INFERENCE_WORKERS", 0)) or available_cpus()
+INFERENCE_QUEUE_SIZE = int(os.environ.get("INFERENCE_QUEUE_SIZE", 0))
+INFERENCE_QUEUE_TIMEOUT = float(os.environ.get("INFERENCE_QUEUE_TIMEOUT", 5))
+SCORE_IMAGE_TIMEOUT_SEC = int(os.environ.get("SCORE_IMAGE_TIMEOUT_SEC", 120))
+BATCH_TIMEOUT_SEC    = 540  # score_images_batch は最大 BATCH_MAX_IMAGES 枚を 1 回で処理する
+ORT_CACHE = Path(__file__).with_name("ort_cache")
+# 推論プールの各ワーカーのスレッド数（ワーカー数 x この値 ≒ vCPU 数）。ワーカー同士で
+# CPU を分け合うので、待機中のスレッドはスピンさせない
+ORT_SESSION = SessionConfig.from_env(
+    intra_op_threads=max(1, available_cpus() // INFERENCE_WORKERS),
+    allow_spinning=INFERENCE_WORKERS == 1,
+    cache_dir=ORT_CACHE,
+)
+
+# 顔検出の入力サイズ（detection_policy.py）
+#   DET_POLICY : "fixed:640"（既定）/ "adaptive:320,640,960"（顔が大きい写真は 320 で済ませ、
+#                小さい顔があれば 640、遠くの集合写真は 960 で検出し直す）
+#                / "tiled:640,640"（大きな画像で小さい顔がたくさん見つかった大人数の集合写真だけ、
+#                重なりのある 640 のタイルに分けて縮小せずに検出し、NMS でまとめる）
+DET_POLICY = DetectionPolicy.parse(os.environ.get("DET_POLICY"))
+DET_SIZE   = (DET_POLICY.base_size, DET_POLICY.base_size)
+
+# 認識の前に除く顔（face_filter.py）。背景の小さい顔・確信度の低い顔をスコアに混ぜないようにできる
+#   FACE_FILTER : 空（既定。検出した顔を全部使う）/ "min_size=0.015,min_score=0.6" など。
+#                 max_yaw=60 / min_sharpness=20 も指定できる。指定するとランキングが変わる
+FACE_FILTER = FaceFilter.parse(os.environ.get("FACE_FILTER"))
+
+# 同梱モデル（insightface/models/buffalo_l）の確認方法。無い・壊れているときはダウンロードせずに失敗する
+#   MODEL_VERIFY : "size"（既定。ファイルの有無とサイズ）/ "sha256"（内容も確認）
+MODEL_VERIFY = os.environ.get("MODEL_VERIFY", "size")
+#   MODEL_PRELOAD : "1" ならインスタンスの起動時にバックグラウンドでモデルのロードを始める
+#                   （既定は "0" = 最初のリクエストでロード）
+MODEL_PRELOAD = os.environ.get("MODEL_PRELOAD", "0") == "1"
+
+# 段ごとのスパンとカウンタ（tracing.py）。ログの jsonPayload の "trace" に出力する
+#   TRACING            : "0" なら記録しない（*_ms のフィールドだけ出す）
+#   TRACE_METRICS_FILE : 指定するとプロセスの終了時に Prometheus 形式のメトリクスを書き出す
+TRACER = Tracer.from_env()
+
+# 1. InsightFace モデル（検出 + 認識のみ）。最初のリクエストでロードとウォームアップを行う
+_face_model = FaceModel(name="buffalo_l", det_size=DET_SIZE,
+                        root=BUNDLE_ROOT, verify_root=MODEL_VERIFY,
+                        session_config=ORT_SESSION,
+                        warmup_det_sizes=DET_POLICY.sizes)
+if MODEL_PRELOAD:
+    _face_model.preload()
 
-# 1. InsightFace モデルを CPU でロード
-_face_app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"])
-_face_app.prepare(ctx_id=0, det_size=DET_SIZE)
-logging.info("InsightFace model loaded.")
+# 2. contest_vectors_* を全部読み込む（.vec があれば memmap、無ければ JSON）
+_target_sets = load_vector_sets(VEC_DIR)   # {contest_name: (m,512) ndarray}
+_target_index = build_indexes(_target_sets) # {contest_name: TargetIndex}（重心・近傍探索の前計算）
+_fused_targets = FusedTargets(_target_index) # 全コンテストをまとめて 1 回の行列積で計算する
 
-# 2. contest_vectors_*.json を全部読み込む
-_target_sets = {}   # {contest_name: (m,512) ndarray}
-for vec_file in VEC_DIR.glob("contest_vectors_*.json"):
+# 3. ダウンロード用バッファ（Storage / Firestore クライアントは clients.registry で共有）
+_buffer_pool = BufferPool(max_idle=DECODE_WORKERS)
+
+# 4. 推論プール（ダウンロード・書き込みはリクエストごとのスレッドで並行、推論だけ上限付き）
+_inference_pool = InferencePool(workers=INFERENCE_WORKERS, queue_size=INFERENCE_QUEUE_SIZE,
+                                queue_timeout=INFERENCE_QUEUE_TIMEOUT)
+
+# 5. 内容ハッシュ（MD5 / CRC32C）→ スコアのキャッシュ（LRU + Firestore: scoreCache）
+#    ターゲットベクトルか検出ポリシー・顔の絞り込みが変わるとバージョンが変わり、
+#    古いエントリはミス扱いになる
+_score_cache = ContentCache(
+    version=f"{fingerprint(_target_sets)}-{DET_POLICY.spec}-{FACE_FILTER.spec}",
+    collection=lambda: registry.firestore().collection(CACHE_COLLECTION),
+    maxsize=SCORE_CACHE_SIZE,
+)
+
+# 6. Firestore のグループコミット（同じドキュメントへの書き込みはまとめ、コミット後に
+#    leaderboards をまとめて更新する）。sync() せずに積んだ書き込みはインスタンスの停止時に書き込む
+_writer = GroupCommit(registry.firestore, max_ops=GROUP_COMMIT_MAX_OPS,
+                      max_delay=GROUP_COMMIT_DELAY_MS / 1000,
+                      after_commit=lambda written: _after_commit(written))
+_writer.flush_on_shutdown()
+
+
+# 7. 推論プールが埋まっていた写真を回すタスクキュー（score_images_batch。再試行あり）
+#    Storage のトリガーは再試行されないので、エラーにするとその写真はスコアされないまま残る
+def _batch_queue_factory():
+    import firebase_admin
+    from firebase_admin import functions
     try:
-        with vec_file.open() as f:
-            data = json.load(f)
-        vectors = np.asarray(data["vectors"])
-        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
-        _target_sets[vec_file.stem] = vectors           # 例: 'contest_vectors_A'
-        logging.info("Loaded %s (%d vec)", vec_file.name, vectors.shape[0])
-    except Exception as e:
-        logging.error("Fail load %s: %s", vec_file.name, e)
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+    return functions.task_queue(f"locations/{REGION}/functions/score_images_batch")
+
+
+registry.register("batch_queue", _batch_queue_factory)
+
+
+# ---------- 共通処理 ----------
+def _calc_scores(face_embs):
+    """各 contest_vectors との類似度平均（全ペア平均 = 平均ベクトルと重心の内積）を計算する"""
+    return _fused_targets.mean_scores(face_embs)
+
+
+def _infer(fn, *args, timer, **kwargs):
+    """推論プールで fn(*args, timer=timer, **kwargs) を実行する
+
+    プールでの待ち時間は timer の queue フェーズに記録する。
+    """
+    submitted = time.perf_counter()
+    kwargs["timer"] = timer
+
+    def task():
+        timer.add("queue", (time.perf_counter() - submitted) * 1000)
+        return fn(*args, **kwargs)
+
+    return _inference_pool.run(task)
+
+
+def _update_leaderboards(fs_client, records, timer):
+    """leaderboards/{contest} に新しいスコアを反映する（失敗してもスコアの保存は成功扱い）"""
+    with timer.phase("leaderboard"):
+        try:
+            update_leaderboards(fs_client, records, transactional=registry.transactional())
+        except Exception as e:
+            logging.warning("Failed to update leaderboards: %s", e)
+
+
+def _after_commit(written):
+    """グループコミットでコミットした contestScores をまとめて leaderboards に反映する"""
+    records = [(ref.id, data) for ref, data in written if ref.path.startswith("contestScores/")]
+    if records:
+        _update_leaderboards(registry.firestore(), records, NULL_TIMER)
+
+
+def _score_record(blob_path, face_count, scores, user_name):
+    """contestScores に保存するドキュメント"""
+    return {
+        "path"      : blob_path,
+        "faceCount" : face_count,
+        "scores"    : scores,
+        "userName"  : user_name
+    }
+
 
 # ---------- 画像アップロードで発火する関数 ----------
 @storage_fn.on_object_finalized(
         region=REGION,
         bucket=BUCKET_NAME,
-        memory=options.MemoryOption.GB_2     # ← メモリ指定などもここで
+        memory=options.MemoryOption.GB_2,    # ← メモリ指定などもここで
+        cpu=FUNCTION_CPU,
+        concurrency=FUNCTION_CONCURRENCY,
+        timeout_sec=SCORE_IMAGE_TIMEOUT_SEC  # 既定（60 秒）のままだと空き待ちの途中で打ち切られる
 )
 def score_image(event: storage_fn.CloudEvent[storage_fn.StorageObjectData]):
     """Storage に画像が置かれたら、各 contest_vectors と平均類似度を計算して
        Firestore: contestScores/{docId} に結果を格納
     """
     blob_path = event.data.name            # 例: wedding-photos/xxx.jpg
-    if not blob_path.lower().endswith((".jpg", ".jpeg", ".png")):
+    if not blob_path.lower().endswith(IMAGE_EXTS):
         logging.info("Skip non-image file: %s", blob_path)
         return
 
@@ -54,39 +220,202 @@ def score_image(event: storage_fn.CloudEvent[storage_fn.StorageObjectData]):
     if event.data.metadata and "userName" in event.data.metadata:
         user_name = event.data.metadata["userName"]
 
-    # ① 一時ファイルにダウンロード
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(event.data.bucket)
-    blob   = bucket.blob(blob_path)
-    fd, tmp = tempfile.mkstemp()
-    blob.download_to_filename(tmp)
+    # 同じ内容の画像（再配信・重複アップロード）はキャッシュのスコアを使う
+    content_key = cache_key(event.data.md5_hash, event.data.crc32c)
+
+    try:
+        score_object(event.data.bucket, blob_path, user_name, content_key=content_key)
+    except InferenceBusyError as e:
+        # 推論プールが埋まっている。Storage のイベントは再試行されないので捨てずに
+        # score_images_batch（タスクキューの再試行あり）に回す
+        registry.get("batch_queue").enqueue({"bucket": event.data.bucket, "paths": [blob_path]})
+        logger.warn("Inference queue is full; deferred to score_images_batch",
+                       path=blob_path, error=str(e))
 
-    # ② 顔検出と埋め込み
-    img   = np.asarray(Image.open(tmp).convert("RGB"))
-    faces = _face_app.get(img)
-    os.close(fd); os.remove(tmp)
 
-    if not faces:
-        logging.info("No faces detected in %s", blob_path)
+def score_object(bucket_name, blob_path, user_name=None, content_key=None):
+    """1 枚の画像をスコア計算して contestScores に保存する（score_image の本体）
+
+    content_key（content_cache.cache_key）がキャッシュにあれば、ダウンロードも
+    推論もせずにそのスコアを書き込む。Firestore への書き込み（scoreCache を含む）は
+    _writer に積み、同時に処理しているほかの写真の分とまとめてコミットされるのを待ってから返る
+    （leaderboards の更新もコミットの後）。
+    ローカルの負荷試験からも、フェイクのクライアントを clients.registry に登録して呼び出す。
+    """
+    timer = TRACER.start("score_image")
+    with timer.phase("client_init"):
+        storage_client = registry.storage()
+        fs_client = registry.firestore()
+    with timer.phase("cache"):
+        cached, cache_outcome = _score_cache.get(content_key)
+
+    if cached is not None:
+        face_count, scores, face_data = cached["faceCount"], cached["scores"], cached.get("faces")
+    else:
+        with timer.phase("model_init"):
+            face_app = _face_model.get()
+
+        # ① メモリ上のバッファにダウンロードして、② 顔検出と埋め込み
+        #    （検出用に縮小デコード、小さい顔だけ元解像度から切り出す）
+        #    ダウンロードはこのスレッドで、推論は推論プールで実行する
+        blob = storage_client.bucket(bucket_name).blob(blob_path)
+        with open_image(blob, _buffer_pool, max_side=DECODE_MAX_SIDE, timer=timer) as decoded:
+            faces, face_embs = _infer(embed_image, face_app, decoded.array, hires=decoded,
+                                      policy=DET_POLICY, face_filter=FACE_FILTER,
+                                      stats=timer.counters, timer=timer)   # (n_faces, 512) 正規化済み
+
+        # ③ 各 contest_vectors と類似度平均を計算
+        #    埋め込みと bbox は再スコア用に faceEmbeddings にも保存する
+        face_count, scores, face_data = len(faces), None, None
+        if faces:
+            with timer.phase("score"):
+                scores = _calc_scores(face_embs)
+            face_data = encode_faces(faces, face_embs, scale=decoded.scale, dtype=EMBEDDING_DTYPE)
+        _score_cache.put(content_key, face_count, scores, path=blob_path, faces=face_data,
+                         batch=_writer)
+
+    # 検出した顔の数・絞り込みで除いた顔の数（stats）と合わせて、ログとメトリクスのカウンタにする
+    timer.count("faceCount", face_count)
+    if not face_count:
+        with timer.phase("write"):
+            _writer.sync()
+        logger.info("No faces detected", path=blob_path, cache=cache_outcome,
+                    **_score_cache.stats(), **_writer.stats(), **TRACER.finish(timer))
         return
 
-    face_embs = np.stack(
-        [f.embedding / np.linalg.norm(f.embedding) for f in faces]
-    )  # shape = (n_faces, 512)
+    # ④ Firestore へ保存（スコアと埋め込みを積み、ほかの写真の分とまとめたコミットを待つ）
+    #    ドキュメント ID は blob のパスから決まるので（photo_ids.py、Web UI の photos と同じ ID）、
+    #    既存のドキュメントを読む必要はない
+    #    ⑤ ランキング（leaderboards）はコミットの後に _after_commit でまとめて更新する
+    doc_id = photo_doc_id(blob_path)
+    record = _score_record(blob_path, face_count, scores, user_name)
+    #    自分の書き込みが入ったバッチ（first〜last）のどれかが失敗したら例外になり、イベントを失敗にする
+    with timer.phase("write"):
+        first = last = _writer.set(fs_client.collection("contestScores").document(doc_id), record)
+        if face_data is not None:
+            last = _writer.set(fs_client.collection(EMBEDDINGS_COLLECTION).document(doc_id),
+                               embeddings_record(blob_path, face_data))
+        _writer.sync(last, since=first)
+    logger.info(f"Saved scores for {blob_path}", path=blob_path,
+                scores=scores, cache=cache_outcome,
+                **_score_cache.stats(), **_writer.stats(), **TRACER.finish(timer))
+    return scores
 
-    # ③ 各 contest_vectors と類似度平均を計算
-    scores = {}
-    for cname, cvecs in _target_sets.items():
-        sims = face_embs @ cvecs.T           # (n_faces, n_cvecs)
-        scores[cname] = float(sims.mean())   # 全ペア平均
 
-    # ④ Firestore へ保存
-    fs_client = firestore.Client()
-    doc_id = Path(blob_path).stem           # ファイル名(拡張子なし)をキー
-    fs_client.collection("contestScores").document(doc_id).set({
-        "path"      : blob_path,
-        "faceCount" : len(faces),
-        "scores"    : scores,
-        "userName"  : user_name              # ← 追加
-    })
-    logging.info("Saved scores for %s → %s", blob_path, scores)
\ No newline at end of file
+# ---------- まとめてスコア計算するタスクキュー関数 ----------
+@tasks_fn.on_task_dispatched(
+        region=REGION,
+        memory=options.MemoryOption.GB_2,
+        timeout_sec=BATCH_TIMEOUT_SEC,
+        retry_config=options.RetryConfig(max_attempts=3, min_backoff_seconds=10),
+        rate_limits=options.RateLimits(max_concurrent_dispatches=10)
+)
+def score_images_batch(req: tasks_fn.CallableRequest) -> dict:
+    """複数の画像をまとめてスコア計算する
+
+    req.data = {"bucket": "...", "paths": ["wedding-photos/a.jpg", ...]}
+
+    デコードは並列に行い、検出は画像ごと、認識は全画像の顔をまとめて 1 バッチで実行し、
+    結果は Firestore のバッチ書き込みで保存する。内容ハッシュがキャッシュにある画像は
+    ダウンロードしない。
+    enqueue 例: firebase_admin.functions.task_queue("score_images_batch").enqueue({...})
+    """
+    bucket_name = req.data.get("bucket") or BUCKET_NAME
+    paths = [p for p in req.data.get("paths", []) if p.lower().endswith(IMAGE_EXTS)]
+    if len(paths) > BATCH_MAX_IMAGES:
+        raise ValueError(f"too many paths: {len(paths)} > {BATCH_MAX_IMAGES}")
+    if not paths:
+        return {"processed": 0}
+
+    timer = TRACER.start("score_images_batch")
+    with timer.phase("client_init"):
+        storage_client = registry.storage()
+        fs_client = registry.firestore()
+    with timer.phase("model_init"):
+        face_app = _face_model.get()
+
+    # ① 並列にダウンロード・デコードする（失敗した画像はスキップ）
+    #    キャッシュにヒットした画像はダウンロードしない
+    # ② 検出と切り出しは届いた画像から 1 枚ずつ推論プールで行い、認識は全画像の顔を 1 バッチで
+    #    ダウンロードを待つ間は推論プールの枠を占有しない。切り出しが済んだ画像（元解像度の配列と
+    #    ダウンロードしたバッファ）はすぐに手放すので、同時にメモリに載るのは先読み中の数枚と
+    #    112x112 の切り出しだけになる
+    bucket = storage_client.bucket(bucket_name)
+    keys, hits = {}, {}   # {blob_path: キャッシュキー}, {blob_path: キャッシュの値}
+    decoded = []          # [(blob_path, userName, scale)]
+    aligned = []          # decoded と同じ順の [(faces, crops)]
+    records = []          # [(blob_path, userName, faceCount, scores, 埋め込みのバイナリ)]
+
+    def cached(blob_path, blob):
+        keys[blob_path] = key = cache_key(blob.md5_hash, getattr(blob, "crc32c", None))
+        value, _ = _score_cache.get(key)
+        if value is not None:
+            hits[blob_path] = value
+        return value is not None
+
+    # 検出した顔の数と、絞り込みで除いた顔の数は timer のカウンタに加算する
+    for blob_path, image, user_name in iter_images(
+            bucket, paths, _buffer_pool, max_side=DECODE_MAX_SIDE,
+            workers=DECODE_WORKERS, timer=timer, skip=cached):
+        if image is None:
+            value = hits[blob_path]
+            records.append((blob_path, user_name, value["faceCount"], value["scores"],
+                            value.get("faces")))
+            continue
+        decoded.append((blob_path, user_name, image.scale))
+        aligned.append(_infer(detect_and_align, face_app, image, policy=DET_POLICY,
+                              face_filter=FACE_FILTER, stats=timer.counters, timer=timer))
+        del image   # 次の画像を受け取るとバッファもプールに戻る
+
+    results = _infer(embed_aligned, face_app, aligned, timer=timer)
+    del aligned
+
+    # ③ スコア計算して Firestore にバッチ書き込み（キャッシュへの保存も同じバッチで）
+    batch, n_ops = fs_client.batch(), 0
+
+    def flush(force=False):
+        # 1 枚あたり最大 2 件（スコア + 埋め込み）積むので、上限を超える前にコミットする
+        nonlocal batch, n_ops
+        if n_ops and (force or n_ops > FIRESTORE_BATCH_MAX - 2):
+            with timer.phase("write"):
+                batch.commit()
+            batch, n_ops = fs_client.batch(), 0
+
+    for (blob_path, user_name, scale), (faces, face_embs) in zip(decoded, results):
+        scores, face_data = None, None
+        if faces:
+            with timer.phase("score"):
+                scores = _calc_scores(face_embs)
+            face_data = encode_faces(faces, face_embs, scale=scale, dtype=EMBEDDING_DTYPE)
+        records.append((blob_path, user_name, len(faces), scores, face_data))
+        if _score_cache.put(keys.get(blob_path), len(faces), scores,
+                            path=blob_path, faces=face_data, batch=batch):
+            n_ops += 1
+            flush()
+
+    collection = fs_client.collection("contestScores")
+    embeddings = fs_client.collection(EMBEDDINGS_COLLECTION)
+    saved = []   # [(doc_id, record)]
+    for blob_path, user_name, face_count, scores, face_data in records:
+        if not face_count:
+            logging.info("No faces detected in %s", blob_path)
+            continue
+        doc_id = photo_doc_id(blob_path)
+        record = _score_record(blob_path, face_count, scores, user_name)
+        batch.set(collection.document(doc_id), record)
+        n_ops += 1
+        if face_data is not None:
+            batch.set(embeddings.document(doc_id), embeddings_record(blob_path, face_data))
+            n_ops += 1
+        saved.append((doc_id, record))
+        flush()
+    flush(force=True)
+    if saved:
+        _update_leaderboards(fs_client, saved, timer)
+
+    processed = len(decoded) + len(hits)
+    logger.info(f"Batch scored {len(saved)}/{len(paths)} images", images=len(paths),
+                decoded=len(decoded), saved=len(saved), cacheHits=len(hits),
+                faceCount=sum(len(faces) for faces, _ in results),
+                **_score_cache.stats(), **TRACER.finish(timer))
+    return {"processed": processed, "saved": len(saved)}
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+関数のパッケージに同梱する InsightFace のモデル（buffalo_l の検出 + 認識だけ）
+
+FaceAnalysis(name="buffalo_l") は ~/.insightface/models にモデルが無いと、約 300 MB の
+buffalo_l.zip をダウンロードする。Cloud Functions の新しいインスタンスではコールドスタートの
+たびにこれが起きるので、スコア計算に使う 2 つの ONNX だけを関数のディレクトリに置き、
+FaceAnalysis の root をそこに向ける。
+
+    insightface/models/buffalo_l/det_10g.onnx     検出（SCRFD）
+    insightface/models/buffalo_l/w600k_r50.onnx   認識（ArcFace）
+    insightface/models/buffalo_l/checksums.json   各ファイルの SHA-256 とサイズ（コミットする）
+
+ONNX ファイルは git に入れず、tools/vendor_models.py で配置する。checksums.json は最初に
+公開されている buffalo_l から --update で配置したときに、実際のファイルから作ってコミットする
+（手で書いた値は使わない）。以降に配置するファイルはこれと一致しなければならない
+（一致しないものを配置することはない）。デプロイ前には firebase.json の predeploy で
+確認するので、ファイルが無い・壊れたままデプロイされることはない。実行時に見つかった場合も
+ダウンロードに頼らずに ModelBundleError ですぐに失敗させる。
+"""
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+BUNDLE_ROOT = Path(__file__).with_name("insightface")
+BUNDLE_FILES = {"buffalo_l": ("det_10g.onnx", "w600k_r50.onnx")}
+CHECKSUMS_NAME = "checksums.json"
+
+
+class ModelBundleError(RuntimeError):
+    """同梱モデルが無い・チェックサムが一致しない"""
+
+
+def model_dir(root, name):
+    return Path(root) / "models" / name
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_checksums(root, name):
+    path = model_dir(root, name) / CHECKSUMS_NAME
+    if not path.exists():
+        raise ModelBundleError(f"{path} がありません（git から取得するか、初回は公開されている "
+                               "buffalo_l から tools/vendor_models.py --update で作ってコミットしてください）")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify(root=BUNDLE_ROOT, name="buffalo_l", full=True):
+    """同梱モデルを確認して root を返す（問題があれば ModelBundleError）
+
+    full=False ならファイルの有無とサイズだけを確認する（SHA-256 の計算を省く）。
+    """
+    checksums = load_checksums(root, name)
+    directory = model_dir(root, name)
+    problems = []
+    for file_name in BUNDLE_FILES.get(name, tuple(checksums)):
+        path = directory / file_name
+        expected = checksums.get(file_name)
+        if expected is None:
+            problems.append(f"{file_name}: {CHECKSUMS_NAME} に記載がありません")
+        elif not path.exists():
+            problems.append(f"{file_name}: ファイルがありません")
+        elif path.stat().st_size != expected["size"]:
+            problems.append(f"{file_name}: サイズが一致しません"
+                            f"（{path.stat().st_size} != {expected['size']}）")
+        elif full and _sha256(path) != expected["sha256"]:
+            problems.append(f"{file_name}: SHA-256 が一致しません")
+    if problems:
+        raise ModelBundleError(f"同梱モデル {directory} を使えません: " + "; ".join(problems))
+    return Path(root)
+
+
+def vendor(source_dir, root=BUNDLE_ROOT, name="buffalo_l", update=False):
+    """source_dir（展開済みの buffalo_l）から必要なファイルだけを root にコピーする
+
+    コピーしたファイルがコミット済みの checksums.json と一致しなければ ModelBundleError に
+    する（checksums.json が無くても失敗する）。update=True のときだけ、コピーしたファイルから
+    checksums.json を作る・書き直す（最初の配置と、意図したモデルの更新）。
+
+    Returns:
+        {file_name: {"sha256", "size"}}
+    """
+    source_dir = Path(source_dir)
+    directory = model_dir(root, name)
+    directory.mkdir(parents=True, exist_ok=True)
+    pinned = None if update else load_checksums(root, name)
+
+    checksums = {}
+    for file_name in BUNDLE_FILES[name]:
+        src = source_dir / file_name
+        if not src.exists():
+            raise ModelBundleError(f"{src} がありません")
+        tmp = directory / (file_name + ".tmp")
+        shutil.copyfile(src, tmp)
+        entry = {"sha256": _sha256(tmp), "size": tmp.stat().st_size}
+        if pinned is not None and pinned.get(file_name) != entry:
+            tmp.unlink()
+            raise ModelBundleError(f"{src} が {CHECKSUMS_NAME} と一致しません"
+                                   "（意図した更新なら --update を付けてください）")
+        tmp.replace(directory / file_name)
+        checksums[file_name] = entry
+
+    if update:
+        with open(directory / CHECKSUMS_NAME, "w", encoding="utf-8") as f:
+            json.dump(checksums, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    return checksums
+
+
+def local_root(name="buffalo_l"):
+    """ツール・テスト用: 同梱モデルが配置済みなら BUNDLE_ROOT、無ければ None（~/.insightface）"""
+    directory = model_dir(BUNDLE_ROOT, name)
+    files = (CHECKSUMS_NAME,) + BUNDLE_FILES.get(name, ())
+    return BUNDLE_ROOT if all((directory / f).exists() for f in files) else None
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+InsightFace モデルの遅延初期化とウォームアップ
+
+buffalo_l には検出・認識以外に genderage / 2d・3d ランドマークのモデルも含まれるが、
+スコア計算で使うのは検出（det_10g）と認識（w600k_r50）だけなので、allowed_modules で
+その 2 つだけをロードする。初回の get() でロックを取ってロードし、合成画像で一度推論して
+ONNX Runtime のグラフ最適化を最初の実画像より前に済ませておく。
+検出を複数の入力サイズで行う場合（detection_policy の adaptive）は、warmup_det_sizes の
+サイズでも一度ずつ検出しておく。
+
+セッションの設定（スレッド数・グラフ最適化など）は ort_session.SessionConfig で渡す。
+requirements.txt の insightface==0.7.3 の FaceAnalysis / model_zoo.get_model は
+providers と provider_options しか InferenceSession に渡さないので、SessionOptions を
+渡しても無視される。そのため InferenceSession はここで SessionConfig から作り、
+insightface の SCRFD / ArcFaceONNX に session= で渡して FaceApp（FaceAnalysis の
+prepare / get と同じ動作）にまとめる。
+設定に最適化済みモデルのキャッシュがあれば、元のモデルの代わりにそれを読み込む。
+verify_root を指定すると、root の同梱モデル（model_bundle.py）をロード前に確認し、
+無ければダウンロードせずに ModelBundleError で失敗する。
+
+insightface はパッケージの import だけで app（mask_renderer → albumentations / matplotlib）・
+data・thirdparty まで読み込む（insightface 0.7.3 で約 1.0〜1.4 秒、スコア計算には使わない）。
+__init__ を飛ばすには sys.modules を差し替えるしかなく、途中で失敗すると同じプロセスの
+ほかの import まで壊れるので、ここでは飛ばさない。ロード時に import_insightface() で
+使うサブモジュール（INSIGHTFACE_MODULES、requirements.txt の 0.7.3 にあることをテストで確認）を
+通常どおり import し、この時間は preload() でリクエストの外に出す。
+
+preload() はロードをバックグラウンドのスレッドで始める（インスタンスの起動時に呼ぶと、
+insightface の import とセッションの作成が最初のリクエストを待たずに進む）。get() は
+ロードが終わるまで待つ。
+"""
+
+import importlib
+import logging
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import model_bundle
+from ort_session import CACHED_LEVEL, SessionConfig, create_session
+
+DEFAULT_MODEL_NAME = "buffalo_l"
+DEFAULT_MODULES = ("detection", "recognition")
+DEFAULT_PROVIDERS = ("CPUExecutionProvider",)
+# buffalo_l のファイルのタスク。allowed_modules に無いものはセッションを作らずに飛ばす
+# （ほかのファイルは insightface の ModelRouter と同じく入出力の形で判断する）
+MODEL_TASKS = {"det_10g.onnx": "detection", "w600k_r50.onnx": "recognition",
+               "genderage.onnx": "genderage", "1k3d68.onnx": "landmark_3d_68",
+               "2d106det.onnx": "landmark_2d_106"}
+
+
+# スコア計算で使う insightface のサブモジュール（face_pipeline が使うものを含む）
+INSIGHTFACE_MODULES = ("insightface.model_zoo.scrfd", "insightface.model_zoo.arcface_onnx",
+                       "insightface.utils.face_align", "insightface.utils.storage",
+                       "insightface.app.common")
+
+
+def import_insightface(modules=INSIGHTFACE_MODULES):
+    """insightface の modules を import する（パッケージの __init__ も通常どおり実行する）"""
+    for name in modules:
+        importlib.import_module(name)
+
+
+def _route(model_file, session):
+    """セッションの入出力の形からモデルを作る（検出・認識以外は None）"""
+    from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+    from insightface.model_zoo.scrfd import SCRFD
+
+    inputs, outputs = session.get_inputs(), session.get_outputs()
+    shape = inputs[0].shape
+    if len(outputs) >= 5:
+        return SCRFD(model_file=model_file, session=session)
+    if len(inputs) == 1 and shape[2] == shape[3] and isinstance(shape[2], int) \
+            and shape[2] >= 112 and shape[2] % 16 == 0 and shape[2] != 192:
+        return ArcFaceONNX(model_file=model_file, session=session)
+    return None
+
+
+class FaceApp:
+    """FaceAnalysis と同じ prepare() / get() を持つ、セッションを外から渡すアプリ
+
+    Attributes:
+        models: {タスク名: モデル}（"detection" は det_model と同じ）
+        model_dir: モデルを読み込んだディレクトリ
+    """
+
+    def __init__(self, models, model_dir=None):
+        if "detection" not in models:
+            raise ValueError(f"detection model not found in {model_dir}")
+        self.models = models
+        self.det_model = models["detection"]
+        self.model_dir = model_dir
+
+    def prepare(self, ctx_id=0, det_thresh=0.5, det_size=(640, 640)):
+        self.det_thresh = det_thresh
+        self.det_size = det_size
+        for taskname, model in self.models.items():
+            if taskname == "detection":
+                model.prepare(ctx_id, input_size=det_size, det_thresh=det_thresh)
+            else:
+                model.prepare(ctx_id)
+
+    def get(self, img, max_num=0):
+        from insightface.app.common import Face
+
+        bboxes, kpss = self.det_model.detect(img, max_num=max_num, metric="default")
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(bbox=bboxes[i, 0:4], kps=None if kpss is None else kpss[i],
+                        det_score=bboxes[i, 4])
+            for taskname, model in self.models.items():
+                if taskname != "detection":
+                    model.get(img, face)
+            faces.append(face)
+        return faces
+
+
+class FaceModel:
+    """FaceApp（検出・認識のモデル）をスレッドセーフに遅延ロードするマネージャ
+
+    Attributes:
+        timings: {"import": 秒, "load": 秒, "warmup": 秒}（ロード前は空。"load" は "import" を含む）
+        model_root: セッションを作ったモデルの root（キャッシュを使えばそのディレクトリ。
+            None なら insightface の既定）
+    """
+
+    def __init__(self, name=DEFAULT_MODEL_NAME, det_size=(640, 640),
+                 allowed_modules=DEFAULT_MODULES, providers=DEFAULT_PROVIDERS,
+                 root=None, warmup=True, session_config=None, warmup_det_sizes=(),
+                 verify_root=None):
+        self.name = name
+        self.det_size = tuple(det_size)
+        self.allowed_modules = list(allowed_modules) if allowed_modules else None
+        self.providers = list(providers)
+        self.root = root
+        self.verify_root = verify_root      # None / "size" / "sha256"
+        self.warmup = warmup
+        self.session_config = session_config or SessionConfig()
+        self.model_root = None
+        self.warmup_det_sizes = tuple(warmup_det_sizes)
+        self.timings = {}
+        self._app = None
+        self._lock = threading.Lock()
+        self._preload = None
+        self._preload_lock = threading.Lock()   # ロード中の _lock を待たずに済むよう別にする
+
+    @property
+    def loaded(self):
+        return self._app is not None
+
+    def preload(self):
+        """バックグラウンドのスレッドでロードを始める（2 回目以降は何もしない）
+
+        ロードに失敗した場合はログに出すだけで、次の get() があらためてロードして例外を投げる。
+        """
+        with self._preload_lock:
+            if self._app is not None or self._preload is not None:
+                return
+            self._preload = threading.Thread(target=self._preload_worker, name="face-model-preload",
+                                             daemon=True)
+            self._preload.start()
+
+    def _preload_worker(self):
+        try:
+            self.get()
+        except Exception as e:
+            logging.warning("Failed to preload InsightFace model: %s", e)
+
+    def get(self):
+        """初期化済みの FaceApp を返す（未ロードならここでロードする）"""
+        app = self._app
+        if app is not None:
+            return app
+        with self._lock:
+            if self._app is None:
+                self._app = self._load()
+            return self._app
+
+    def _create_app(self):
+        t0 = time.perf_counter()
+        import_insightface()
+        from insightface.utils.storage import ensure_available
+        self.timings["import"] = time.perf_counter() - t0
+
+        if self.root and self.verify_root:
+            model_bundle.verify(self.root, self.name, full=self.verify_root == "sha256")
+        model_dir = Path(ensure_available("models", self.name,
+                                          root=str(self.root or "~/.insightface")))
+        # 最適化済みモデルのキャッシュがあれば、セッションはそちらから作る（グラフ最適化を省ける）。
+        # ArcFaceONNX は model_file のグラフから入力の正規化を決めるので、model_file は元のモデル
+        cache_root = self.session_config.model_root(self.name, sources=self._source_checksums())
+        cache_dir = Path(cache_root) / "models" / self.name if cache_root else None
+        self.model_root = cache_root or self.root
+        models = {}
+        for model_file in sorted(model_dir.glob("*.onnx")):
+            task = MODEL_TASKS.get(model_file.name)
+            if task is not None and (task in models or (self.allowed_modules is not None
+                                                        and task not in self.allowed_modules)):
+                continue
+            cached = cache_dir / model_file.name if cache_dir else None
+            if cached is not None and cached.exists():
+                session = create_session(cached, self.session_config, self.providers,
+                                         optimization_level=CACHED_LEVEL)
+            else:
+                session = create_session(model_file, self.session_config, self.providers)
+            model = _route(str(model_file), session)
+            if model is None or model.taskname in models or (
+                    self.allowed_modules is not None and model.taskname not in self.allowed_modules):
+                continue
+            models[model.taskname] = model
+        app = FaceApp(models, model_dir=str(model_dir))
+        app.prepare(ctx_id=0, det_size=self.det_size)
+        return app
+
+    def _source_checksums(self):
+        """同梱モデルの {ファイル名: SHA-256}（checksums.json が無ければ None）"""
+        if not self.root:
+            return None
+        try:
+            checksums = model_bundle.load_checksums(self.root, self.name)
+        except model_bundle.ModelBundleError:
+            return None
+        return {file_name: entry["sha256"] for file_name, entry in checksums.items()}
+
+    def _load(self):
+        t0 = time.perf_counter()
+        app = self._create_app()
+        self.timings["load"] = time.perf_counter() - t0
+
+        if self.warmup:
+            t0 = time.perf_counter()
+            self._warmup(app)
+            self.timings["warmup"] = time.perf_counter() - t0
+
+        logging.info("InsightFace model loaded: %s modules=%s root=%s %r import=%.3fs load=%.3fs "
+                     "warmup=%.3fs", self.name, self.allowed_modules, self.model_root,
+                     self.session_config, self.timings.get("import", 0.0), self.timings["load"],
+                     self.timings.get("warmup", 0.0))
+        return app
+
+    def _warmup(self, app):
+        """合成画像で検出・認識を一度ずつ実行する
+
+        ノイズ画像からは顔が見つからないので、認識モデルは 112x112 の入力を直接流す。
+        """
+        rng = np.random.default_rng(0)
+        h, w = self.det_size[1], self.det_size[0]
+        app.get(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8))
+        for size in self.warmup_det_sizes:
+            if (size, size) != self.det_size:
+                app.det_model.detect(rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8),
+                                     input_size=(size, size))
+
+        rec_model = app.models.get("recognition")
+        if rec_model is not None:
+            rec_model.get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime のセッション設定と、最適化済みモデルのキャッシュ
+
+FaceAnalysis は既定の SessionOptions でセッションを作るので（insightface 0.7.3 は
+SessionOptions を渡しても InferenceSession まで届かない）、スレッド数は vCPU 数に
+なり、グラフ最適化もインスタンスが起動するたびに行われる。ここでは
+
+    - スレッド数（intra / inter）、実行モード、グラフ最適化レベル、スピン待ちの有無、
+      スレッドのアフィニティを SessionConfig にまとめ、score_image・tools・テストで共有する
+      （セッションは create_session() で作る。model_manager.FaceModel もこれを使う）
+    - build_cache() でグラフ最適化済みのモデル（optimized_model_filepath）を書き出しておき、
+      デプロイに同梱してコールドスタートでは最適化済みのモデルを読み込む
+      （最適化は作成時に済んでいるので、読み込むときはグラフ最適化をしない: CACHED_LEVEL）
+
+キャッシュの構成（FaceAnalysis の root としてそのまま使える）:
+    <cache_dir>/models/<name>/*.onnx        最適化済みのモデル（元と同じファイル名）
+    <cache_dir>/models/<name>/manifest.json ORT のバージョン・最適化レベル・元のモデルの SHA-256
+
+最適化済みのモデルは作成した ONNX Runtime のバージョンでしか使えないので、バージョンが
+違うキャッシュ・manifest の SHA-256 と一致しないキャッシュは使わずに元のモデルを読み込む。
+build_cache() は最適化の前後でサンプル入力に対する出力が一致することを確かめ、
+一致しなければキャッシュを書き出さない。
+
+insightface の ArcFaceONNX は model_file のグラフの先頭のノード名から入力の正規化を
+決めるので、キャッシュのセッションを使うときも model_file には元のモデルを渡すこと
+（model_manager.FaceModel）。
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_NAME = "manifest.json"
+LEVELS = ("disable", "basic", "extended", "all")
+EXECUTION_MODES = ("sequential", "parallel")
+# キャッシュは特定の CPU の命令セットに依存しないレベル（"all" はレイアウト変換が入る）
+CACHE_LEVEL = "extended"
+# キャッシュを読み込むときのレベル（作成時に最適化済みなので、起動のたびに最適化し直さない）
+CACHED_LEVEL = "disable"
+# build_cache() の前後比較の許容誤差（融合した演算の丸め誤差は通す）
+PARITY_RTOL = 1e-3
+PARITY_ATOL = 1e-4
+
+
+def _ort():
+    import onnxruntime
+
+    return onnxruntime
+
+
+class SessionConfig:
+    """InferenceSession に渡す SessionOptions の設定
+
+    Args:
+        intra_op_threads: 演算内のスレッド数（None なら ORT の既定 = vCPU 数）
+        inter_op_threads: 演算間のスレッド数（parallel のときだけ使われる）
+        execution_mode: "sequential" / "parallel"
+        optimization_level: "disable" / "basic" / "extended" / "all"
+        allow_spinning: False なら待機中のスレッドがスピンしない（推論プールで複数の
+            セッションが CPU を分け合うときに、ほかのワーカーの CPU を奪わない）
+        intra_op_affinities: スレッドを割り当てる CPU（ORT の session.intra_op_thread_affinities
+            の書式。例 "1;2;3"）
+        cache_dir: build_cache() で作った最適化済みモデルのディレクトリ
+    """
+
+    def __init__(self, intra_op_threads=None, inter_op_threads=1, execution_mode="sequential",
+                 optimization_level="all", allow_spinning=True, intra_op_affinities=None,
+                 cache_dir=None):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"unknown execution mode: {execution_mode}")
+        if optimization_level not in LEVELS:
+            raise ValueError(f"unknown optimization level: {optimization_level}")
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.execution_mode = execution_mode
+        self.optimization_level = optimization_level
+        self.allow_spinning = allow_spinning
+        self.intra_op_affinities = intra_op_affinities
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+    @classmethod
+    def from_env(cls, environ=None, **defaults):
+        """環境変数（ORT_*）から作る。環境変数が無い項目は defaults、それも無ければ既定値
+
+            ORT_INTRA_OP_THREADS / ORT_INTER_OP_THREADS / ORT_EXECUTION_MODE /
+            ORT_OPT_LEVEL / ORT_ALLOW_SPINNING（0 / 1）/ ORT_INTRA_OP_AFFINITIES / ORT_CACHE_DIR
+        """
+        environ = os.environ if environ is None else environ
+        kwargs = dict(defaults)
+        for key, name, conv in (
+                ("intra_op_threads", "ORT_INTRA_OP_THREADS", int),
+                ("inter_op_threads", "ORT_INTER_OP_THREADS", int),
+                ("execution_mode", "ORT_EXECUTION_MODE", str),
+                ("optimization_level", "ORT_OPT_LEVEL", str),
+                ("allow_spinning", "ORT_ALLOW_SPINNING", lambda v: v not in ("0", "false")),
+                ("intra_op_affinities", "ORT_INTRA_OP_AFFINITIES", str),
+                ("cache_dir", "ORT_CACHE_DIR", str)):
+            if environ.get(name):
+                kwargs[key] = conv(environ[name])
+        return cls(**kwargs)
+
+    def __repr__(self):
+        return (f"SessionConfig(intra={self.intra_op_threads}, inter={self.inter_op_threads}, "
+                f"mode={self.execution_mode}, level={self.optimization_level}, "
+                f"spinning={self.allow_spinning}, cache_dir={self.cache_dir})")
+
+    def session_options(self, optimized_model_filepath=None, optimization_level=None):
+        """onnxruntime.SessionOptions を作る"""
+        ort = _ort()
+        opts = ort.SessionOptions()
+        if self.intra_op_threads:
+            opts.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            opts.inter_op_num_threads = self.inter_op_threads
+        opts.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if self.execution_mode == "parallel"
+                               else ort.ExecutionMode.ORT_SEQUENTIAL)
+        level = optimization_level or self.optimization_level
+        opts.graph_optimization_level = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[level]
+        if not self.allow_spinning:
+            opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+            opts.add_session_config_entry("session.inter_op.allow_spinning", "0")
+        if self.intra_op_affinities:
+            opts.add_session_config_entry("session.intra_op_thread_affinities",
+                                          self.intra_op_affinities)
+        if optimized_model_filepath:
+            opts.optimized_model_filepath = str(optimized_model_filepath)
+        return opts
+
+    def model_root(self, name, sources=None):
+        """モデルの root（使えるキャッシュがあればそのディレクトリ、無ければ None）
+
+        キャッシュの各ファイルは manifest の SHA-256 と照合する。sources（{ファイル名: 元の
+        モデルの SHA-256}。同梱モデルの checksums.json など）を渡すと、キャッシュが
+        同じ元のモデルから作られたことも確かめる。
+        """
+        if self.cache_dir is None:
+            return None
+        directory = self.cache_dir / "models" / name
+        manifest = load_manifest(directory)
+        if manifest is None:
+            logging.info("ORT cache not found: %s", directory)
+            return None
+        version = _ort().__version__
+        if manifest.get("ort_version") != version:
+            logging.warning("ORT cache was built with onnxruntime %s (running %s); ignored",
+                            manifest.get("ort_version"), version)
+            return None
+        for file_name, entry in manifest.get("models", {}).items():
+            path = directory / file_name
+            source = (sources or {}).get(file_name)
+            if source is not None and source != entry.get("source_sha256"):
+                logging.warning("ORT cache %s was built from a different model; ignored", path)
+                return None
+            if not path.exists() or _sha256(path) != entry.get("sha256"):
+                logging.warning("ORT cache %s does not match %s; ignored", path, MANIFEST_NAME)
+                return None
+        return str(self.cache_dir)
+
+
+def create_session(model_file, config=None, providers=("CPUExecutionProvider",),
+                   optimization_level=None):
+    """config の SessionOptions で model_file の InferenceSession を作る
+
+    optimization_level を渡すと config のレベルの代わりに使う（キャッシュは CACHED_LEVEL）。
+    """
+    config = config or SessionConfig()
+    opts = config.session_options(optimization_level=optimization_level)
+    return _ort().InferenceSession(str(model_file), sess_options=opts, providers=list(providers))
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(model_dir):
+    path = Path(model_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _sample_inputs(session, seed=0, size=640):
+    """session の入力に合わせた乱数の入力（バッチなど形の決まっていない次元は 1 / size）"""
+    rng = np.random.default_rng(seed)
+    feeds = {}
+    for arg in session.get_inputs():
+        shape = [d if isinstance(d, int) and d > 0 else (1 if i == 0 else size)
+                 for i, d in enumerate(arg.shape)]
+        feeds[arg.name] = rng.standard_normal(shape).astype(np.float32)
+    return feeds
+
+
+def check_parity(source_file, optimized_file, providers=("CPUExecutionProvider",)):
+    """同じサンプル入力で元のモデルと最適化済みのモデルの出力が一致することを確かめる
+
+    一致しなければ ValueError（認識モデルなら埋め込みが変わってしまう）。
+    """
+    ort = _ort()
+    opts = SessionConfig(intra_op_threads=1).session_options(optimization_level="disable")
+    source = ort.InferenceSession(str(source_file), sess_options=opts, providers=list(providers))
+    optimized = ort.InferenceSession(str(optimized_file), sess_options=opts,
+                                     providers=list(providers))
+    feeds = _sample_inputs(source)
+    names = [o.name for o in source.get_outputs()]
+    for name, expected, actual in zip(names, source.run(names, feeds),
+                                      optimized.run(names, feeds)):
+        if expected.shape != actual.shape or not np.allclose(
+                actual, expected, rtol=PARITY_RTOL, atol=PARITY_ATOL):
+            diff = np.abs(actual - expected).max() if expected.shape == actual.shape else None
+            raise ValueError(f"{optimized_file}: output {name} differs from {source_file} "
+                             f"(max abs diff {diff})")
+
+
+def build_cache(model_files, cache_dir, name, config=None, level=CACHE_LEVEL):
+    """model_files を level で最適化して <cache_dir>/models/<name>/ に書き出す
+
+    最適化の前後で出力が変わるモデルがあれば ValueError（そのファイルは書き出さない）。
+
+    Returns:
+        manifest の dict
+    """
+    ort = _ort()
+    config = config or SessionConfig()
+    out_dir = Path(cache_dir) / "models" / name
+    out_dir.mkdir(parents=True, exist_ok=True)
+    models = {}
+    for model_file in map(Path, model_files):
+        out_path = out_dir / model_file.name
+        tmp_path = out_dir / (model_file.name + ".tmp")
+        opts = config.session_options(optimized_model_filepath=tmp_path, optimization_level=level)
+        ort.InferenceSession(str(model_file), sess_options=opts,
+                             providers=["CPUExecutionProvider"])
+        try:
+            check_parity(model_file, tmp_path)
+        except Exception:
+            tmp_path.unlink()
+            raise
+        tmp_path.replace(out_path)
+        models[model_file.name] = {"source_sha256": _sha256(model_file),
+                                   "sha256": _sha256(out_path)}
+        logging.info("Optimized %s -> %s", model_file, out_path)
+
+    manifest = {"name": name, "ort_version": ort.__version__, "level": level, "models": models}
+    with open(out_dir / MANIFEST_NAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Storage のパスから決まる写真のドキュメント ID
+
+これまで score_image は contestScores / faceEmbeddings の ID に Path(blob_path).stem を
+使っていたので、別のフォルダにある同じファイル名の写真（ゲストごとの IMG_0001.jpg など）が
+同じドキュメントを上書きしていた。functions_bkp は photos を fileName で検索していたので、
+写真ごとにクエリが 1 回余計にかかり、コレクションが大きくなるほど遅くなっていた。
+
+ID はパス全体を JavaScript の encodeURIComponent と同じ規則でパーセントエンコードした文字列にする。
+
+    wedding-photos/3f2a....jpg  →  wedding-photos%2F3f2a....jpg
+
+    - パスが違えば ID も違う（エンコードは可逆なので衝突しない）
+    - "/" を含まないので Firestore のドキュメント ID としてそのまま使える
+    - Web UI（web-ui/src/photoId.js）と Cloud Functions で同じ ID を計算できるので、
+      photos / contestScores / faceEmbeddings を読まずに直接書き込める
+"""
+
+from urllib.parse import quote, unquote
+
+# encodeURIComponent がエンコードしない記号（英数字と "-_.~" は quote でも常にそのまま）
+_SAFE = "!'()*"
+MAX_ID_BYTES = 1500   # Firestore のドキュメント ID の上限
+
+
+def photo_doc_id(blob_path):
+    """Storage のパス（例: "wedding-photos/xxx.jpg"）からドキュメント ID を返す"""
+    if not blob_path:
+        raise ValueError("empty blob path")
+    doc_id = quote(blob_path, safe=_SAFE)
+    if len(doc_id.encode("ascii")) > MAX_ID_BYTES:
+        raise ValueError(f"blob path too long for a document ID: {blob_path[:80]}...")
+    if doc_id in (".", "..") or (doc_id.startswith("__") and doc_id.endswith("__")):
+        raise ValueError(f"reserved document ID: {doc_id}")
+    return doc_id
+
+
+def blob_path_of(doc_id):
+    """photo_doc_id の逆（ドキュメント ID から Storage のパス）"""
+    return unquote(doc_id)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+ターゲットベクトルが変わったときの contestScores の差分再計算
+
+contest_vectors_* を追加・差し替えてデプロイしても、既存の contestScores は
+更新されず、ランキングに新旧のコンテストが混ざってしまう。ここでは
+
+    1. コンテストごとのベクトルの内容ハッシュを、前回の実行時のもの
+       （Firestore: rescoreState/targets）と比べて、追加・変更・削除されたコンテストを求める
+    2. contestScores をドキュメント ID 順にページ単位で読み、変わったコンテストの列だけを
+       faceEmbeddings の埋め込みから NumPy で計算する。埋め込みが無い写真（保存を
+       始める前の写真）は、infer_missing が渡されていれば画像から推論して埋め込みも保存する
+    3. scores.<コンテスト名> だけを merge で書き換える（1 コミット 500 件まで）。
+       削除されたコンテストの列は、埋め込みが無い写真も含めて全部の写真から消す
+    4. ページごとにチェックポイントを保存し、中断しても続きから再開できる
+
+埋め込みも推論結果も得られずにスキップした写真（顔があるか分からない写真）があれば、
+rescoreState は更新せず、チェックポイントも最初にスキップした写真の手前で止めておく
+（次の実行はそこから再開し、その写真を infer_missing 付きで計算し直せる）。
+
+Firestore クライアントを渡して使う（tools/rescore_contests.py から呼び出す。
+エミュレーターに対しても FIRESTORE_EMULATOR_HOST を設定すればそのまま動く）。
+"""
+
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from face_embeddings import COLLECTION as EMBEDDINGS_COLLECTION
+from face_embeddings import FaceEmbeddingsError, decode, embeddings_record, encode_faces
+from target_index import FusedTargets, build_indexes
+from vector_store import fingerprint
+
+SCORES_COLLECTION = "contestScores"
+STATE_COLLECTION = "rescoreState"
+STATE_DOC = "targets"
+FIRESTORE_BATCH_MAX = 500
+PAGE_SIZE = 200   # 1 ページの写真数（スコア + 埋め込みの 2 件ずつ積んでも 500 件以内）
+
+
+def target_hashes(target_sets):
+    """{contest_name: そのコンテストのベクトルの内容ハッシュ}"""
+    return {name: fingerprint({name: vectors}) for name, vectors in target_sets.items()}
+
+
+def diff_targets(old, new):
+    """前回と今回の {contest_name: hash} から (再計算するコンテスト, 削除するコンテスト)"""
+    changed = sorted(name for name, h in new.items() if old.get(name) != h)
+    removed = sorted(name for name in old if name not in new)
+    return changed, removed
+
+
+def load_state(db):
+    """前回の実行時の {"hashes": {...}, "formula": ..., "alpha": ...}（無ければ空）"""
+    snap = db.collection(STATE_COLLECTION).document(STATE_DOC).get()
+    return snap.to_dict() if snap.exists else {}
+
+
+def save_state(db, hashes, formula, alpha):
+    db.collection(STATE_COLLECTION).document(STATE_DOC).set(
+        {"hashes": hashes, "formula": formula, "alpha": alpha})
+
+
+class Checkpoint:
+    """ローカルの JSON ファイルに進み具合を保存する"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self):
+        if not self.path.exists():
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, data):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        tmp.replace(self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+def iter_pages(db, start_after=None, page_size=PAGE_SIZE):
+    """contestScores をドキュメント ID 順に page_size 件ずつ返す"""
+    collection = db.collection(SCORES_COLLECTION)
+    cursor = collection.document(start_after).get() if start_after else None
+    while True:
+        query = collection.order_by("__name__").limit(page_size)
+        if cursor is not None:
+            query = query.start_after(cursor)
+        page = list(query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = page[-1]
+
+
+def _load_embeddings(db, doc_ids):
+    """{doc_id: (n_faces, 512) の埋め込み}（保存されていない・壊れている写真は含めない）"""
+    collection = db.collection(EMBEDDINGS_COLLECTION)
+    found = {}
+    for snap in db.get_all([collection.document(doc_id) for doc_id in doc_ids]):
+        if not snap.exists:
+            continue
+        try:
+            embs = decode(snap.to_dict()["data"]).embeddings
+        except (FaceEmbeddingsError, KeyError) as e:
+            logging.warning("Broken embeddings for %s: %s", snap.id, e)
+            continue
+        if len(embs):
+            found[snap.id] = embs
+    return found
+
+
+def score_columns(fused, embs_list, formula="mean", alpha=0.8):
+    """写真ごとの埋め込みのリストから (n_photos, n_contests) のスコア行列を計算する"""
+    if not embs_list:
+        return np.zeros((0, len(fused.names)), dtype=np.float32)
+    sizes = [len(e) for e in embs_list]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    face_embs = np.concatenate(embs_list)
+    if formula == "max":
+        return fused.max_scores_many(face_embs, offsets, alpha)
+    return fused.mean_scores_many(face_embs, offsets)
+
+
+def rescore(db, target_sets, formula="mean", alpha=0.8, full=False, checkpoint=None,
+            infer_missing=None, delete_field=None, page_size=PAGE_SIZE, dry_run=False):
+    """変わったコンテストの列だけを再計算して contestScores に書き込む
+
+    Args:
+        target_sets: 現在の {contest_name: (m, 512) ndarray}
+        full: True なら差分に関係なく全コンテストを再計算する
+        checkpoint: Checkpoint（None なら再開できない）
+        infer_missing: 埋め込みが保存されていない写真用。
+            infer_missing([path, ...]) -> {path: (faces, embs, scale)}
+        delete_field: 削除されたコンテストの列を消す値（firestore.DELETE_FIELD）
+    Returns:
+        実行結果の集計 dict
+    """
+    hashes = target_hashes(target_sets)
+    state = load_state(db)
+    changed, removed = diff_targets(state.get("hashes", {}), hashes)
+    if full or (state.get("formula"), state.get("alpha")) != (formula, alpha):
+        changed = sorted(hashes)
+
+    stats = {"changed": changed, "removed": removed, "photos": 0, "inferred": 0,
+             "skipped": 0, "commits": 0, "resumed": False, "complete": False}
+    saved = checkpoint.load() if checkpoint else None
+    start_after = None
+    if saved and saved.get("hashes") == hashes and saved.get("formula") == formula \
+            and saved.get("alpha") == alpha:
+        changed, removed, start_after = saved["changed"], saved["removed"], saved["last_doc_id"]
+        stats.update(changed=changed, removed=removed, resumed=True)
+    resume_after = start_after   # スキップした写真があれば、その手前から先には進めない
+    if not changed and not removed:
+        return stats
+    if removed and delete_field is None:
+        raise ValueError("delete_field is required to remove contests")
+
+    fused = FusedTargets(build_indexes({name: target_sets[name] for name in changed}))
+    scores_col = db.collection(SCORES_COLLECTION)
+    emb_col = db.collection(EMBEDDINGS_COLLECTION)
+
+    for page in iter_pages(db, start_after=start_after, page_size=page_size):
+        doc_ids = [snap.id for snap in page]
+        found = _load_embeddings(db, doc_ids)
+        batch, n_ops = db.batch(), 0
+
+        missing = {snap.id: snap.get("path") for snap in page if snap.id not in found}
+        if missing and infer_missing is not None:
+            results = infer_missing([p for p in missing.values() if p])
+            for doc_id, path in missing.items():
+                if path not in results or not len(results[path][1]):
+                    continue
+                faces, embs, scale = results[path]
+                found[doc_id] = embs
+                batch.set(emb_col.document(doc_id),
+                          embeddings_record(path, encode_faces(faces, embs, scale=scale)))
+                n_ops += 1
+                stats["inferred"] += 1
+
+        scored = [doc_id for doc_id in doc_ids if doc_id in found]
+        matrix = dict(zip(scored, score_columns(fused, [found[d] for d in scored], formula, alpha)))
+        for snap in page:
+            update = {}
+            if snap.id in matrix:
+                update.update(zip(fused.names, matrix[snap.id].tolist()))
+            update.update({name: delete_field for name in removed
+                           if name in (snap.get("scores") or {})})
+            if update:
+                batch.set(scores_col.document(snap.id), {"scores": update}, merge=True)
+                n_ops += 1
+        # 顔が 0 枚と分かっている写真は計算するものが無いのでスキップに数えない
+        skipped = [snap.id for snap in page
+                   if snap.id not in matrix and snap.get("faceCount") != 0]
+        stats["photos"] += len(scored)
+        if skipped and not stats["skipped"]:
+            index = doc_ids.index(skipped[0])
+            resume_after = doc_ids[index - 1] if index else resume_after
+        stats["skipped"] += len(skipped)
+        if not stats["skipped"]:
+            resume_after = doc_ids[-1]
+
+        if n_ops > FIRESTORE_BATCH_MAX:
+            raise ValueError(f"page_size too large: {n_ops} operations in one batch")
+        if n_ops and not dry_run:
+            batch.commit()
+            stats["commits"] += 1
+        if checkpoint and not dry_run and resume_after is not None:
+            checkpoint.save({"hashes": hashes, "formula": formula, "alpha": alpha,
+                             "changed": changed, "removed": removed,
+                             "last_doc_id": resume_after})
+
+    if stats["skipped"]:
+        logging.warning("%d photos were skipped (no embeddings); rescoreState is not updated",
+                        stats["skipped"])
+    elif not dry_run:
+        save_state(db, hashes, formula, alpha)
+        if checkpoint:
+            checkpoint.clear()
+        stats["complete"] = True
+    return stats
+
+
+def make_inference_fallback(face_model, bucket, pool, max_side=None, workers=4,
+                            policy=None, face_filter=None):
+    """埋め込みが無い写真を Storage から読み込んでまとめて推論する infer_missing を作る
+
+    policy / face_filter は score_image と同じものを渡す。
+    """
+    from face_pipeline import embed_images
+    from storage_io import iter_images
+
+    def infer_missing(paths):
+        order, scales = [], []
+
+        def images():
+            for path, image, _ in iter_images(bucket, paths, pool,
+                                              max_side=max_side, workers=workers):
+                order.append(path)
+                scales.append(image.scale)
+                yield image
+
+        results = embed_images(face_model.get(), images(), policy=policy,
+                               face_filter=face_filter)
+        return {path: (faces, embs, scale)
+                for path, scale, (faces, embs) in zip(order, scales, results)}
+
+    return infer_missing
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Cloud Storage からのダウンロードをメモリ上のバッファで行う I/O 層
+
+tempfile + download_to_filename の代わりに、使い回す BytesIO にダウンロードして
+そこから直接デコードする（Cloud Functions の /tmp はメモリ上にあるので、
+一時ファイルを経由するとメモリを二重に使う）。
+
+BytesIO は truncate で容量が半分以下にならない限り再確保しないので、
+同じくらいのサイズの写真が続く間はバッファを使い回せる。
+"""
+
+import io
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+from image_io import decode_image
+from timing import NULL_TIMER
+
+
+class BufferPool:
+    """ダウンロード用 BytesIO の使い回しプール（スレッドセーフ）"""
+
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def buffer(self):
+        with self._lock:
+            buf = self._idle.pop() if self._idle else io.BytesIO()
+        try:
+            yield buf
+        finally:
+            buf.seek(0)
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(buf)
+
+
+def download_to_buffer(blob, buf):
+    """blob の中身を buf の先頭から書き込み、バイト数を返す"""
+    buf.seek(0)
+    blob.download_to_file(buf)
+    size = buf.tell()
+    buf.truncate(size)
+    buf.seek(0)
+    return size
+
+
+@contextmanager
+def open_image(blob, pool, max_side=None, timer=NULL_TIMER):
+    """blob をバッファにダウンロードしてデコードした DecodedImage を返す
+
+    DecodedImage.full_resolution() はバッファを読み直すので、with ブロックの中で使うこと。
+    timer には "download" / "decode" フェーズの時間と、"downloadBytes" のカウンタが記録される。
+    """
+    with pool.buffer() as buf:
+        with timer.phase("download"):
+            size = download_to_buffer(blob, buf)
+        timer.count("downloadBytes", size)
+        with timer.phase("decode"):
+            decoded = decode_image(buf, max_side=max_side)
+        yield decoded
+
+
+def iter_images(bucket, blob_paths, pool, max_side=None, workers=4, timer=NULL_TIMER,
+                skip=None):
+    """複数の blob を並列にダウンロード・デコードし、順番に返すジェネレータ
+
+    呼び出し側が 1 枚目を処理している間も、続く workers 枚のダウンロードとデコードは
+    スレッドプールで進む。各バッファは呼び出し側が次の要素を要求した時点で返却される。
+
+    Args:
+        skip: skip(blob_path, blob) が True を返した blob はダウンロードしない
+              （キャッシュにヒットした画像など）。DecodedImage の代わりに None を返す。
+
+    Yields:
+        (blob_path, DecodedImage or None, userName)。失敗した blob はログに出してスキップ。
+    """
+    def fetch(blob_path):
+        blob = bucket.get_blob(blob_path)
+        if blob is None:
+            raise FileNotFoundError(blob_path)
+        user_name = (blob.metadata or {}).get("userName")
+        if skip is not None and skip(blob_path, blob):
+            return None, None, user_name
+        ctx = open_image(blob, pool, max_side=max_side, timer=timer)
+        return ctx, ctx.__enter__(), user_name
+
+    workers = max(1, min(workers, len(blob_paths)))
+    pending = iter(blob_paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 先読みは workers 枚まで（受け取った分だけ次を投げる）。呼び出し側の処理が遅くても
+        # デコード済みの画像とバッファが全件分メモリにたまらない
+        futures = deque((p, executor.submit(fetch, p)) for p in islice(pending, workers))
+        while futures:
+            blob_path, future = futures.popleft()
+            for p in islice(pending, 1):
+                futures.append((p, executor.submit(fetch, p)))
+            try:
+                ctx, decoded, user_name = future.result()
+            except Exception as e:
+                logging.error("Fail decode %s: %s", blob_path, e)
+                continue
+            try:
+                yield blob_path, decoded, user_name
+            finally:
+                if ctx is not None:
+                    ctx.__exit__(None, None, None)
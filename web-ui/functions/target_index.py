@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+コンテストのターゲットベクトルの索引
+
+score_image の平均スコアは全ペアの類似度平均 mean(face_embs @ cvecs.T) で、これは
+face_embs.mean(0) @ cvecs.mean(0) と等しい。ロード時に重心を計算しておけば、
+ターゲット数 m に関係なく 512 次元の内積 1 回で済む。
+
+functions_bkp の最大値ベースのスコア（顔ごとの最大類似度の合計 / n^α）は最近傍探索なので、
+ターゲットが多いコンテストでは NumPy の IVF（球面 k-means で分割した転置リスト）で
+近似検索する。少ないうちは総当たりのほうが速く正確なのでそのまま計算する。
+
+ターゲットは float16 / int8 に量子化した quantize.QuantizedMatrix でもよい。
+総当たりの類似度は量子化したまま計算し、重心と IVF は float32 に戻して作る。
+"""
+
+import numpy as np
+
+from quantize import QuantizedMatrix, similarity
+
+BRUTE_FORCE_MAX = 1024   # これ以下のターゲット数なら総当たり
+
+
+def _normalize(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+class IVFIndex:
+    """内積（コサイン類似度）の近似最近傍探索
+
+    nlist 個のクラスタに分け、検索時は重心との類似度が高い nprobe 個の
+    クラスタの中だけを総当たりする。
+    """
+
+    def __init__(self, vectors, nlist=None, nprobe=8, n_iter=10, seed=0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        m = vectors.shape[0]
+        self.nlist = min(m, nlist or max(1, int(np.sqrt(m))))
+        self.nprobe = min(nprobe, self.nlist)
+
+        centroids, assign = self._kmeans(vectors, self.nlist, n_iter, seed)
+        order = np.argsort(assign, kind="stable")
+        self.centroids = centroids
+        self.ids = order                                   # 並べ替え後の行 → 元の行番号
+        self.vectors = vectors[order]
+        self.offsets = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+
+    @staticmethod
+    def _kmeans(x, k, n_iter, seed):
+        rng = np.random.default_rng(seed)
+        centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = np.argmax(x @ centroids.T, axis=1)
+            counts = np.bincount(assign, minlength=k)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, x)
+            empty = counts == 0
+            if empty.any():
+                # 空のクラスタはランダムな点で置き直す
+                sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+        assign = np.argmax(x @ centroids.T, axis=1)
+        return centroids, assign
+
+    def search(self, queries, k=1):
+        """各クエリの上位 k 件の (類似度, 元の行番号) を返す
+
+        Returns:
+            sims: (n, k) float32。候補が k 件未満なら -inf で埋める
+            ids:  (n, k) int64。候補が k 件未満なら -1 で埋める
+        """
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        n = queries.shape[0]
+        sims = np.full((n, k), -np.inf, dtype=np.float32)
+        ids = np.full((n, k), -1, dtype=np.int64)
+
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, self.nprobe - 1, axis=1)[:, :self.nprobe]
+        for qi in range(n):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1])
+                                   for c in probes[qi]])
+            if rows.size == 0:
+                continue
+            cand = self.vectors[rows] @ queries[qi]
+            top = min(k, rows.size)
+            best = np.argpartition(-cand, top - 1)[:top]
+            best = best[np.argsort(-cand[best])]
+            sims[qi, :top] = cand[best]
+            ids[qi, :top] = self.ids[rows[best]]
+        return sims, ids
+
+
+class TargetIndex:
+    """1 コンテスト分のターゲットベクトルと、スコア計算用の前計算"""
+
+    def __init__(self, vectors, brute_force_max=BRUTE_FORCE_MAX, nlist=None, nprobe=8):
+        self.vectors = (vectors if isinstance(vectors, QuantizedMatrix)
+                        else np.asarray(vectors, dtype=np.float32))
+        dense = np.asarray(self.vectors, dtype=np.float32)
+        self.centroid = (dense.mean(axis=0) if len(dense)
+                         else np.zeros(dense.shape[1], dtype=np.float32))
+        self.ivf = None
+        if dense.shape[0] > brute_force_max:
+            self.ivf = IVFIndex(dense, nlist=nlist, nprobe=nprobe)
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def mean_score(self, face_embs):
+        """全ペアの類似度平均（= 顔の平均ベクトルと重心の内積）"""
+        return float(face_embs.mean(axis=0) @ self.centroid)
+
+    def max_per_face(self, face_embs):
+        """各顔について、最も似ているターゲットとの類似度"""
+        if self.ivf is not None:
+            return self.ivf.search(face_embs, k=1)[0][:, 0]
+        return similarity(face_embs, self.vectors).max(axis=1)
+
+    def max_score(self, face_embs, alpha):
+        """顔ごとの最大類似度の合計 / 顔の数^α（functions_bkp の calculate_scores と同じ式）"""
+        n_faces = face_embs.shape[0]
+        return float(self.max_per_face(face_embs).sum() / (n_faces ** alpha))
+
+    def topk(self, face_embs, k):
+        """各顔の上位 k 件の (類似度, ターゲットの行番号)"""
+        if self.ivf is not None:
+            return self.ivf.search(face_embs, k=k)
+        sims = similarity(face_embs, self.vectors)
+        k = min(k, sims.shape[1])
+        ids = np.argsort(-sims, axis=1)[:, :k]
+        return np.take_along_axis(sims, ids, axis=1), ids
+
+
+def build_indexes(target_sets, **kwargs):
+    """{contest_name: vectors} から {contest_name: TargetIndex} を作る"""
+    return {name: TargetIndex(vectors, **kwargs) for name, vectors in target_sets.items()}
+
+
+class FusedTargets:
+    """全コンテストのターゲットを 1 つの行列にまとめたもの
+
+    写真 1 枚あたりの類似度計算を、コンテストごとの小さな行列積のループではなく
+    (n_faces, 512) @ (512, M) の 1 回の GEMM にし、コンテストごとの集計は
+    offsets を使った np.maximum.reduceat で行う。平均スコアは重心を並べた
+    (n_contests, 512) 行列との 1 回の積で求める。
+
+    IVF を持つ大きなコンテスト（TargetIndex.ivf）は行列に含めず、個別に近似検索する。
+    ターゲットが 0 件のコンテストは reduceat で扱えないので除外する。
+    全コンテストが同じ型で量子化されていれば、まとめた行列も量子化したまま持つ。
+    """
+
+    def __init__(self, indexes):
+        indexes = {name: idx for name, idx in indexes.items() if len(idx)}
+        self.names = list(indexes)
+        self.centroids = (np.stack([idx.centroid for idx in indexes.values()])
+                          if indexes else np.zeros((0, 512), dtype=np.float32))
+
+        col = {name: i for i, name in enumerate(self.names)}
+        self._large = [(col[name], idx) for name, idx in indexes.items() if idx.ivf is not None]
+        fused = [(name, idx) for name, idx in indexes.items() if idx.ivf is None]
+        self.fused_names = [name for name, _ in fused]
+        self._fused_cols = [col[name] for name in self.fused_names]
+        counts = np.array([len(idx) for _, idx in fused], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        parts = [idx.vectors for _, idx in fused]
+        if parts and all(isinstance(p, QuantizedMatrix) for p in parts) \
+                and len({p.dtype for p in parts}) == 1:
+            self.matrix = QuantizedMatrix.concatenate(parts)
+        elif parts:
+            self.matrix = np.ascontiguousarray(
+                np.concatenate([np.asarray(p, dtype=np.float32) for p in parts]))
+        else:
+            self.matrix = np.zeros((0, 512), dtype=np.float32)
+
+    def mean_scores(self, face_embs):
+        """{contest_name: 全ペアの類似度平均}"""
+        if not self.names:
+            return {}
+        values = self.centroids @ face_embs.mean(axis=0)
+        return dict(zip(self.names, values.tolist()))
+
+    def max_per_face(self, face_embs):
+        """(n_faces, n_contests) の各コンテストでの最大類似度（列は self.names の順）"""
+        result = np.empty((face_embs.shape[0], len(self.names)), dtype=np.float32)
+        if self.fused_names:
+            sims = similarity(face_embs, self.matrix)              # (n_faces, M)
+            result[:, self._fused_cols] = np.maximum.reduceat(sims, self.offsets, axis=1)
+        for col, idx in self._large:
+            result[:, col] = idx.max_per_face(face_embs)
+        return result
+
+    def max_scores(self, face_embs, alpha):
+        """{contest_name: 顔ごとの最大類似度の合計 / 顔の数^α}"""
+        if not self.names:
+            return {}
+        values = self.max_per_face(face_embs).sum(axis=0) / (face_embs.shape[0] ** alpha)
+        return dict(zip(self.names, values.tolist()))
+
+    def mean_scores_many(self, face_embs, offsets):
+        """複数の写真の平均スコアを 1 回の積で計算する
+
+        Args:
+            face_embs: 全写真の顔を縦に並べた (n_faces, 512)
+            offsets: 各写真の先頭行（np.add.reduceat と同じ形式。顔が 0 の写真は含めない）
+        Returns:
+            (n_photos, n_contests)。列は self.names の順
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if not offsets.size:
+            return np.zeros((0, len(self.names)), dtype=np.float32)
+        counts = np.diff(np.append(offsets, face_embs.shape[0]))
+        photo_means = np.add.reduceat(face_embs, offsets, axis=0) / counts[:, None]
+        return photo_means @ self.centroids.T
+
+    def max_scores_many(self, face_embs, offsets, alpha, chunk=4096):
+        """複数の写真の最大値スコア（顔ごとの最大類似度の合計 / 顔の数^α）
+
+        (n_faces, M) の類似度行列が大きくなりすぎないよう、顔を chunk 行ずつ処理する。
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if not offsets.size:
+            return np.zeros((0, len(self.names)), dtype=np.float32)
+        counts = np.diff(np.append(offsets, face_embs.shape[0]))
+        per_face = np.concatenate([self.max_per_face(face_embs[i:i + chunk])
+                                   for i in range(0, face_embs.shape[0], chunk)])
+        return np.add.reduceat(per_face, offsets, axis=0) / (counts[:, None] ** alpha)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+処理フェーズごとの所要時間の計測
+
+    timer = PhaseTimer()
+    with timer.phase("download"):
+        ...
+    timer.count("downloadBytes", size)
+    logger.info("scored", **timer.fields())   # download_ms=... などの構造化フィールド
+"""
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class PhaseTimer:
+    """フェーズ名ごとに経過時間（ミリ秒）を積算する
+
+    複数スレッドから同じフェーズを記録した場合は各スレッドの時間の合計になる。
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - t0) * 1000)
+
+    def add(self, name, ms):
+        """計測済みの時間（ミリ秒）をフェーズに加算する"""
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    def count(self, name, value=1):
+        """カウンタ（ダウンロードしたバイト数など）に加算する"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def total_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def fields(self):
+        """ログの構造化フィールド用の辞書（{"download_ms": 12.3, ..., "total_ms": ...}）
+
+        count() したカウンタもそのままの名前で含める。
+        """
+        fields = {f"{name}_ms": round(ms, 1) for name, ms in self.durations.items()}
+        fields.update(self.counters)
+        fields["total_ms"] = round(self.total_ms(), 1)
+        return fields
+
+
+class _NullTimer:
+    """計測しない場合のタイマー"""
+
+    def phase(self, name):
+        return nullcontext()
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_TIMER = _NullTimer()
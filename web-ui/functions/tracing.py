@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+score_image の段ごとのスパン・カウンタの記録と、メトリクスの書き出し
+
+timing.PhaseTimer のフェーズ（download / decode / queue / detect / embed / score / write ...）を
+開始時刻つきのスパンとして記録する Trace と、プロセス内で集計する Metrics からなる。
+
+    trace = TRACER.start("score_image")     # PhaseTimer の代わりに各段へ渡す
+    with trace.phase("download"):
+        ...
+    trace.count("faceCount", 3)
+    logger.info("Saved scores", **TRACER.finish(trace))
+
+finish() は従来の fields()（*_ms とカウンタ）に "trace"（スパンの一覧・カウンタ・
+cold / warm）を加えた辞書を返す。firebase_functions.logger に渡すと、そのまま
+Cloud Logging の jsonPayload になる。集計したメトリクスは Prometheus のテキスト形式
+（または OpenMetrics）で render() / dump() できる（ローカルのベンチマーク用。環境変数
+TRACE_METRICS_FILE を指定するとプロセスの終了時に書き出す）。
+
+TRACING=0 なら start() は素の PhaseTimer を返し、finish() は fields() を返すだけなので、
+コストは従来の PhaseTimer と変わらない。
+"""
+
+import atexit
+import bisect
+import os
+import re
+import threading
+import time
+
+from timing import PhaseTimer
+
+PREFIX = "photo_contest_"
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 秒
+FACE_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+FORMATS = ("prometheus", "openmetrics")
+
+
+class Trace(PhaseTimer):
+    """1 回の呼び出しのスパン（開始時刻と所要時間）とカウンタ
+
+    invocation はインスタンスで最初の呼び出しなら "cold"、以降は "warm"。
+    """
+
+    def __init__(self, name, invocation="warm"):
+        super().__init__()
+        self.name = name
+        self.invocation = invocation
+        self.spans = []   # [(開始 ms, 名前, 所要 ms)]
+
+    def add(self, name, ms):
+        end = (time.perf_counter() - self._start) * 1000
+        super().add(name, ms)
+        with self._lock:
+            self.spans.append((end - ms, name, ms))
+
+    def payload(self):
+        """jsonPayload の "trace" フィールド（スパンは開始時刻の順）"""
+        with self._lock:
+            spans = sorted(self.spans)
+            counters = dict(self.counters)
+        return {
+            "name": self.name,
+            "invocation": self.invocation,
+            "spans": [{"name": name, "startMs": round(start, 1), "durationMs": round(ms, 1)}
+                      for start, name, ms in spans],
+            "counters": counters,
+        }
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for le, n in zip([*map(_format_value, self.buckets), "+Inf"], self.counts):
+            cumulative += n
+            yield f"{name}_bucket", {**labels, "le": le}, cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _snake(name):
+    """downloadBytes → download_bytes"""
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name).lower()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+class Metrics:
+    """Trace をプロセス内で集計する（スレッドセーフ）
+
+        stage_seconds       : 段ごとの所要時間のヒストグラム（"total" は呼び出し全体）
+        faces_per_image     : 1 枚あたりの顔の数のヒストグラム（カウンタ faceCount）
+        invocations_total   : cold / warm ごとの呼び出し回数
+        <カウンタ名>_total   : Trace のカウンタの合計（download_bytes_total など）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}        # {(function, stage): _Histogram}
+        self.faces = {}         # {function: _Histogram}
+        self.invocations = {}   # {(function, "cold" | "warm"): 回数}
+        self.counters = {}      # {(function, カウンタ名): 合計}
+
+    def record(self, trace):
+        total = trace.total_ms()
+        with trace._lock:
+            durations = dict(trace.durations)
+            counters = dict(trace.counters)
+        with self._lock:
+            key = (trace.name, trace.invocation)
+            self.invocations[key] = self.invocations.get(key, 0) + 1
+            for stage, ms in [*durations.items(), ("total", total)]:
+                hist = self.stages.get((trace.name, stage))
+                if hist is None:
+                    hist = self.stages[(trace.name, stage)] = _Histogram(STAGE_BUCKETS)
+                hist.observe(ms / 1000)
+            for name, value in counters.items():
+                self.counters[(trace.name, name)] = self.counters.get((trace.name, name), 0) + value
+            if "faceCount" in counters:
+                hist = self.faces.setdefault(trace.name, _Histogram(FACE_BUCKETS))
+                hist.observe(counters["faceCount"])
+
+    def render(self, fmt="prometheus"):
+        """Prometheus のテキスト形式（fmt="openmetrics" なら OpenMetrics）の文字列"""
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown metrics format: {fmt} (choose from {FORMATS})")
+        families = []   # [(名前, 型, 説明, [(サンプル名, ラベル, 値)])]
+        with self._lock:
+            families.append(("stage_seconds", "histogram", "段ごとの所要時間（秒）", [
+                sample for (function, stage), hist in sorted(self.stages.items())
+                for sample in hist.samples(f"{PREFIX}stage_seconds",
+                                           {"function": function, "stage": stage})]))
+            families.append(("faces_per_image", "histogram", "1 枚あたりの顔の数", [
+                sample for function, hist in sorted(self.faces.items())
+                for sample in hist.samples(f"{PREFIX}faces_per_image", {"function": function})]))
+            families.append(("invocations", "counter", "呼び出し回数（cold / warm）", [
+                (f"{PREFIX}invocations_total", {"function": function, "start": start}, n)
+                for (function, start), n in sorted(self.invocations.items())]))
+            by_name = {}
+            for (function, name), value in sorted(self.counters.items()):
+                by_name.setdefault(_snake(name), []).append(
+                    (f"{PREFIX}{_snake(name)}_total", {"function": function}, value))
+            families.extend((name, "counter", f"カウンタ {name} の合計", samples)
+                            for name, samples in sorted(by_name.items()))
+
+        lines = []
+        for name, kind, help_text, samples in families:
+            if not samples:
+                continue
+            # OpenMetrics ではカウンタのファミリー名に _total を付けない
+            family = f"{PREFIX}{name}" if fmt == "openmetrics" or kind != "counter" \
+                else f"{PREFIX}{name}_total"
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            lines.extend(f"{sample}{_labels(labels)} {_format_value(value)}"
+                         for sample, labels, value in samples)
+        if fmt == "openmetrics":
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """呼び出しごとの Trace を作り、終わったらメトリクスに集計する
+
+    enabled=False なら start() は PhaseTimer を返し、何も集計しない。
+    add_sink(fn) で登録した関数は finish() のたびに Trace を受け取る（ベンチマーク用）。
+    """
+
+    def __init__(self, enabled=True, metrics=None):
+        self.enabled = enabled
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._sinks = []
+        self._invoked = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """環境変数 TRACING（"0" / "false" / "off" で無効）と TRACE_METRICS_FILE から作る"""
+        environ = os.environ if environ is None else environ
+        tracer = cls(enabled=environ.get("TRACING", "1").lower() not in ("0", "false", "off"))
+        path = environ.get("TRACE_METRICS_FILE")
+        if tracer.enabled and path:
+            atexit.register(tracer.dump, path)
+        return tracer
+
+    def add_sink(self, fn):
+        self._sinks.append(fn)
+
+    def start(self, name):
+        if not self.enabled:
+            return PhaseTimer()
+        with self._lock:
+            invocation = "warm" if self._invoked else "cold"
+            self._invoked = True
+        return Trace(name, invocation)
+
+    def finish(self, trace):
+        """ログの構造化フィールド（fields() + "trace"）を返し、メトリクスに集計する"""
+        fields = trace.fields()
+        if not isinstance(trace, Trace):
+            return fields
+        self.metrics.record(trace)
+        for sink in self._sinks:
+            sink(trace)
+        fields["trace"] = trace.payload()
+        return fields
+
+    def render(self, fmt="prometheus"):
+        return self.metrics.render(fmt)
+
+    def dump(self, path, fmt=None):
+        """メトリクスを path に書き出す（拡張子が .om / .openmetrics なら OpenMetrics）"""
+        if fmt is None:
+            fmt = "openmetrics" if str(path).endswith((".om", ".openmetrics")) else "prometheus"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.render(fmt))
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+ターゲットベクトルのコンパイル済みバイナリ形式（.vec）の読み書き
+
+contest_vectors_*.json は整形済み JSON の float 配列で、コールドスタートのたびに
+json.load と正規化が走る。.vec は正規化済み float32 行列をそのまま並べた形式で、
+np.memmap で読むだけで使える。ターゲットが多い場合は float16 / int8 に量子化して
+保存することもできる（quantize.QuantizedMatrix として読み込まれる）。
+
+ファイル構成:
+    <name>.vec        ヘッダ（HEADER_SIZE バイト）+ データ部
+                        float32: float32 リトルエンディアン (rows, dim)
+                        float16: float16 リトルエンディアン (rows, dim)
+                        int8   : 行ごとのスケール float32 (rows,) + int8 (rows, dim)
+    <name>.meta.json  face_info などのメタデータ（サイドカー）
+"""
+
+import hashlib
+import json
+import logging
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from quantize import QuantizedMatrix, quantize_rows
+
+MAGIC = b"WPCVEC01"
+HEADER_SIZE = 128
+NAME_SIZE = 64
+VEC_SUFFIX = ".vec"
+META_SUFFIX = ".meta.json"
+DTYPE = np.dtype("<f4")
+
+# magic, dim, rows, crc32(データ部), name(UTF-8, NUL 埋め), データ型
+# （データ型を追加する前のファイルはこの位置が 0 埋めなので float32 として読める）
+_HEADER = struct.Struct(f"<8sIII{NAME_SIZE}sI")
+_DTYPE_CODES = {"float32": 0, "float16": 1, "int8": 2}
+_DTYPE_NAMES = {code: name for name, code in _DTYPE_CODES.items()}
+
+
+class VectorStoreError(ValueError):
+    """.vec ファイルが壊れている・形式が違う場合の例外"""
+
+
+def normalize_rows(vectors):
+    """行ごとに L2 正規化した float32 の (m, dim) 配列を返す"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2:
+        raise VectorStoreError(f"2次元配列が必要です: shape={vectors.shape}")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _file_sha256(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def read_json_vectors(json_path):
+    """contest_vectors_*.json を読み込み (vectors, face_info) を返す
+
+    {"vectors": [...], "face_info": [...]} 形式と、ベクトルのみの旧形式の両方に対応。
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "vectors" in data:
+        return np.asarray(data["vectors"]), data.get("face_info")
+    return np.asarray(data), None
+
+
+def write_vector_store(vec_path, name, vectors, face_info=None, source_sha256=None,
+                       dtype="float32"):
+    """正規化した行列を .vec とサイドカー .meta.json に書き出す
+
+    dtype は "float32"（既定）/ "float16" / "int8"（行ごとのスケール付き）。
+    """
+    vec_path = Path(vec_path)
+    if dtype not in _DTYPE_CODES:
+        raise VectorStoreError(f"未対応のデータ型です: {dtype}")
+    data, scales = quantize_rows(normalize_rows(vectors), dtype)
+    rows, dim = data.shape
+    payload = (b"" if scales is None else scales.astype("<f4").tobytes()) \
+        + data.astype(data.dtype.newbyteorder("<")).tobytes()
+
+    encoded_name = name.encode("utf-8")
+    if len(encoded_name) > NAME_SIZE:
+        raise VectorStoreError(f"名前が長すぎます（{NAME_SIZE}バイトまで）: {name}")
+
+    header = _HEADER.pack(MAGIC, dim, rows, zlib.crc32(payload), encoded_name,
+                          _DTYPE_CODES[dtype])
+    header = header.ljust(HEADER_SIZE, b"\0")
+
+    tmp_path = vec_path.with_name(vec_path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(header)
+        f.write(payload)
+    tmp_path.replace(vec_path)
+
+    meta = {
+        "name": name,
+        "dim": dim,
+        "rows": rows,
+        "dtype": dtype,
+        "source_sha256": source_sha256,
+        "face_info": face_info,
+    }
+    meta_path = vec_path.with_name(vec_path.stem + META_SUFFIX)
+    with meta_path.open("w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return vec_path
+
+
+def compile_json(json_path, vec_path=None, dtype="float32"):
+    """contest_vectors_*.json を同じディレクトリの .vec にコンパイルする"""
+    json_path = Path(json_path)
+    vec_path = Path(vec_path) if vec_path else json_path.with_suffix(VEC_SUFFIX)
+    vectors, face_info = read_json_vectors(json_path)
+    return write_vector_store(
+        vec_path, json_path.stem, vectors,
+        face_info=face_info, source_sha256=_file_sha256(json_path), dtype=dtype,
+    )
+
+
+def read_header(vec_path):
+    """ヘッダを読み (name, dim, rows, crc32, dtype) を返す"""
+    with open(vec_path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise VectorStoreError(f"ヘッダが短すぎます: {vec_path}")
+    magic, dim, rows, crc, name, code = _HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        raise VectorStoreError(f"マジックナンバーが一致しません: {vec_path}")
+    if code not in _DTYPE_NAMES:
+        raise VectorStoreError(f"未対応のデータ型です: {vec_path} (code={code})")
+    return name.rstrip(b"\0").decode("utf-8"), dim, rows, crc, _DTYPE_NAMES[code]
+
+
+def load_vector_store(vec_path, verify=True):
+    """.vec を np.memmap で読み込み (name, vectors) を返す
+
+    vectors は読み取り専用の (rows, dim) 行列（正規化済み）。float32 のファイルは
+    float32 の配列、float16 / int8 のファイルは quantize.QuantizedMatrix。
+    verify=True ならデータ部の CRC32 を検証する。
+    """
+    vec_path = Path(vec_path)
+    name, dim, rows, crc, dtype = read_header(vec_path)
+    item = np.dtype("<" + {"float32": "f4", "float16": "f2", "int8": "i1"}[dtype])
+    scale_bytes = rows * 4 if dtype == "int8" else 0
+    expected = HEADER_SIZE + scale_bytes + rows * dim * item.itemsize
+    actual = vec_path.stat().st_size
+    if actual != expected:
+        raise VectorStoreError(
+            f"ファイルサイズが一致しません: {vec_path} ({actual} != {expected})"
+        )
+    if rows == 0:
+        return name, np.zeros((0, dim), dtype=DTYPE)
+
+    payload = np.memmap(vec_path, dtype=np.uint8, mode="r", offset=HEADER_SIZE)
+    if verify and zlib.crc32(memoryview(payload)) != crc:
+        raise VectorStoreError(f"チェックサムが一致しません: {vec_path}")
+    data = payload[scale_bytes:].view(item).reshape(rows, dim)
+    if dtype == "float32":
+        return name, data
+    scales = payload[:scale_bytes].view("<f4") if scale_bytes else None
+    return name, QuantizedMatrix(data, scales)
+
+
+def load_meta(vec_path):
+    """サイドカー .meta.json を読み込む（無ければ None）"""
+    meta_path = Path(vec_path).with_name(Path(vec_path).stem + META_SUFFIX)
+    if not meta_path.exists():
+        return None
+    with meta_path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _is_stale(vec_path, json_path):
+    """JSON 側が更新されていてコンパイル済みファイルが古いかどうか"""
+    if not json_path.exists():
+        return False
+    meta = load_meta(vec_path)
+    if not meta or not meta.get("source_sha256"):
+        return False
+    return meta["source_sha256"] != _file_sha256(json_path)
+
+
+def load_vector_sets(vec_dir, pattern="contest_vectors_*"):
+    """ディレクトリ内のターゲットベクトルをすべて読み込む
+
+    .vec があればそれを memmap で読み、無い（または JSON より古い）場合は
+    JSON を読んで正規化する。
+
+    Returns:
+        dict: {contest_name: (m, dim) float32 ndarray または QuantizedMatrix}
+    """
+    vec_dir = Path(vec_dir)
+    stems = sorted(
+        {p.stem for p in vec_dir.glob(pattern + VEC_SUFFIX)}
+        | {p.stem for p in vec_dir.glob(pattern + ".json")
+           if not p.name.endswith(META_SUFFIX)}
+    )
+
+    target_sets = {}
+    for stem in stems:
+        vec_path = vec_dir / (stem + VEC_SUFFIX)
+        json_path = vec_dir / (stem + ".json")
+        try:
+            if vec_path.exists() and not _is_stale(vec_path, json_path):
+                _, vectors = load_vector_store(vec_path)
+                logging.info("Loaded %s (%d vec, compiled)", vec_path.name, vectors.shape[0])
+            else:
+                if vec_path.exists():
+                    logging.warning("%s is older than %s; falling back to JSON",
+                                    vec_path.name, json_path.name)
+                raw, _ = read_json_vectors(json_path)
+                vectors = normalize_rows(raw)
+                logging.info("Loaded %s (%d vec)", json_path.name, vectors.shape[0])
+            target_sets[stem] = vectors
+        except Exception as e:
+            logging.error("Fail load %s: %s", stem, e)
+    return target_sets
+
+
+def fingerprint(target_sets):
+    """ターゲットベクトル一式のバージョン（名前と中身の SHA-256 の先頭 16 桁）"""
+    h = hashlib.sha256()
+    for name in sorted(target_sets):
+        vectors = np.ascontiguousarray(target_sets[name], dtype=DTYPE)
+        h.update(name.encode("utf-8"))
+        h.update(struct.pack("<II", *vectors.shape))
+        h.update(vectors.tobytes())
+    return h.hexdigest()[:16]
@@ -9,36 +9,39 @@ import { ref, getDownloadURL } from 'firebase/storage';
 import { db, storage } from '../firebase';
 import InfoIcon from '@mui/icons-material/Info';
 
-const COLLECTION = 'contestScores';
+// score_image が更新するコンテストごとの集計（web-ui/functions/leaderboard.py）
+const COLLECTION = 'leaderboards';
 
 export default function AdminRanking() {
-  const [rows,    setRows]    = useState([]);
-  const [targets, setTargets] = useState([]);
+  const [boards,  setBoards]  = useState([]);
   const [selIdx,  setSelIdx]  = useState(0);
   const [loading, setLoading] = useState(true);
   const [error,   setError]   = useState(null);
 
-  /* -------- 全ドキュメント取得 -------- */
+  /* -------- コンテストごとの集計ドキュメント取得 -------- */
   useEffect(() => {
     (async () => {
       try {
-        const snap     = await getDocs(collection(db, COLLECTION));
-        const tasks    = [];
-        const tSet     = new Set();
+        const snap = await getDocs(collection(db, COLLECTION));
+        const data = snap.docs
+          .map(d => d.data())
+          .sort((a, b) => a.contest.localeCompare(b.contest));   // タブを名前順
 
-        snap.forEach(d => {
-          const data = d.data();
-          Object.keys(data.scores || {}).forEach(k => tSet.add(k));
-
-          tasks.push(
-            getDownloadURL(ref(storage, data.path))
+        // 同じ写真の URL は 1 回だけ取得する
+        const paths = new Set();
+        data.forEach(b => (b.top || []).forEach(r => paths.add(r.path)));
+        const urls = Object.fromEntries(await Promise.all(
+          [...paths].map(p =>
+            getDownloadURL(ref(storage, p))
               .catch(() => '')
-              .then(url => ({ id: d.id, ...data, imgUrl: url }))
-          );
-        });
+              .then(url => [p, url])
+          )
+        ));
 
-        setTargets(Array.from(tSet).sort());      // タブを名前順
-        setRows(await Promise.all(tasks));
+        setBoards(data.map(b => ({
+          contest: b.contest,
+          rows: (b.top || []).map(r => ({ ...r, imgUrl: urls[r.path] ?? '' }))
+        })));
       } catch (e) {
         console.error(e);
         setError('データ取得に失敗しました');
@@ -48,13 +51,8 @@ export default function AdminRanking() {
     })();
   }, []);
 
-  /* -------- 並べ替え（選択タブのスコア降順） -------- */
-  const sortedRows = () => {
-    const key = targets[selIdx] ?? '';
-    return [...rows].sort(
-      (a, b) => (b.scores?.[key] ?? -Infinity) - (a.scores?.[key] ?? -Infinity)
-    );
-  };
+  /* -------- 選択タブの上位（集計時にスコア降順に並んでいる） -------- */
+  const sortedRows = () => boards[selIdx]?.rows ?? [];
 
   /* -------- UI -------- */
   if (loading) return <Center><CircularProgress/></Center>;
@@ -67,7 +65,7 @@ export default function AdminRanking() {
       </Typography>
 
       {/* ターゲット選択タブ */}
-      {targets.length > 0 && (
+      {boards.length > 0 && (
         <Tabs
           value={selIdx}
           onChange={(_, v) => setSelIdx(v)}
@@ -75,7 +73,7 @@ export default function AdminRanking() {
           scrollButtons="auto"
           sx={{ mb: 2 }}
         >
-          {targets.map(t => <Tab key={t} label={t} />)}
+          {boards.map(b => <Tab key={b.contest} label={b.contest} />)}
         </Tabs>
       )}
 
@@ -110,7 +108,7 @@ export default function AdminRanking() {
               <TableCell>{r.userName}</TableCell>
               <TableCell>{r.faceCount}</TableCell>
               <TableCell align="right">
-                {(r.scores?.[targets[selIdx]] ?? 0).toFixed(4)}
+                {(r.score ?? 0).toFixed(4)}
               </TableCell>
             </TableRow>
           ))}
@@ -12,8 +12,9 @@ import {
   IconButton
 } from '@mui/material';
 import { ref, uploadBytesResumable, getDownloadURL } from 'firebase/storage';
-import { collection, addDoc, serverTimestamp } from 'firebase/firestore';
-import { storage, db } from '../firebase';
+import { doc, setDoc, deleteDoc, serverTimestamp } from 'firebase/firestore';
+import { storage, db, ensureSignedIn } from '../firebase';
+import { photoDocId } from '../photoId';
 import { v4 as uuidv4 } from 'uuid';
 import HelpOutlineIcon from '@mui/icons-material/HelpOutline';
 
@@ -81,7 +82,25 @@ const ImageUpload = () => {
     try {
       // 一意のファイル名を生成
       const fileName = `${uuidv4()}.${fileExtension}`;
-      const storageRef = ref(storage, `wedding-photos/${fileName}`);
+      const storagePath = `wedding-photos/${fileName}`;
+      const storageRef = ref(storage, storagePath);
+
+      // 投稿者の uid。セキュリティルールは本人のドキュメントだけ更新・削除を許す
+      const user = await ensureSignedIn();
+
+      // ドキュメント ID はパスから決まる（Cloud Functions も同じ ID に直接書き込む）。
+      // 関数が先に結果を書き込んでも上書きしないよう、メタデータはアップロード前に保存する
+      const photoRef = doc(db, 'photos', photoDocId(storagePath));
+      await setDoc(photoRef, {
+        userId: user.uid,
+        userName: userName,
+        fileName: fileName,
+        storagePath: storagePath,
+        timestamp: serverTimestamp(),
+        score: 0, // スコアは初期値0、Cloud Functionsで計算後に更新される
+        faceCount: 0,
+        processed: false // 処理状態のフラグ
+      });
 
       // アップロードタスクを作成
       const uploadTask = uploadBytesResumable(storageRef, file, {
@@ -100,6 +119,7 @@ const ImageUpload = () => {
         },
         (error) => {
           console.error('アップロードエラー:', error);
+          deleteDoc(photoRef).catch(() => {});
           setAlert({
             open: true,
             message: 'アップロード中にエラーが発生しました',
@@ -111,16 +131,8 @@ const ImageUpload = () => {
           // アップロード完了
           const downloadURL = await getDownloadURL(uploadTask.snapshot.ref);
           
-          // Firestoreにメタデータを保存
-          await addDoc(collection(db, 'photos'), {
-            userName: userName,
-            photoUrl: downloadURL,
-            fileName: fileName,
-            timestamp: serverTimestamp(),
-            score: 0, // スコアは初期値0、Cloud Functionsで計算後に更新される
-            faceCount: 0,
-            processed: false // 処理状態のフラグ
-          });
+          // ダウンロード URL を追加（スコアなどのフィールドはそのまま）
+          await setDoc(photoRef, { photoUrl: downloadURL }, { merge: true });
 
           // フォームをリセット
           setUserName('');
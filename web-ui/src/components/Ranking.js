@@ -10,46 +10,45 @@ import { db, storage } from '../firebase';
 import PhotoIcon from '@mui/icons-material/Photo';
 import InfoIcon from '@mui/icons-material/Info';
 
-const COLLECTION = 'contestScores';
+// score_image が更新するコンテストごとの集計（web-ui/functions/leaderboard.py）
+const COLLECTION = 'leaderboards';
 
 export default function Ranking() {
-  const [entries, setEntries]         = useState([]);
-  const [targetTypes, setTargetTypes] = useState([]);
+  const [boards, setBoards]           = useState([]);
   const [selected, setSelected]       = useState(0);
   const [loading, setLoading]         = useState(true);
   const [error, setError]             = useState(null);
 
-  /* ------------- Firestore 取得 ------------- */
+  /* ------------- Firestore 取得（コンテストごとの集計ドキュメントだけ） ------------- */
   useEffect(() => {
     (async () => {
       try {
         const snap = await getDocs(collection(db, COLLECTION));
-        const promises   = [];
-        const targetsSet = new Set();
-
-        snap.forEach(doc => {
-          const data = doc.data();
-          const scores = data.scores || {};
-          Object.keys(scores).forEach(k => targetsSet.add(k));
-
-          promises.push(
-            getDownloadURL(ref(storage, data.path))
+        const data = snap.docs
+          .map(d => d.data())
+          .sort((a, b) => a.contest.localeCompare(b.contest));
+
+        // 同じ写真の URL は 1 回だけ取得する
+        const paths = new Set();
+        data.forEach(b => (b.users || []).forEach(e => paths.add(e.path)));
+        const urls = Object.fromEntries(await Promise.all(
+          [...paths].map(p =>
+            getDownloadURL(ref(storage, p))
               .catch(() => '')
-              .then(url => ({
-                id: doc.id,
-                userName: data.userName ?? '(名無し)',
-                imgUrl: url,
-                faceCnt: data.faceCount ?? 0,
-                scores
-              }))
-          );
-        });
-
-        const docs = await Promise.all(promises);
-        docs.sort((a, b) => a.userName.localeCompare(b.userName, 'ja'));
-
-        setTargetTypes(Array.from(targetsSet));
-        setEntries(docs);
+              .then(url => [p, url])
+          )
+        ));
+
+        setBoards(data.map(b => ({
+          contest: b.contest,
+          users: (b.users || []).map(e => ({
+            id: e.id,
+            userName: e.userName ?? '(名無し)',
+            imgUrl: urls[e.path] ?? '',
+            faceCnt: e.faceCount ?? 0,
+            score: e.score
+          }))
+        })));
       } catch (e) {
         console.error(e);
         setError('ランキングデータの取得に失敗しました');
@@ -63,19 +62,8 @@ export default function Ranking() {
   const inflate = s => (s * 100).toFixed(1);
 
   const sortedEntries = () => {
-    const key = targetTypes[selected] ?? '';
-
-    // スコア降順 → 同名 1 件 → Top5 を名前順
-    const base = [...entries].sort(
-      (a, b) => (b.scores[key] ?? -Infinity) - (a.scores[key] ?? -Infinity)
-    );
-
-    const seen = new Set();
-    const uniq = base.filter(e => {
-      if (seen.has(e.userName)) return false;
-      seen.add(e.userName);
-      return true;
-    });
+    // users はユーザーごとのベスト 1 枚をスコア降順に並べたもの → Top5 を名前順
+    const uniq = boards[selected]?.users ?? [];
 
     const top5   = uniq.slice(0, 5).sort((a, b) =>
       a.userName.localeCompare(b.userName, 'ja')
@@ -97,7 +85,7 @@ export default function Ranking() {
         フォトコンテスト ランキング
       </Typography>
 
-      {targetTypes.length > 0 && (
+      {boards.length > 0 && (
         <Tabs
           value={selected}
           onChange={(_, v) => setSelected(v)}
@@ -105,11 +93,11 @@ export default function Ranking() {
           scrollButtons="auto"
           sx={{ mb: 2 }}
         >
-          {targetTypes.map(t => <Tab key={t} label={t} />)}
+          {boards.map(b => <Tab key={b.contest} label={b.contest} />)}
         </Tabs>
       )}
 
-      {entries.length === 0 ? (
+      {boards.length === 0 ? (
         <Center>まだ投稿がありません</Center>
       ) : (
         <List>
@@ -126,7 +114,7 @@ export default function Ranking() {
                     <>
                       スコア: {idx < 5
                         ? '???'
-                        : inflate(e.scores[targetTypes[selected]] || 0)} 点
+                        : inflate(e.score || 0)} 点
                       <Tooltip title="スコアは顔類似度を元に算出">
                         <InfoIcon
                           fontSize="small"
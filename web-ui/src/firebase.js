@@ -2,6 +2,7 @@ import { initializeApp } from "firebase/app";
 import { getStorage, connectStorageEmulator } from "firebase/storage";
 import { getFirestore, connectFirestoreEmulator } from "firebase/firestore";
 import { getFunctions, connectFunctionsEmulator } from "firebase/functions";
+import { getAuth, connectAuthEmulator, signInAnonymously } from "firebase/auth";
 
 // Firebaseの設定
 const firebaseConfig = {
@@ -26,6 +27,19 @@ export const storage = getStorage(app);
 // Cloud Functionsの初期化
 export const functions = getFunctions(app);
 
+// Authenticationの初期化（投稿者の識別用。ログイン画面は出さず匿名ログインする）
+export const auth = getAuth(app);
+
+// 匿名ログインしたユーザーを返す（ログイン済みならそのまま）
+// photos ドキュメントの userId に uid を入れ、セキュリティルールで本人確認に使う
+export const ensureSignedIn = async () => {
+  if (auth.currentUser) {
+    return auth.currentUser;
+  }
+  const credential = await signInAnonymously(auth);
+  return credential.user;
+};
+
 // ローカル開発環境の場合、エミュレーターに接続
 if (process.env.NODE_ENV === 'development') {
   try {
@@ -40,6 +54,10 @@ if (process.env.NODE_ENV === 'development') {
     // Functionsエミュレーターに接続
     connectFunctionsEmulator(functions, 'localhost', 5001);
     console.log("Functionsエミュレーターに接続しました");
+
+    // Authエミュレーターに接続
+    connectAuthEmulator(auth, 'http://localhost:9099');
+    console.log("Authエミュレーターに接続しました");
   } catch (error) {
     console.error("エミュレーター接続エラー:", error);
   }
@@ -0,0 +1,5 @@
+// Storage のパスから写真のドキュメント ID を決める
+// Cloud Functions 側（functions/photo_ids.py の photo_doc_id）と同じ規則なので、
+// photos / contestScores / faceEmbeddings の ID がアップロード時点で決まる
+//   wedding-photos/xxx.jpg → wedding-photos%2Fxxx.jpg
+export const photoDocId = (storagePath) => encodeURIComponent(storagePath);